@@ -1,8 +1,11 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from app.api.routers import auth, admin, professor, student
+from app.core import admission
 
 api_router = APIRouter()
 api_router.include_router(auth.router, tags=["login"])
 api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
 api_router.include_router(professor.router, prefix="/professor", tags=["professor"])
-api_router.include_router(student.router, prefix="/student", tags=["student"])
+api_router.include_router(
+    student.router, prefix="/student", tags=["student"], dependencies=[Depends(admission.admit)]
+)
@@ -1,24 +1,31 @@
 from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 from pydantic import ValidationError
 
 from app.core import security
 from app.core.config import settings
-from app.core.database import get_db
-from app import models
+from app.core.database import get_db, get_async_db
+from app.core import principal_cache
+from app.core.snapshot import snapshot as analytics_snapshot, STALENESS_HEADER
+from app import models, schemas
 from app.schemas import token as token_schema
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login" # We will define this endpoint
 )
 
-def get_current_user(
-    db: Session = Depends(get_db),
-    token: str = Depends(reusable_oauth2)
-) -> models.Admin | models.Professor:
+ROLE_MODELS = {
+    "admin": models.Admin,
+    "professor": models.Professor,
+    "student": models.Student,
+}
+
+def _decode_token(token: str) -> tuple[token_schema.TokenPayload, str, int]:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -36,23 +43,131 @@ def get_current_user(
     # Format: "role:id"
     try:
         role, user_id = token_data.sub.split(":")
+        user_id = int(user_id)
     except ValueError:
          raise HTTPException(status_code=403, detail="Invalid token subject format")
 
-    if role == "admin":
-        user = db.query(models.Admin).filter(models.Admin.id == int(user_id)).first()
-    elif role == "professor":
-        user = db.query(models.Professor).filter(models.Professor.id == int(user_id)).first()
-    elif role == "student":
-        user = db.query(models.Student).filter(models.Student.id == int(user_id)).first()
-    else:
+    if role not in ROLE_MODELS:
         raise HTTPException(status_code=403, detail="Invalid user role")
-        
+    return token_data, role, user_id
+
+def _snapshot(user) -> dict:
+    return {attr.key: getattr(user, attr.key) for attr in inspect(user).mapper.column_attrs}
+
+def _attach_cached(db: Session | AsyncSession, model, values: dict):
+    user = model(**values)
+    make_transient_to_detached(user)
+    db.add(user)
+    return user
+
+def _deleted(user) -> bool:
+    # Students soft-deleted by a roster sync keep their row but no longer authenticate
+    return user is None or getattr(user, "deleted_at", None) is not None
+
+def load_user(db: Session, role: str, user_id: int):
+    """
+    Returns the user's row attached to `db`. Served from the principal cache when
+    possible: the cached columns are re-attached as a persistent object, so
+    relationships still lazy-load through this session.
+    """
+    model = ROLE_MODELS[role]
+    values = principal_cache.cache.get(role, user_id)
+    if values is not None:
+        return None if values.get("deleted_at") else _attach_cached(db, model, values)
+
+    user = db.query(model).filter(model.id == user_id).first()
+    if user:
+        principal_cache.cache.put(role, user_id, _snapshot(user))
+    return None if _deleted(user) else user
+
+async def load_user_async(db: AsyncSession, role: str, user_id: int):
+    """load_user for AsyncSession callers. Relationships must be loaded explicitly."""
+    model = ROLE_MODELS[role]
+    values = principal_cache.cache.get(role, user_id)
+    if values is not None:
+        return None if values.get("deleted_at") else _attach_cached(db, model, values)
+
+    user = await db.get(model, user_id)
+    if user:
+        principal_cache.cache.put(role, user_id, _snapshot(user))
+    return None if _deleted(user) else user
+
+def get_analytics_db(response: Response) -> Generator:
+    """Read-only session for admin reports (see app.core.snapshot); sets the staleness header."""
+    db = analytics_snapshot.session()
+    response.headers[STALENESS_HEADER] = str(db.info["staleness_seconds"])
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_current_user(
+    db: Session = Depends(get_db),
+    token: str = Depends(reusable_oauth2)
+) -> models.Admin | models.Professor:
+    _, role, user_id = _decode_token(token)
+    user = load_user(db, role, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     return user
 
+async def load_student_principal(db: AsyncSession, student_id: int) -> Optional[schemas.student.StudentPrincipal]:
+    values = principal_cache.cache.get("student", student_id)
+    if values is None:
+        student = await db.get(models.Student, student_id)
+        if not student:
+            return None
+        values = _snapshot(student)
+        principal_cache.cache.put("student", student_id, values)
+    if values.get("deleted_at"):
+        return None
+    return schemas.student.StudentPrincipal.model_validate(values)
+
+async def get_current_student_principal(
+    db: AsyncSession = Depends(get_async_db),
+    token: str = Depends(reusable_oauth2)
+) -> schemas.student.StudentPrincipal:
+    """
+    Student identity for the submission hot path. Uses the principal cache, then
+    token claims (when enabled and not invalidated since issue), then the database.
+    Callers must re-check with load_student_principal before rejecting on claim data.
+    """
+    token_data, role, user_id = _decode_token(token)
+    if role != "student":
+        raise HTTPException(status_code=400, detail="The user is not a student")
+
+    values = principal_cache.cache.get(role, user_id)
+    if values is not None:
+        if values.get("deleted_at"):
+            raise HTTPException(status_code=404, detail="User not found")
+        return schemas.student.StudentPrincipal.model_validate(values)
+
+    if (
+        settings.TOKEN_PRINCIPAL_CLAIMS
+        and token_data.cg is not None
+        and token_data.did is not None
+        and token_data.name is not None
+        and token_data.email is not None
+        and principal_cache.cache.claims_valid(role, user_id, token_data.iat)
+    ):
+        return schemas.student.StudentPrincipal(
+            id=user_id,
+            digital_id=token_data.did,
+            name=token_data.name,
+            email=token_data.email,
+            department=token_data.dept,
+            year=token_data.year,
+            class_group_id=token_data.cg,
+            device_id=token_data.dev,
+            from_claims=True,
+        )
+
+    principal = await load_student_principal(db, user_id)
+    if not principal:
+        raise HTTPException(status_code=404, detail="User not found")
+    return principal
+
 def get_current_active_admin(
     current_user: models.Admin | models.Professor = Depends(get_current_user),
 ) -> models.Admin:
@@ -71,6 +186,36 @@ def get_current_active_professor(
         )
     return current_user
 
+async def get_current_active_admin_async(
+    db: AsyncSession = Depends(get_async_db),
+    token: str = Depends(reusable_oauth2)
+) -> models.Admin:
+    """Admin dependency for async endpoints; the row is attached to the request's AsyncSession."""
+    _, role, user_id = _decode_token(token)
+    if role != "admin":
+        raise HTTPException(
+            status_code=400, detail="The user doesn't have enough privileges"
+        )
+    user = await load_user_async(db, role, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+async def get_current_active_professor_async(
+    db: AsyncSession = Depends(get_async_db),
+    token: str = Depends(reusable_oauth2)
+) -> models.Professor:
+    """Professor dependency for async endpoints; the row is attached to the request's AsyncSession."""
+    _, role, user_id = _decode_token(token)
+    if role != "professor":
+         raise HTTPException(
+            status_code=400, detail="The user is not a professor"
+        )
+    user = await load_user_async(db, role, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
 def get_current_active_student(
     current_user: models.Admin | models.Professor | models.Student = Depends(get_current_user),
 ) -> models.Student:
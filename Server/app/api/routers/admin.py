@@ -1,22 +1,27 @@
 import logging
-import csv
+import base64
 import codecs
-import io
+import shutil
+import tempfile
 from typing import List, Any, Optional
 from datetime import datetime, timedelta, date, timezone
 
-from sqlalchemy import func, case, and_, desc
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, WebSocket, WebSocketDisconnect
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import func, and_, desc, select, distinct, tuple_
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, FileResponse
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt, JWTError
 
 from app import models, schemas
 from app.api import deps
-from app.core import security
+from app.core import security, code_registry, principal_cache, admission, idempotency, identity, import_jobs, export_jobs, timetable_import, purge, counters, database, rollups, attendance_stats, exports
 from app.core.config import settings
 from app.core.device_tracker import tracker as device_tracker
 from app.core.admin_ws_manager import manager as admin_ws_manager
+from app.core.attendance_writer import writer as attendance_writer
+from app.core.receipt_verifier import verifier as receipt_verifier
+from app.core.snapshot import snapshot as analytics_snapshot, STALENESS_HEADER
 
 logger = logging.getLogger(__name__)
 
@@ -25,44 +30,49 @@ router = APIRouter()
 # Maximum allowed pagination limit to prevent abuse
 MAX_PAGINATION_LIMIT = 500
 
+# Set on a full page of attendance records; pass it back as ?cursor= for the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def _encode_cursor(record: models.AttendanceRecord) -> str:
+    return base64.urlsafe_b64encode(f"{record.timestamp.isoformat()}|{record.id}".encode()).decode()
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        timestamp, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(record_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 # --- Dashboard Stats ---
 @router.get("/stats", response_model=schemas.admin_stats.DashboardStats)
 def read_stats(
     db: Session = Depends(deps.get_db),
     current_admin: models.Admin = Depends(deps.get_current_active_admin),
 ):
-    total_students = db.query(models.Student).count()
-    total_profs = db.query(models.Professor).count()
-    total_courses = db.query(models.Course).count()
+    total_students = db.query(models.Student).filter(models.Student.deleted_at.is_(None)).count()
+    total_profs = db.query(models.Professor).filter(models.Professor.deleted_at.is_(None)).count()
+    total_courses = db.query(models.Course).filter(models.Course.deleted_at.is_(None)).count()
     total_classes = db.query(models.ClassGroup).count()
     active_sessions = db.query(models.AttendanceSession).filter(models.AttendanceSession.is_active == True).count()
 
+    # Attendance comes from the daily rollups (app.core.rollups): a few rows per day, never the records table
+    Rollup = models.DailyAttendanceRollup
     today = datetime.now(timezone.utc).date()
-    todays_sessions_subquery = db.query(models.AttendanceSession.id).filter(func.date(models.AttendanceSession.start_time) == today).subquery()
-    
-    present_count = db.query(models.AttendanceRecord).filter(
-        models.AttendanceRecord.session_id.in_(todays_sessions_subquery),
-        models.AttendanceRecord.status == "PRESENT"
-    ).count()
-    
-    total_records_today = db.query(models.AttendanceRecord).filter(
-        models.AttendanceRecord.session_id.in_(todays_sessions_subquery)
-    ).count()
-    
-    todays_rate = 0.0
-    if total_records_today > 0:
-        todays_rate = (present_count / total_records_today) * 100
-
     seven_days_ago = today - timedelta(days=6)
     daily_stats = db.query(
-        func.date(models.AttendanceSession.start_time).label("date"),
-        func.count(models.AttendanceRecord.id).label("total"),
-        func.sum(case((models.AttendanceRecord.status == "PRESENT", 1), else_=0)).label("present")
-    ).join(models.AttendanceSession)\
-    .filter(func.date(models.AttendanceSession.start_time) >= seven_days_ago)\
-    .group_by(func.date(models.AttendanceSession.start_time))\
-    .order_by(func.date(models.AttendanceSession.start_time)).all()
-    
+        Rollup.day.label("date"),
+        func.sum(Rollup.records).label("total"),
+        func.sum(Rollup.present).label("present")
+    ).filter(Rollup.day >= seven_days_ago)\
+    .group_by(Rollup.day)\
+    .having(func.sum(Rollup.records) > 0)\
+    .order_by(Rollup.day).all()
+
+    todays_rate = 0.0
+    todays_stat = next((day_stat for day_stat in daily_stats if day_stat.date == today), None)
+    if todays_stat:
+        todays_rate = (todays_stat.present / todays_stat.total) * 100
+
     weekly_trend = []
     for day_stat in daily_stats:
         rate = 0.0
@@ -80,6 +90,12 @@ def read_stats(
         "weekly_trend": weekly_trend
     }
 
+async def _hash_password(password: str) -> str:
+    try:
+        return await security.hash_password_async(password)
+    except security.HasherBusy:
+        raise HTTPException(status_code=503, detail="Password hashing is busy. Please retry shortly.", headers={"Retry-After": "2"})
+
 # --- Professors Management ---
 @router.get("/professors", response_model=List[schemas.user.Professor])
 def read_professors(
@@ -88,29 +104,30 @@ def read_professors(
     db: Session = Depends(deps.get_db),
     current_admin: models.Admin = Depends(deps.get_current_active_admin),
 ):
-    return db.query(models.Professor).offset(skip).limit(limit).all()
+    return db.query(models.Professor).filter(models.Professor.deleted_at.is_(None)).offset(skip).limit(limit).all()
 
 @router.post("/professors", response_model=schemas.user.Professor)
-def create_professor(professor_in: schemas.user.ProfessorCreate, db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
-    if db.query(models.Professor).filter(models.Professor.email == professor_in.email).first():
+async def create_professor(professor_in: schemas.user.ProfessorCreate, db: AsyncSession = Depends(deps.get_async_db), current_admin: models.Admin = Depends(deps.get_current_active_admin_async)):
+    if (await db.execute(select(models.Professor.id).filter(models.Professor.email == professor_in.email))).first():
         raise HTTPException(status_code=400, detail="Email exists")
-    if db.query(models.Professor).filter(models.Professor.id == professor_in.id).first():
+    if await db.get(models.Professor, professor_in.id):
         raise HTTPException(status_code=400, detail="ID exists")
     db_prof = models.Professor(
         id=professor_in.id,
         name=professor_in.name,
         email=professor_in.email,
         department=professor_in.department,
-        password_hash=security.get_password_hash(professor_in.password),
+        password_hash=await _hash_password(professor_in.password),
     )
     db.add(db_prof)
-    db.commit()
-    db.refresh(db_prof)
+    await identity.sync_async(db, "professor", db_prof)
+    await db.commit()
+    await db.refresh(db_prof)
     return db_prof
 
 @router.put("/professors/{prof_id}", response_model=schemas.user.Professor)
-def update_professor(prof_id: int, professor_in: schemas.user.ProfessorUpdate, db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
-    prof = db.query(models.Professor).filter(models.Professor.id == prof_id).first()
+async def update_professor(prof_id: int, professor_in: schemas.user.ProfessorUpdate, db: AsyncSession = Depends(deps.get_async_db), current_admin: models.Admin = Depends(deps.get_current_active_admin_async)):
+    prof = await db.get(models.Professor, prof_id)
     if not prof:
         raise HTTPException(status_code=404, detail="Not found")
     if professor_in.email is not None:
@@ -120,36 +137,43 @@ def update_professor(prof_id: int, professor_in: schemas.user.ProfessorUpdate, d
     if professor_in.department is not None:
         prof.department = professor_in.department
     if professor_in.password is not None:
-        prof.password_hash = security.get_password_hash(professor_in.password)
-    db.commit()
-    db.refresh(prof)
+        prof.password_hash = await _hash_password(professor_in.password)
+    prof.row_fingerprint = None  # edited outside a roster sync; the next sync compares column by column
+    await identity.sync_async(db, "professor", prof)
+    await db.commit()
+    principal_cache.cache.invalidate("professor", prof_id)
+    await db.refresh(prof)
     return prof
 
+def _purge_scheduled(pending: models.PendingPurge) -> dict:
+    return {"status": "scheduled", "purge_id": pending.id}
+
 @router.delete("/professors/{prof_id}")
-def delete_professor(prof_id: int, db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+def delete_professor(prof_id: int, soft: bool = False, db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+    """
+    Deletes a professor with their assignments, sessions and attendance (ON DELETE CASCADE).
+    With soft=true the professor disappears at once and the rows are purged in the background.
+    """
     prof = db.query(models.Professor).filter(models.Professor.id == prof_id).first()
-    if not prof:
+    if not prof or (soft and prof.deleted_at is not None):
         raise HTTPException(status_code=404, detail="Not found")
+    if soft:
+        return _purge_scheduled(purge.soft_delete(db, "professor", prof_id))
+    class_group_ids = {assignment.class_group_id for assignment in prof.assignments}
+    ended = code_registry.end_sessions(db, models.TeachingAssignment.professor_id == prof_id)
     db.delete(prof)
+    db.flush()
+    rollups.recompute(db, class_group_ids)
+    identity.remove(db, "professor", prof_id)
     db.commit()
+    code_registry.registry.close(*ended)
+    principal_cache.cache.invalidate("professor", prof_id)
     return {"status": "success"}
 
 @router.post("/professors/bulk_upload")
-def upload_professors(file: UploadFile = File(...), db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
-    csvReader = csv.reader(codecs.iterdecode(file.file, 'utf-8'))
-    next(csvReader)
-    count = 0
-    errors = []
-    for row in csvReader:
-        try:
-            if db.query(models.Professor).filter((models.Professor.id == int(row[0])) | (models.Professor.email == row[2])).first():
-                continue
-            db.add(models.Professor(id=int(row[0]), name=row[1], email=row[2], department=row[3], password_hash=security.get_password_hash(row[4])))
-            count += 1
-        except Exception as e:
-            errors.append(f"Row {row}: {str(e)}")
-    db.commit()
-    return {"added": count, "errors": errors}
+def upload_professors(file: UploadFile = File(...), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+    job = import_jobs.run_import("professors", codecs.iterdecode(file.file, 'utf-8-sig'))
+    return _legacy_import_result(job)
 
 # --- Students Management ---
 @router.get("/students", response_model=List[schemas.user.Student])
@@ -157,17 +181,20 @@ def read_students(
     skip: int = 0,
     limit: int = Query(default=100, le=MAX_PAGINATION_LIMIT),
     class_group_id: int = None,
+    include_deleted: bool = False,
     db: Session = Depends(deps.get_db),
     current_admin: models.Admin = Depends(deps.get_current_active_admin),
 ):
     query = db.query(models.Student)
+    if not include_deleted:
+        query = query.filter(models.Student.deleted_at.is_(None))
     if class_group_id:
         query = query.filter(models.Student.class_group_id == class_group_id)
     return query.offset(skip).limit(limit).all()
 
 @router.post("/students", response_model=schemas.user.Student)
-def create_student(student_in: schemas.user.StudentCreate, db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
-    if db.query(models.Student).filter(models.Student.id == student_in.id).first():
+async def create_student(student_in: schemas.user.StudentCreate, db: AsyncSession = Depends(deps.get_async_db), current_admin: models.Admin = Depends(deps.get_current_active_admin_async)):
+    if await db.get(models.Student, student_in.id):
         raise HTTPException(status_code=400, detail="ID exists")
     # Use the password from the request, with a fallback default
     password = student_in.password if student_in.password else "changeme"
@@ -179,17 +206,18 @@ def create_student(student_in: schemas.user.StudentCreate, db: Session = Depends
         department=student_in.department,
         year=student_in.year,
         class_group_id=student_in.class_group_id,
-        password_hash=security.get_password_hash(password),
+        password_hash=await _hash_password(password),
     )
     db.add(db_student)
-    db.commit()
-    db.refresh(db_student)
+    await identity.sync_async(db, "student", db_student)
+    await db.commit()
+    await db.refresh(db_student)
     return db_student
 
 @router.put("/students/{student_id}", response_model=schemas.user.Student)
-def update_student(student_id: int, student_in: schemas.user.StudentUpdate, db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
-    student = db.query(models.Student).filter(models.Student.id == student_id).first()
-    if not student:
+async def update_student(student_id: int, student_in: schemas.user.StudentUpdate, db: AsyncSession = Depends(deps.get_async_db), current_admin: models.Admin = Depends(deps.get_current_active_admin_async)):
+    student = await db.get(models.Student, student_id)
+    if not student or student.deleted_at is not None:
         raise HTTPException(status_code=404, detail="Not found")
     if student_in.name is not None:
         student.name = student_in.name
@@ -198,43 +226,91 @@ def update_student(student_id: int, student_in: schemas.user.StudentUpdate, db:
     if student_in.class_group_id is not None:
         student.class_group_id = student_in.class_group_id
     if student_in.password is not None:
-        student.password_hash = security.get_password_hash(student_in.password)
+        student.password_hash = await _hash_password(student_in.password)
     if student_in.device_id == "":
         student.device_id = None
-    db.commit()
-    db.refresh(student)
+        student.receipt_key = None  # receipts signed on the old device no longer verify
+    student.row_fingerprint = None  # edited outside a roster sync; the next sync compares column by column
+    await identity.sync_async(db, "student", student)
+    await db.commit()
+    principal_cache.cache.invalidate("student", student_id)
+    await db.refresh(student)
     return student
 
 @router.delete("/students/{student_id}")
-def delete_student(student_id: int, db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+def delete_student(student_id: int, soft: bool = False, db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+    """Deletes a student and their attendance; soft=true hides them now and purges in the background."""
     student = db.query(models.Student).filter(models.Student.id == student_id).first()
     if not student:
         raise HTTPException(status_code=404, detail="Not found")
+    if soft:
+        return _purge_scheduled(purge.soft_delete(db, "student", student_id))
+    affected_sessions = [
+        session_id for (session_id,) in
+        db.query(distinct(models.AttendanceRecord.session_id)).filter(models.AttendanceRecord.student_id == student_id)
+    ]
+    class_group_ids, days = rollups.scope_of_sessions(db, affected_sessions)
     db.delete(student)
+    db.flush()
+    counters.recount_sessions(db, affected_sessions)
+    rollups.recompute(db, class_group_ids, days)
+    identity.remove(db, "student", student_id)
     db.commit()
+    principal_cache.cache.invalidate("student", student_id)
     return {"status": "success"}
 
 @router.post("/students/bulk_upload")
-def upload_students(file: UploadFile = File(...), db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
-    csvReader = csv.reader(codecs.iterdecode(file.file, 'utf-8'))
-    next(csvReader)
-    count = 0
-    errors = []
-    class_map = {cg.name: cg.id for cg in db.query(models.ClassGroup).all()}
-    for row in csvReader:
-        try:
-            if len(row) < 8 or db.query(models.Student).filter(models.Student.id == int(row[0])).first():
-                continue
-            cg_id = class_map.get(row[6])
-            if not cg_id: 
-                errors.append(f"Class {row[6]} not found")
-                continue
-            db.add(models.Student(id=int(row[0]), digital_id=int(row[1]), name=row[2], email=row[3], year=int(row[4]), department=row[5], class_group_id=cg_id, password_hash=security.get_password_hash(row[7]), device_id=None))
-            count += 1
-        except Exception as e:
-            errors.append(f"Row {row}: {str(e)}")
-    db.commit()
-    return {"added": count, "errors": errors}
+def upload_students(file: UploadFile = File(...), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+    job = import_jobs.run_import("students", codecs.iterdecode(file.file, 'utf-8-sig'))
+    return _legacy_import_result(job)
+
+def _legacy_import_result(job: import_jobs.ImportJob) -> dict:
+    if job.status == "FAILED":
+        raise HTTPException(status_code=500, detail=f"Import failed after {job.rows_processed} rows: {job.failure}")
+    return {"added": job.added, "errors": [f"Row {e['row']}: {e['error']}" for e in job.errors]}
+
+# --- Background Roster Imports ---
+@router.post("/imports/{kind}", status_code=202)
+def start_import(
+    kind: str,
+    file: UploadFile = File(...),
+    mode: str = Query(default="import", pattern="^(import|sync)$"),
+    delete_missing: bool = False,
+    current_admin: models.Admin = Depends(deps.get_current_active_admin),
+):
+    """
+    Queues a students/professors CSV (same columns as bulk_upload) and returns the job to poll.
+    mode=import only adds new rows; mode=sync also updates changed ones and, with
+    delete_missing, soft-deletes students absent from the file.
+    """
+    if kind not in import_jobs.IMPORTERS:
+        raise HTTPException(status_code=404, detail="Unknown import type")
+    if delete_missing and (mode != "sync" or kind != "students"):
+        raise HTTPException(status_code=400, detail="delete_missing needs mode=sync on a student roster")
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp:
+        shutil.copyfileobj(file.file, tmp, length=1024 * 1024)
+    return import_jobs.manager.submit(kind, tmp.name, file.filename, mode, delete_missing).as_dict()
+
+@router.get("/imports")
+def read_imports(current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+    return [job.as_dict() for job in import_jobs.manager.recent()]
+
+@router.get("/imports/{job_id}")
+def read_import(job_id: str, current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+    job = import_jobs.manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job.as_dict()
+
+# --- Purges ---
+@router.get("/purges")
+def read_purges(db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+    """Soft deletes still being removed, with rows deleted so far."""
+    return [
+        {"id": p.id, "entity": p.entity, "entity_id": p.entity_id, "requested_at": p.requested_at,
+         "rows_deleted": p.rows_deleted, "last_error": p.last_error}
+        for p in db.query(models.PendingPurge).order_by(models.PendingPurge.id)
+    ]
 
 # --- Classes ---
 @router.post("/classes", response_model=schemas.academic.ClassGroup)
@@ -272,7 +348,7 @@ def read_courses(
     db: Session = Depends(deps.get_db),
     current_admin: models.Admin = Depends(deps.get_current_active_admin),
 ):
-    return db.query(models.Course).offset(skip).limit(limit).all()
+    return db.query(models.Course).filter(models.Course.deleted_at.is_(None)).offset(skip).limit(limit).all()
 
 @router.put("/courses/{course_id}", response_model=schemas.academic.Course)
 def update_course(course_id: int, course_in: schemas.academic.CourseUpdate, db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
@@ -290,12 +366,20 @@ def update_course(course_id: int, course_in: schemas.academic.CourseUpdate, db:
     return course
 
 @router.delete("/courses/{course_id}")
-def delete_course(course_id: int, db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+def delete_course(course_id: int, soft: bool = False, db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+    """Deletes a course with its assignments and their attendance; soft=true purges in the background."""
     course = db.query(models.Course).filter(models.Course.id == course_id).first()
-    if not course:
+    if not course or (soft and course.deleted_at is not None):
         raise HTTPException(status_code=404, detail="Not found")
+    if soft:
+        return _purge_scheduled(purge.soft_delete(db, "course", course_id))
+    class_group_ids = {assignment.class_group_id for assignment in course.assignments}
+    ended = code_registry.end_sessions(db, models.TeachingAssignment.course_id == course_id)
     db.delete(course)
+    db.flush()
+    rollups.recompute(db, class_group_ids)
     db.commit()
+    code_registry.registry.close(*ended)
     return {"status": "success"}
 
 # --- Assignments ---
@@ -328,19 +412,23 @@ def read_bell_schedule(db: Session = Depends(deps.get_db), current_admin: models
 
 @router.put("/bell-schedule", response_model=List[schemas.academic.BellSchedule])
 def update_bell_schedule(schedule_in: List[schemas.academic.BellScheduleCreate], db: Session = Depends(deps.get_db), current_admin: models.Admin = Depends(deps.get_current_active_admin)):
-    ret = []
+    slot_numbers = [slot_data.slot_number for slot_data in schedule_in]
+    slots = {
+        s.slot_number: s for s in
+        db.query(models.BellSchedule).filter(models.BellSchedule.slot_number.in_(slot_numbers))
+    }
     for slot_data in schedule_in:
-        db_slot = db.query(models.BellSchedule).filter(models.BellSchedule.slot_number == slot_data.slot_number).first()
+        db_slot = slots.get(slot_data.slot_number)
         if db_slot:
             db_slot.start_time = slot_data.start_time
             db_slot.end_time = slot_data.end_time
         else:
-            db_slot = models.BellSchedule(**slot_data.dict())
+            db_slot = slots[slot_data.slot_number] = models.BellSchedule(**slot_data.dict())
             db.add(db_slot)
-        db.commit()
-        db.refresh(db_slot)
-        ret.append(db_slot)
-    return ret
+    db.commit()
+    # One query reloads every slot expired by the commit
+    db.query(models.BellSchedule).filter(models.BellSchedule.slot_number.in_(slot_numbers)).all()
+    return [slots[n] for n in slot_numbers]
 
 # --- Timetable ---
 @router.get("/timetable/{class_group_id}", response_model=List[schemas.academic.TimeTable])
@@ -385,161 +473,148 @@ def upload_timetable(file: UploadFile = File(...), db: Session = Depends(deps.ge
     """
     Expects CSV: class_name, day (name or 0-5), period (1-8), course_code, professor_email
     """
-    csvReader = csv.reader(codecs.iterdecode(file.file, 'utf-8'))
-    next(csvReader)
-    
-    count = 0
-    errors = []
-    
-    # Cache for performance
-    classes = {c.name: c.id for c in db.query(models.ClassGroup).all()}
-    courses = {c.code: c.id for c in db.query(models.Course).all()}
-    profs = {p.email: p.id for p in db.query(models.Professor).all()}
-    days_map = {'Monday':0, 'Tuesday':1, 'Wednesday':2, 'Thursday':3, 'Friday':4, 'Saturday':5}
-
-    for row in csvReader:
-        if len(row) < 5:
-            continue
-        try:
-            c_name, day_raw, period, c_code, p_email = row[0], row[1], int(row[2]), row[3], row[4]
-            
-            # Resolve IDs
-            cid = classes.get(c_name)
-            if not cid:
-                errors.append(f"Class '{c_name}' not found")
-                continue
-            
-            course_id = courses.get(c_code)
-            if not course_id:
-                errors.append(f"Course '{c_code}' not found")
-                continue
-            
-            prof_id = profs.get(p_email)
-            if not prof_id:
-                errors.append(f"Prof '{p_email}' not found")
-                continue
-            
-            day = int(day_raw) if day_raw.isdigit() else days_map.get(day_raw, -1)
-            if day == -1:
-                errors.append(f"Invalid day '{day_raw}'")
-                continue
-
-            # 1. Get/Create Assignment
-            assign = db.query(models.TeachingAssignment).filter(
-                models.TeachingAssignment.course_id == course_id,
-                models.TeachingAssignment.professor_id == prof_id,
-                models.TeachingAssignment.class_group_id == cid
-            ).first()
-            
-            if not assign:
-                assign = models.TeachingAssignment(course_id=course_id, professor_id=prof_id, class_group_id=cid)
-                db.add(assign)
-                db.commit()
-                db.refresh(assign)
-            
-            # 2. Update Timetable Slot
-            existing = db.query(models.TimeTable).join(models.TeachingAssignment).filter(
-                models.TeachingAssignment.class_group_id == cid,
-                models.TimeTable.day_of_week == day,
-                models.TimeTable.hour_slot == period
-            ).first()
-            
-            if existing:
-                existing.assignment_id = assign.id
-            else:
-                db.add(models.TimeTable(assignment_id=assign.id, day_of_week=day, hour_slot=period))
-            
-            count += 1
-        except Exception as e:
-            errors.append(f"Row {row}: {str(e)}")
-            
-    db.commit()
-    return {"added": count, "errors": errors}
+    return timetable_import.import_timetable(db, codecs.iterdecode(file.file, 'utf-8'))
 
 # --- Attendance Records ---
 @router.get("/attendance/records", response_model=List[schemas.attendance.AttendanceRecord])
 def read_attendance_records(
+    response: Response,
+    cursor: Optional[str] = None,
     skip: int = 0,
     limit: int = Query(default=100, le=MAX_PAGINATION_LIMIT),
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     class_group_id: Optional[int] = None,
-    db: Session = Depends(deps.get_db),
+    db: Session = Depends(deps.get_analytics_db),
     current_admin: models.Admin = Depends(deps.get_current_active_admin)
 ):
-    query = db.query(models.AttendanceRecord).join(models.AttendanceSession).join(models.Student)
+    """
+    Newest records first. Page with the X-Next-Cursor header of a full page
+    (?cursor=...), which costs the same on any page; skip is kept for old clients
+    and gets slower the deeper it goes.
+    """
+    Record = models.AttendanceRecord
+    query = db.query(Record).join(models.AttendanceSession).join(models.Student)\
+              .options(selectinload(Record.student))
     
     if start_date:
-        query = query.filter(func.date(models.AttendanceSession.start_time) >= start_date)
+        query = query.filter(models.AttendanceSession.session_date >= start_date)
     if end_date:
-        query = query.filter(func.date(models.AttendanceSession.start_time) <= end_date)
+        query = query.filter(models.AttendanceSession.session_date <= end_date)
     
     if class_group_id:
          query = query.join(models.TeachingAssignment, models.AttendanceSession.assignment_id == models.TeachingAssignment.id)\
                       .filter(models.TeachingAssignment.class_group_id == class_group_id)
 
-    # Order by timestamp desc
-    query = query.order_by(desc(models.AttendanceRecord.timestamp))
-    
-    return query.offset(skip).limit(limit).all()
+    if cursor:
+        query = query.filter(tuple_(Record.timestamp, Record.id) < tuple_(*_decode_cursor(cursor)))
+
+    # Newest first, id breaking ties so the cursor is exact (ix_attendance_records_timestamp_id)
+    query = query.order_by(desc(Record.timestamp), desc(Record.id))
+
+    records = query.offset(skip).limit(limit).all()
+    if len(records) == limit and records[-1].timestamp is not None:
+        response.headers[NEXT_CURSOR_HEADER] = _encode_cursor(records[-1])
+    return records
+
+@router.get("/attendance/eligibility", response_model=List[schemas.attendance.StudentEligibility])
+def read_attendance_eligibility(
+    assignment_id: Optional[int] = None,
+    course_id: Optional[int] = None,
+    class_group_id: Optional[int] = None,
+    threshold: Optional[float] = Query(default=None, ge=0, le=100),
+    defaulters_only: bool = False,
+    skip: int = 0,
+    limit: int = Query(default=100, le=MAX_PAGINATION_LIMIT),
+    db: Session = Depends(deps.get_db),
+    current_admin: models.Admin = Depends(deps.get_current_active_admin)
+):
+    """
+    Attendance percentage per student and course (teaching assignment) against the
+    eligibility threshold (ATTENDANCE_ELIGIBILITY_THRESHOLD unless given).
+    defaulters_only=true lists just the students below it.
+    """
+    Stat = models.StudentAttendanceStat
+    query = attendance_stats.eligibility_query(
+        settings.ATTENDANCE_ELIGIBILITY_THRESHOLD if threshold is None else threshold, defaulters_only
+    )
+    if assignment_id:
+        query = query.where(Stat.assignment_id == assignment_id)
+    if course_id:
+        query = query.where(models.TeachingAssignment.course_id == course_id)
+    if class_group_id:
+        query = query.where(models.TeachingAssignment.class_group_id == class_group_id)
+    return db.execute(query.order_by(Stat.assignment_id, Stat.student_id).offset(skip).limit(limit)).all()
 
 @router.get("/attendance/export")
 def export_attendance_records(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     class_group_id: Optional[int] = None,
-    db: Session = Depends(deps.get_db),
+    format: str = Query(default="csv", pattern="^(csv|ndjson|parquet)$"),
     current_admin: models.Admin = Depends(deps.get_current_active_admin)
 ):
-    query = db.query(
-        models.AttendanceRecord,
-        models.Student,
-        models.AttendanceSession,
-        models.ClassGroup
-    ).join(models.Student, models.AttendanceRecord.student_id == models.Student.id)\
-     .join(models.AttendanceSession, models.AttendanceRecord.session_id == models.AttendanceSession.id)\
-     .join(models.TeachingAssignment, models.AttendanceSession.assignment_id == models.TeachingAssignment.id)\
-     .join(models.ClassGroup, models.TeachingAssignment.class_group_id == models.ClassGroup.id)
-
-    if start_date:
-        query = query.filter(func.date(models.AttendanceSession.start_time) >= start_date)
-    if end_date:
-        query = query.filter(func.date(models.AttendanceSession.start_time) <= end_date)
-    if class_group_id:
-        query = query.filter(models.TeachingAssignment.class_group_id == class_group_id)
-        
-    query = query.order_by(desc(models.AttendanceRecord.timestamp))
-    
-    results = query.all()
+    """
+    Streams attendance records as CSV, NDJSON or Parquet (needs pyarrow), reading
+    EXPORT_CHUNK_SIZE rows at a time from the analytics snapshot.
+    """
+    if format == "parquet" and not exports.parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export needs pyarrow installed on the server")
 
-    # Create CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header
-    writer.writerow(["Date", "Time", "Student Name", "Student ID", "Class", "Status", "Session ID"])
-    
-    for record, student, session, class_group in results:
-        writer.writerow([
-            record.timestamp.strftime("%Y-%m-%d") if record.timestamp else "",
-            record.timestamp.strftime("%H:%M:%S") if record.timestamp else "",
-            student.name,
-            student.digital_id,
-            class_group.name,
-            record.status,
-            session.id
-        ])
-        
-    output.seek(0)
-    
-    current_time = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    # The stream outlives this function, so it owns (and closes) the session
+    db = analytics_snapshot.session()
+    media_type, extension = exports.FORMATS[format]
+    query = exports.attendance_query(start_date, end_date, class_group_id)
     response = StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv"
+        exports.stream(db, query, format, settings.EXPORT_CHUNK_SIZE),
+        media_type=media_type
     )
-    response.headers["Content-Disposition"] = f"attachment; filename=attendance_export_{current_time}.csv"
+    current_time = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    response.headers["Content-Disposition"] = f"attachment; filename=attendance_export_{current_time}.{extension}"
+    response.headers[STALENESS_HEADER] = str(db.info["staleness_seconds"])
     return response
 
+# --- Background Exports ---
+@router.post("/exports", status_code=202)
+def start_export(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    class_group_id: Optional[int] = None,
+    format: str = Query(default="csv", pattern="^(csv|ndjson|parquet)$"),
+    current_admin: models.Admin = Depends(deps.get_current_active_admin),
+):
+    """
+    Queues an attendance export (same filters as /attendance/export) and returns the
+    job to poll. An unchanged range that was exported before comes back already
+    COMPLETED, reusing the earlier file.
+    """
+    if format == "parquet" and not exports.parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export needs pyarrow installed on the server")
+    return export_jobs.manager.submit(format, start_date, end_date, class_group_id).as_dict()
+
+@router.get("/exports")
+def read_exports(current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+    return [job.as_dict() for job in export_jobs.manager.recent()]
+
+@router.get("/exports/{job_id}")
+def read_export(job_id: str, current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+    job = export_jobs.manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job.as_dict()
+
+@router.get("/exports/{job_id}/download")
+def download_export(job_id: str, current_admin: models.Admin = Depends(deps.get_current_active_admin)):
+    job = export_jobs.manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job.status != "COMPLETED":
+        raise HTTPException(status_code=409, detail=f"Export is {job.status.lower()}")
+    if not export_jobs.manager.use(job):
+        raise HTTPException(status_code=410, detail="Export file has expired; submit the export again")
+    media_type = exports.FORMATS[job.format][0] if job.format == "parquet" else "application/gzip"
+    return FileResponse(job.path, media_type=media_type, filename=job.filename)
+
 # --- Device Monitoring ---
 @router.get("/devices")
 def read_devices(
@@ -547,6 +622,24 @@ def read_devices(
 ):
     return device_tracker.get_all_devices()
 
+# --- Server Metrics ---
+@router.get("/metrics")
+def read_metrics(
+    current_admin: models.Admin = Depends(deps.get_current_active_admin),
+):
+    return {
+        "attendance_writer": attendance_writer.stats(),
+        "principal_cache": principal_cache.cache.stats(),
+        "admission": admission.controller.stats(),
+        "idempotency": idempotency.cache.stats(),
+        "offline_receipts": receipt_verifier.stats(),
+        "password_hasher": security.hasher.stats(),
+        "purge": purge.purger.stats(),
+        "database": database.stats(),
+        "analytics_snapshot": analytics_snapshot.stats(),
+        "export_jobs": export_jobs.manager.stats(),
+    }
+
 @router.websocket("/ws/devices")
 async def websocket_devices(websocket: WebSocket, token: str = Query(...)):
     # Authenticate via JWT token
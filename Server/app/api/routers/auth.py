@@ -4,11 +4,10 @@ from datetime import timedelta
 from typing import Any
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models, schemas
-from app.core import security
+from app.core import security, identity
 from app.core.config import settings
 from app.api import deps
 
@@ -16,13 +15,9 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Precompute a dummy hash to use for constant-time comparison
-# when a user is not found (prevents timing side-channel)
-_DUMMY_HASH = security.get_password_hash("dummy-password-for-timing")
-
 @router.post("/login/access-token", response_model=schemas.token.Token)
-def login_access_token(
-    db: Session = Depends(deps.get_db), form_data: OAuth2PasswordRequestForm = Depends()
+async def login_access_token(
+    db: AsyncSession = Depends(deps.get_async_db), form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests.
@@ -30,46 +25,48 @@ def login_access_token(
     - Admin: username (username field)
     - Professor: email (username field)
     - Student: email (username field)
-    """
-    user = None
-    role = None
-
-    # 1. Try Admin
-    admin = db.query(models.Admin).filter(models.Admin.username == form_data.username).first()
-    if admin:
-        if security.verify_password(form_data.password, admin.password_hash):
-            user = admin
-            role = "admin"
-    
-    # 2. Try Professor (Case Insensitive)
-    if not user:
-        prof = db.query(models.Professor).filter(func.lower(models.Professor.email) == form_data.username.lower()).first()
-        if prof:
-            if security.verify_password(form_data.password, prof.password_hash):
-                user = prof
-                role = "professor"
 
-    # 3. Try Student (Case Insensitive)
-    if not user:
-        student = db.query(models.Student).filter(func.lower(models.Student.email) == form_data.username.lower()).first()
-        if student:
-            if security.verify_password(form_data.password, student.password_hash):
-                user = student
-                role = "student"
+    bcrypt runs in the hashing process pool, so a login burst does not stall other endpoints.
+    """
+    identity_row = None
+    try:
+        # One indexed lookup across admins (username), professors and students (email, case insensitive)
+        candidates = await identity.lookup(db, form_data.username)
+        for candidate in candidates:
+            if candidate.password_hash and await security.verify_password_async(form_data.password, candidate.password_hash):
+                identity_row = candidate
+                break
+        # If no account matched at all, do a dummy verify to prevent timing attacks
+        if not candidates:
+            await security.verify_password_async(form_data.password, await security.dummy_hash_async())
+    except security.HasherBusy:
+        raise HTTPException(status_code=503, detail="Too many logins in progress. Please retry shortly.", headers={"Retry-After": "2"})
 
-    # If no user type matched at all, do a dummy verify to prevent timing attacks
-    if not user:
-        security.verify_password(form_data.password, _DUMMY_HASH)
+    if not identity_row:
         raise HTTPException(status_code=400, detail="Incorrect email/username or password")
-    
+    role = identity_row.role
+
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     
     # Subject format: "role:id"
-    subject = f"{role}:{user.id}"
+    subject = f"{role}:{identity_row.user_id}"
+
+    claims = None
+    if role == "student" and settings.TOKEN_PRINCIPAL_CLAIMS:
+        user = await db.get(models.Student, identity_row.user_id)
+        claims = {
+            "cg": user.class_group_id,
+            "dev": user.device_id,
+            "did": user.digital_id,
+            "name": user.name,
+            "email": user.email,
+            "dept": user.department,
+            "year": user.year,
+        }
     
     return {
         "access_token": security.create_access_token(
-            subject=subject, expires_delta=access_token_expires
+            subject=subject, expires_delta=access_token_expires, claims=claims
         ),
         "token_type": "bearer",
     }
@@ -1,12 +1,16 @@
 import logging
-from typing import List, Any
+from typing import List, Any, Optional
 from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, Query
-from sqlalchemy.orm import Session, joinedload
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 
 from app import models, schemas
 from app.api import deps
 from app.core import mqtt
+from app.core import code_registry, rollups, attendance_stats
 from app.core.device_tracker import tracker as device_tracker
 from app.core.ws_manager import manager as ws_manager
 from jose import jwt, JWTError
@@ -17,7 +21,7 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-def sync_session_headcount(session: models.AttendanceSession, db: Session) -> None:
+async def sync_session_headcount(session: models.AttendanceSession, db: AsyncSession) -> None:
     """Copy the latest device value into a session that may have started later."""
     if not session.room_number:
         return
@@ -25,8 +29,39 @@ def sync_session_headcount(session: models.AttendanceSession, db: Session) -> No
     live_headcount = device_tracker.get_headcount(session.room_number)
     if live_headcount is not None and session.headcount != live_headcount:
         session.headcount = live_headcount
-        db.commit()
-        db.refresh(session)
+        await db.commit()
+
+def _assignment_options():
+    """Eager loads for serializing a TeachingAssignment without lazy IO (async sessions)."""
+    return (
+        joinedload(models.TeachingAssignment.course),
+        joinedload(models.TeachingAssignment.class_group),
+        joinedload(models.TeachingAssignment.professor),
+    )
+
+async def get_owned_session(
+    db: AsyncSession,
+    session_id: int,
+    current_prof: models.Professor,
+    with_records: bool = False,
+) -> models.AttendanceSession:
+    """Loads a session of `current_prof` with its assignment (and optionally records) eagerly."""
+    options = [
+        joinedload(models.AttendanceSession.assignment).options(*_assignment_options()),
+    ]
+    if with_records:
+        options.append(
+            selectinload(models.AttendanceSession.records).joinedload(models.AttendanceRecord.student)
+        )
+    session = (await db.execute(
+        select(models.AttendanceSession).options(*options).filter(models.AttendanceSession.id == session_id)
+    )).scalars().first()
+
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if session.assignment.professor_id != current_prof.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return session
 
 @router.get("/my-courses", response_model=List[schemas.academic.TeachingAssignment])
 def read_my_courses(
@@ -47,24 +82,26 @@ def read_my_timetable(
     return timetables
 
 @router.post("/attendance/start", response_model=schemas.attendance.AttendanceSession)
-def start_attendance(
+async def start_attendance(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     session_in: schemas.attendance.AttendanceSessionCreate, # expects course_id, class_group_id
-    current_prof: models.Professor = Depends(deps.get_current_active_professor),
+    current_prof: models.Professor = Depends(deps.get_current_active_professor_async),
 ):
     # 1. Verify Teaching Assignment exists for this Prof + Course + Class
-    assignment = db.query(models.TeachingAssignment).filter(
-        models.TeachingAssignment.professor_id == current_prof.id,
-        models.TeachingAssignment.course_id == session_in.course_id,
-        models.TeachingAssignment.class_group_id == session_in.class_group_id
-    ).first()
+    assignment = (await db.execute(
+        select(models.TeachingAssignment).options(*_assignment_options()).filter(
+            models.TeachingAssignment.professor_id == current_prof.id,
+            models.TeachingAssignment.course_id == session_in.course_id,
+            models.TeachingAssignment.class_group_id == session_in.class_group_id
+        )
+    )).scalars().first()
     
     if not assignment:
         raise HTTPException(status_code=403, detail="You are not assigned to teach this course to this class.")
         
     # 2. Get ClassGroup to determine Classroom ID for Beacon (needed for MQTT)
-    class_group = assignment.class_group # loaded via relationship
+    class_group = assignment.class_group # eagerly loaded
     if not class_group:
          raise HTTPException(status_code=404, detail="Class Group not found")
 
@@ -73,7 +110,7 @@ def start_attendance(
     end_time = datetime.now(timezone.utc) + timedelta(minutes=duration_min)
     
     db_session = models.AttendanceSession(
-        assignment_id=assignment.id, # Link to Assignment now!
+        assignment=assignment, # Link to Assignment now!
         room_number=session_in.room_number,
         headcount=device_tracker.get_headcount(session_in.room_number),
         start_time=datetime.now(timezone.utc),
@@ -81,56 +118,80 @@ def start_attendance(
         is_active=True
     )
     db.add(db_session)
-    db.commit()
-    db.refresh(db_session)
+    await db.run_sync(rollups.session_counted, db_session)
+    await db.run_sync(attendance_stats.session_held, db_session)
+    await db.commit()
     
     # 4. Trigger Beacon via MQTT
     composite_classroom_id = f"{class_group.name}_{session_in.room_number}"
 
     try:
-        mqtt.send_beacon_command(
+        await run_in_threadpool(
+            mqtt.send_beacon_command,
             command="start_session",
             classroom_id=composite_classroom_id,
             duration_minutes=duration_min,
             session_id=db_session.id
         )
     except Exception as e:
-        db.delete(db_session)
-        db.commit()
+        await db.run_sync(rollups.session_counted, db_session, -1)
+        await db.run_sync(attendance_stats.session_held, db_session, -1)
+        await db.delete(db_session)
+        await db.commit()
         raise HTTPException(status_code=500, detail=f"Failed to start beacon: {str(e)}")
-    
+
+    await db.run_sync(code_registry.load_session, db_session, True)
     return db_session
 
 @router.post("/attendance/stop/{session_id}")
-def stop_attendance(
+async def stop_attendance(
     session_id: int,
-    db: Session = Depends(deps.get_db),
-    current_prof: models.Professor = Depends(deps.get_current_active_professor),
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_prof: models.Professor = Depends(deps.get_current_active_professor_async),
 ):
-    session = db.query(models.AttendanceSession).filter(models.AttendanceSession.id == session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-        
-    # Verify ownership via assignment -> professor
-    if session.assignment.professor_id != current_prof.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
+    session = await get_owned_session(db, session_id, current_prof)
 
     session.is_active = False
     session.end_time = datetime.now(timezone.utc)
-    db.commit()
+    await db.commit()
+    code_registry.registry.close(session.id)
     
     # Stop Beacon — use the same composite classroom_id format as start
     class_group = session.assignment.class_group
     if class_group:
         # Use composite ID consistent with start_session
         composite_classroom_id = f"{class_group.name}_{session.room_number}"
-        mqtt.send_beacon_command(
+        await run_in_threadpool(
+            mqtt.send_beacon_command,
             command="stop_session",
             classroom_id=composite_classroom_id
         )
     
     return {"message": "Attendance stopped"}
 
+@router.get("/attendance/eligibility/{assignment_id}", response_model=List[schemas.attendance.StudentEligibility])
+def read_attendance_eligibility(
+    assignment_id: int,
+    threshold: Optional[float] = Query(default=None, ge=0, le=100),
+    defaulters_only: bool = False,
+    skip: int = 0,
+    limit: int = Query(default=100, le=500),
+    db: Session = Depends(deps.get_db),
+    current_prof: models.Professor = Depends(deps.get_current_active_professor),
+):
+    """Attendance percentage of each student in one of my courses; defaulters_only=true lists those below the threshold."""
+    assignment = db.get(models.TeachingAssignment, assignment_id)
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    if assignment.professor_id != current_prof.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    Stat = models.StudentAttendanceStat
+    query = attendance_stats.eligibility_query(
+        settings.ATTENDANCE_ELIGIBILITY_THRESHOLD if threshold is None else threshold, defaulters_only
+    ).where(Stat.assignment_id == assignment_id)
+    return db.execute(query.order_by(Stat.student_id).offset(skip).limit(limit)).all()
+
 @router.get("/attendance/history", response_model=List[schemas.attendance.AttendanceSession])
 def read_attendance_history(
     db: Session = Depends(deps.get_db),
@@ -142,36 +203,25 @@ def read_attendance_history(
             .joinedload(models.TeachingAssignment.course),
         joinedload(models.AttendanceSession.assignment)
             .joinedload(models.TeachingAssignment.class_group),
-        joinedload(models.AttendanceSession.records)  # For student_count
     ).join(models.TeachingAssignment).filter(
         models.TeachingAssignment.professor_id == current_prof.id
     ).order_by(models.AttendanceSession.start_time.desc()).all()
     
     for session in sessions:
-        session.student_count = len(session.records)
+        session.student_count = session.attendance_count
         
     return sessions
 
 @router.get("/attendance/session/{session_id}", response_model=schemas.attendance.AttendanceSessionDetails)
-def read_session_details(
+async def read_session_details(
     session_id: int,
-    db: Session = Depends(deps.get_db),
-    current_prof: models.Professor = Depends(deps.get_current_active_professor),
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_prof: models.Professor = Depends(deps.get_current_active_professor_async),
 ):
     # Eagerly load records and the nested student for each record
-    session = db.query(models.AttendanceSession).options(
-        joinedload(models.AttendanceSession.records).joinedload(models.AttendanceRecord.student),
-        joinedload(models.AttendanceSession.assignment).joinedload(models.TeachingAssignment.course),
-        joinedload(models.AttendanceSession.assignment).joinedload(models.TeachingAssignment.class_group)
-    ).filter(models.AttendanceSession.id == session_id).first()
-
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-        
-    if session.assignment.professor_id != current_prof.id:
-         raise HTTPException(status_code=403, detail="Not authorized")
+    session = await get_owned_session(db, session_id, current_prof, with_records=True)
 
-    sync_session_headcount(session, db)
+    await sync_session_headcount(session, db)
     session.student_count = len(session.records)
     return session
 
@@ -195,22 +245,15 @@ async def websocket_session(websocket: WebSocket, session_id: int, token: str =
         ws_manager.disconnect(session_id, websocket)
 
 @router.post("/attendance/verify/{session_id}", response_model=schemas.attendance.HeadcountVerifyResponse)
-def verify_headcount(
+async def verify_headcount(
     session_id: int,
-    db: Session = Depends(deps.get_db),
-    current_prof: models.Professor = Depends(deps.get_current_active_professor),
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_prof: models.Professor = Depends(deps.get_current_active_professor_async),
 ):
-    session = db.query(models.AttendanceSession).options(
-        joinedload(models.AttendanceSession.records).joinedload(models.AttendanceRecord.student)
-    ).filter(models.AttendanceSession.id == session_id).first()
-    
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    if session.assignment.professor_id != current_prof.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
+    session = await get_owned_session(db, session_id, current_prof, with_records=True)
 
-    sync_session_headcount(session, db)
-    attendance_count = len(session.records)
+    await sync_session_headcount(session, db)
+    attendance_count = session.attendance_count
     headcount = session.headcount
     headcount_students = (headcount - 1) if headcount is not None else None
     
@@ -220,7 +263,7 @@ def verify_headcount(
     if is_match:
         session.is_verified = True
         session.verification_status = "MATCHED"
-        db.commit()
+        await db.commit()
     
     return schemas.attendance.HeadcountVerifyResponse(
         session_id=session.id,
@@ -233,33 +276,29 @@ def verify_headcount(
     )
 
 @router.post("/attendance/retake/{session_id}", response_model=schemas.attendance.AttendanceSession)
-def retake_attendance(
+async def retake_attendance(
     session_id: int,
-    db: Session = Depends(deps.get_db),
-    current_prof: models.Professor = Depends(deps.get_current_active_professor),
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_prof: models.Professor = Depends(deps.get_current_active_professor_async),
 ):
-    old_session = db.query(models.AttendanceSession).filter(
-        models.AttendanceSession.id == session_id
-    ).first()
-    if not old_session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    if old_session.assignment.professor_id != current_prof.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
+    old_session = await get_owned_session(db, session_id, current_prof)
     
     old_session.is_active = False
     old_session.end_time = datetime.now(timezone.utc)
+    if old_session.verification_status != "RETAKEN":
+        await db.run_sync(attendance_stats.session_retaken, old_session)
     old_session.verification_status = "RETAKEN"
     
     class_group = old_session.assignment.class_group
     if class_group:
         composite_classroom_id = f"{class_group.name}_{old_session.room_number}"
-        mqtt.send_beacon_command(command="stop_session", classroom_id=composite_classroom_id)
+        await run_in_threadpool(mqtt.send_beacon_command, command="stop_session", classroom_id=composite_classroom_id)
     
     duration_min = 5
     end_time = datetime.now(timezone.utc) + timedelta(minutes=duration_min)
     
     new_session = models.AttendanceSession(
-        assignment_id=old_session.assignment_id,
+        assignment=old_session.assignment,
         room_number=old_session.room_number,
         headcount=device_tracker.get_headcount(old_session.room_number),
         start_time=datetime.now(timezone.utc),
@@ -267,34 +306,42 @@ def retake_attendance(
         is_active=True
     )
     db.add(new_session)
-    db.commit()
-    db.refresh(new_session)
+    await db.run_sync(rollups.session_counted, new_session)
+    await db.run_sync(attendance_stats.session_held, new_session)
+    await db.commit()
+    code_registry.registry.close(old_session.id)
     
     if class_group:
         composite_classroom_id = f"{class_group.name}_{old_session.room_number}"
         try:
-            mqtt.send_beacon_command(
+            await run_in_threadpool(
+                mqtt.send_beacon_command,
                 command="start_session",
                 classroom_id=composite_classroom_id,
                 duration_minutes=duration_min,
                 session_id=new_session.id
             )
         except Exception as e:
-            db.delete(new_session)
-            db.commit()
+            await db.run_sync(rollups.session_counted, new_session, -1)
+            await db.run_sync(attendance_stats.session_held, new_session, -1)
+            await db.delete(new_session)
+            await db.commit()
             raise HTTPException(status_code=500, detail=f"Failed to start beacon: {str(e)}")
-    
+
+    await db.run_sync(code_registry.load_session, new_session, True)
     return new_session
 
 @router.delete("/attendance/record/{record_id}")
-def remove_attendance_record(
+async def remove_attendance_record(
     record_id: int,
-    db: Session = Depends(deps.get_db),
-    current_prof: models.Professor = Depends(deps.get_current_active_professor),
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_prof: models.Professor = Depends(deps.get_current_active_professor_async),
 ):
-    record = db.query(models.AttendanceRecord).filter(
-        models.AttendanceRecord.id == record_id
-    ).first()
+    record = (await db.execute(
+        select(models.AttendanceRecord).options(
+            joinedload(models.AttendanceRecord.session).joinedload(models.AttendanceSession.assignment)
+        ).filter(models.AttendanceRecord.id == record_id)
+    )).scalars().first()
     if not record:
         raise HTTPException(status_code=404, detail="Record not found")
     
@@ -303,14 +350,19 @@ def remove_attendance_record(
         raise HTTPException(status_code=403, detail="Not authorized")
     
     session_id = session.id
-    db.delete(record)
-    db.commit()
+    await db.run_sync(rollups.record_removed, record)
+    await db.run_sync(attendance_stats.record_removed, record)
+    await db.delete(record)
+    updated_count = (await db.execute(
+        update(models.AttendanceSession)
+        .where(models.AttendanceSession.id == session_id)
+        .values(attendance_count=models.AttendanceSession.attendance_count - 1)
+        .returning(models.AttendanceSession.attendance_count)
+        .execution_options(synchronize_session=False)
+    )).scalar_one()
+    await db.commit()
     
-    updated_count = db.query(models.AttendanceRecord).filter(
-        models.AttendanceRecord.session_id == session_id
-    ).count()
-    
-    ws_manager.broadcast_from_thread(session_id, {
+    await ws_manager.broadcast_to_session(session_id, {
         "type": "attendance_update",
         "session_id": session_id,
         "headcount": session.headcount,
@@ -320,21 +372,15 @@ def remove_attendance_record(
     return {"message": "Record removed", "attendance_count": updated_count}
 
 @router.post("/attendance/verify/{session_id}/save")
-def save_despite_mismatch(
+async def save_despite_mismatch(
     session_id: int,
-    db: Session = Depends(deps.get_db),
-    current_prof: models.Professor = Depends(deps.get_current_active_professor),
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_prof: models.Professor = Depends(deps.get_current_active_professor_async),
 ):
-    session = db.query(models.AttendanceSession).filter(
-        models.AttendanceSession.id == session_id
-    ).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    if session.assignment.professor_id != current_prof.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
+    session = await get_owned_session(db, session_id, current_prof)
     
     session.is_verified = True
     session.verification_status = "MISMATCH_SAVED"
-    db.commit()
+    await db.commit()
     
     return {"message": "Session saved despite mismatch", "verification_status": "MISMATCH_SAVED"}
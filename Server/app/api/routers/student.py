@@ -1,11 +1,20 @@
-from typing import List, Any
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import asyncio
+import logging
+from typing import List, Any, Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from datetime import datetime, timezone
 
 from app import models, schemas
 from app.api import deps
+from app.core import code_registry, attendance_writer, principal_cache, idempotency, security, database
+from app.core.config import settings
 from app.core.ws_manager import manager as ws_manager
+from app.core.device_tracker import tracker as device_tracker
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -17,77 +26,201 @@ def read_my_attendance(
     return current_student.attendance_records
 
 @router.post("/attendance/submit", response_model=schemas.attendance.AttendanceRecord)
-def submit_attendance(
+async def submit_attendance(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     submission: schemas.attendance.AttendanceRecordCreate,
-    current_student: models.Student = Depends(deps.get_current_active_student),
+    current_student: schemas.student.StudentPrincipal = Depends(deps.get_current_student_principal),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=128),
 ):
-    # 1. Device Security & First-Time Binding
     if not submission.device_uuid:
          raise HTTPException(status_code=400, detail="Device UUID is required")
 
+    # 0. Retries carrying the same Idempotency-Key get the stored response back
+    fingerprint = (submission.code, submission.device_uuid)
+    if idempotency_key:
+        try:
+            found, response = idempotency.cache.get(current_student.id, idempotency_key, fingerprint)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if found:
+            return response
+
+    # 1. Find the Active Session by Code (registry first, database on a miss)
+    active = code_registry.registry.lookup(submission.code)
+    if active is None:
+        session = (await db.execute(
+            select(models.AttendanceSession)
+            .options(selectinload(models.AttendanceSession.assignment))
+            .filter(
+                models.AttendanceSession.current_code == submission.code,
+                models.AttendanceSession.is_active == True
+            )
+        )).scalars().first()
+
+        if not session:
+            raise HTTPException(status_code=404, detail="Invalid or expired beacon code.")
+        active = await db.run_sync(code_registry.load_session, session)
+        if active is None:  # ended since it was read
+            raise HTTPException(status_code=404, detail="Invalid or expired beacon code.")
+
+    # Token claims may predate a device reset or class transfer: confirm against the database before rejecting
+    if current_student.from_claims and (
+        current_student.device_id not in (None, submission.device_uuid)
+        or active.class_group_id != current_student.class_group_id
+    ):
+        current_student = await deps.load_student_principal(db, current_student.id)
+        if not current_student:
+            raise HTTPException(status_code=404, detail="User not found")
+
+    # 2. Device Security & First-Time Binding
+    bind_device = None
     if current_student.device_id is None:
-        # First time use: Bind this device to the student
-        current_student.device_id = submission.device_uuid
-        db.add(current_student)
-        db.commit()
-        db.refresh(current_student)
+        # First time use: the writer binds this device in the same transaction as the record
+        bind_device = submission.device_uuid
     elif current_student.device_id != submission.device_uuid:
         # Security Mismatch
         raise HTTPException(status_code=401, detail="Unauthorized device. Please use your registered phone.")
 
-    # 2. Find the Active Session by Code
-    session = db.query(models.AttendanceSession).filter(
-        models.AttendanceSession.current_code == submission.code,
-        models.AttendanceSession.is_active == True
-    ).first()
-
-    if not session:
-        raise HTTPException(status_code=404, detail="Invalid or expired beacon code.")
-
     # 3. Validate Class Membership
-    if session.assignment.class_group_id != current_student.class_group_id:
+    if active.class_group_id != current_student.class_group_id:
          raise HTTPException(status_code=403, detail="You do not belong to this class group.")
 
-    # 4. Check for Duplicate Submission
-    existing = db.query(models.AttendanceRecord).filter(
-        models.AttendanceRecord.session_id == session.id,
-        models.AttendanceRecord.student_id == current_student.id
-    ).first()
-    
-    if existing:
-        return existing
-
-    # 5. Create Attendance Record
-    record = models.AttendanceRecord(
-        session_id=session.id,
+    # 4. Queue the record for the next batched write and wait for it to be committed.
+    # Duplicate submissions resolve to the record already stored for this session.
+    pending = attendance_writer.PendingSubmission(
+        session_id=active.session_id,
         student_id=current_student.id,
-        status="PRESENT",
+        student_name=current_student.name,
+        digital_id=current_student.digital_id,
+        room_number=active.room_number,
         rssi_strength=submission.rssi,
-        timestamp=datetime.now(timezone.utc)
+        timestamp=datetime.now(timezone.utc),
+        bind_device=bind_device,
+        broadcast=False,
+    )
+    try:
+        result = await asyncio.wait_for(
+            asyncio.wrap_future(attendance_writer.writer.submit(pending)),
+            timeout=settings.ATTENDANCE_WRITE_TIMEOUT_SECONDS,
+        )
+    except attendance_writer.DeviceBindingConflict:
+        raise HTTPException(status_code=401, detail="Unauthorized device. Please use your registered phone.")
+    except Exception as e:
+        logger.error(f"Attendance write failed for student {current_student.id}: {e}")
+        raise HTTPException(status_code=503, detail="Attendance could not be recorded. Please try again.")
+
+    if bind_device:
+        principal_cache.cache.invalidate("student", current_student.id)
+        current_student = current_student.model_copy(update={"device_id": bind_device})
+
+    if result.created:
+        await ws_manager.broadcast_to_session(active.session_id, {
+            "type": "attendance_update",
+            "session_id": active.session_id,
+            "headcount": device_tracker.get_headcount(active.room_number),
+            "attendance_count": result.attendance_count,
+            "new_record": {
+                "id": result.id,
+                "student_name": current_student.name,
+                "student_id": current_student.id,
+                "digital_id": current_student.digital_id,
+                "timestamp": result.timestamp.isoformat() if result.timestamp else None,
+                "status": result.status
+            }
+        })
+
+    response = {
+        "id": result.id,
+        "student_id": result.student_id,
+        "status": result.status,
+        "timestamp": result.timestamp,
+        "rssi_strength": result.rssi_strength,
+        "student": current_student,
+    }
+    if idempotency_key:
+        idempotency.cache.put(current_student.id, idempotency_key, fingerprint, response)
+    return response
+
+@router.get("/receipt-key")
+async def read_receipt_key(
+    device_uuid: str = Query(..., min_length=1),
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_student: schemas.student.StudentPrincipal = Depends(deps.get_current_student_principal),
+):
+    """
+    Key for signing offline receipts, issued to the student's registered device;
+    the app fetches it while online and keeps it. A device reset revokes it.
+    """
+    Student = models.Student
+    # First use binds the device, as a first submission would
+    bound = (await db.execute(
+        update(Student).where(Student.id == current_student.id, Student.device_id.is_(None))
+        .values(device_id=device_uuid).execution_options(synchronize_session=False)
+    )).rowcount
+    # Concurrent first fetches all get the key stored first
+    await db.execute(
+        update(Student).where(Student.id == current_student.id, Student.device_id == device_uuid, Student.receipt_key.is_(None))
+        .values(receipt_key=security.new_receipt_key()).execution_options(synchronize_session=False)
     )
-    db.add(record)
-    db.commit()
-    db.refresh(record)
-    
-    attendance_count = db.query(models.AttendanceRecord).filter(
-        models.AttendanceRecord.session_id == session.id
-    ).count()
-
-    ws_manager.broadcast_from_thread(session.id, {
-        "type": "attendance_update",
-        "session_id": session.id,
-        "headcount": session.headcount,
-        "attendance_count": attendance_count,
-        "new_record": {
-            "id": record.id,
-            "student_name": current_student.name,
-            "student_id": current_student.id,
-            "digital_id": current_student.digital_id,
-            "timestamp": record.timestamp.isoformat() if record.timestamp else None,
-            "status": record.status
-        }
-    })
-    
-    return record
\ No newline at end of file
+    row = (await db.execute(
+        select(Student.device_id, Student.receipt_key).where(Student.id == current_student.id)
+    )).one_or_none()
+    await db.commit()
+    if bound:
+        principal_cache.cache.invalidate("student", current_student.id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if row.device_id != device_uuid:
+        raise HTTPException(status_code=401, detail="Unauthorized device. Please use your registered phone.")
+    return {
+        "key": row.receipt_key,
+        "algorithm": "HMAC-SHA256",
+        "message": "code|device_uuid|unix_seconds",
+    }
+
+@router.post("/attendance/receipts", status_code=202)
+async def upload_offline_receipts(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    receipts: List[schemas.attendance.OfflineReceiptCreate],
+    current_student: schemas.student.StudentPrincipal = Depends(deps.get_current_student_principal),
+):
+    """
+    Queues signed receipts for codes seen while the network was unavailable.
+    They are verified in the background; poll GET /attendance/receipts for the outcome.
+    """
+    if len(receipts) > settings.OFFLINE_RECEIPT_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {settings.OFFLINE_RECEIPT_BATCH_SIZE} receipts per upload")
+    if receipts:
+        await db.execute(
+            database.dialect_insert(models.OfflineReceipt).on_conflict_do_nothing(
+                index_elements=["student_id", "signature"]
+            ),
+            [
+                {
+                    "student_id": current_student.id,
+                    "code": receipt.code,
+                    "device_uuid": receipt.device_uuid,
+                    "claimed_at": receipt.claimed_at,
+                    "signature": receipt.signature,
+                    "rssi_strength": receipt.rssi,
+                    "status": "PENDING",
+                }
+                for receipt in receipts
+            ],
+        )
+        await db.commit()
+    return {"queued": len(receipts)}
+
+@router.get("/attendance/receipts", response_model=List[schemas.attendance.OfflineReceipt])
+async def read_offline_receipts(
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_student: schemas.student.StudentPrincipal = Depends(deps.get_current_student_principal),
+):
+    return (await db.execute(
+        select(models.OfflineReceipt)
+        .filter(models.OfflineReceipt.student_id == current_student.id)
+        .order_by(models.OfflineReceipt.id.desc())
+        .limit(100)
+    )).scalars().all()
@@ -0,0 +1,182 @@
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Hashable, Optional
+
+from fastapi import HTTPException, Request
+
+from app.core.config import settings
+from app.core.code_registry import registry as code_registry
+
+logger = logging.getLogger(__name__)
+
+_EWMA_ALPHA = 0.2
+_INITIAL_SERVICE_SECONDS = 0.05
+
+
+class AdmissionController:
+    """
+    Bounds concurrent student requests and sheds load before it queues up.
+
+    At most `max_in_flight` requests run at once; the rest wait in per-session
+    queues that are drained round-robin, so a full lecture hall cannot push a
+    small room to the back of one long line. A new request is turned away with
+    429 and a Retry-After when its estimated wait (queue position times the
+    moving average of service time) would exceed `latency_budget_ms`, or when
+    its session already holds its fair share of the queue. A room below its
+    share still gets in on a full queue by displacing the newest waiter of the
+    busiest session.
+
+    Runs on the event loop only, so no locking is needed.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, latency_budget_ms: int):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.latency_budget = latency_budget_ms / 1000
+        self.in_flight = 0
+        self.queued = 0
+        self.service_time = _INITIAL_SERVICE_SECONDS  # EWMA, seconds
+        self._waiters: OrderedDict[Hashable, deque[asyncio.Future]] = OrderedDict()  # session key -> waiters
+
+        # Metrics
+        self.admitted = 0
+        self.rejected_budget = 0
+        self.rejected_fairness = 0
+        self.max_queued = 0
+
+    def estimated_wait(self, position: int) -> float:
+        return position * self.service_time / self.max_in_flight
+
+    def capacity(self) -> int:
+        """Queue length that can still be served within the latency budget."""
+        return min(self.max_queue, int(self.latency_budget * self.max_in_flight / self.service_time))
+
+    def _busy(self, wait: float, reason: str) -> HTTPException:
+        retry_after = max(1, math.ceil(wait))
+        return HTTPException(
+            status_code=429,
+            detail=f"Server busy ({reason}). Retry in {retry_after}s.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    def _shed_largest(self, key: Hashable, own_waiters: int) -> bool:
+        """Turns away the newest waiter of the session hogging the queue, if there is one."""
+        largest = max(
+            (k for k in self._waiters if k != key), key=lambda k: len(self._waiters[k]), default=None
+        )
+        if largest is None or len(self._waiters[largest]) <= own_waiters + 1:
+            return False
+        waiters = self._waiters[largest]
+        future = waiters.pop()
+        self.queued -= 1
+        if not waiters:
+            del self._waiters[largest]
+        self.rejected_fairness += 1
+        future.set_exception(self._busy(self.estimated_wait(self.queued), "session over its share"))
+        return True
+
+    async def acquire(self, key: Hashable):
+        if self.in_flight < self.max_in_flight and not self.queued:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        waiters = self._waiters.get(key)
+        own = len(waiters) if waiters else 0
+        sessions = len(self._waiters) + (0 if waiters else 1)
+        fair_share = max(1, self.capacity() // sessions)
+        if own >= fair_share:
+            self.rejected_fairness += 1
+            raise self._busy(self.estimated_wait(own * sessions), "session over its share")
+
+        if self.queued >= self.capacity() and not self._shed_largest(key, own):
+            self.rejected_budget += 1
+            raise self._busy(self.estimated_wait(self.queued + 1), "queue over latency budget")
+
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.get(key)  # shedding may have emptied another session's queue, not ours
+        if waiters is None:
+            waiters = self._waiters[key] = deque()
+        waiters.append(future)
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Client went away while queued; a slot handed over in the meantime goes to the next waiter
+            if future.done() and not future.cancelled():
+                self.release(None)
+            else:
+                self._discard(key, future)
+            raise
+        self.admitted += 1
+
+    def release(self, service_seconds: Optional[float]):
+        if service_seconds is not None:
+            self.service_time += _EWMA_ALPHA * (service_seconds - self.service_time)
+        # Hand the slot straight to the next session in round-robin order
+        while self._waiters:
+            key, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self._waiters.move_to_end(key)
+            else:
+                del self._waiters[key]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _discard(self, key: Hashable, future: asyncio.Future):
+        waiters = self._waiters.get(key)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self._waiters[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "queued_sessions": len(self._waiters),
+            "max_queued": self.max_queued,
+            "service_time_ms_ewma": self.service_time * 1000,
+            "admitted": self.admitted,
+            "rejected_budget": self.rejected_budget,
+            "rejected_fairness": self.rejected_fairness,
+        }
+
+
+controller = AdmissionController(
+    max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    latency_budget_ms=settings.ADMISSION_LATENCY_BUDGET_MS,
+)
+
+
+async def _session_key(request: Request) -> Optional[int]:
+    """Fairness key: the session a submission's beacon code belongs to, if known."""
+    if request.method != "POST" or not request.headers.get("content-type", "").startswith("application/json"):
+        return None
+    try:
+        body = await request.json()  # cached on the request, the endpoint reuses it
+    except ValueError:
+        return None
+    code = body.get("code") if isinstance(body, dict) else None
+    active = code_registry.lookup(code) if isinstance(code, str) else None
+    return active.session_id if active else None
+
+
+async def admit(request: Request):
+    """Router dependency: waits for an admission slot or raises 429."""
+    await controller.acquire(await _session_key(request))
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        controller.release(time.perf_counter() - started)
@@ -0,0 +1,162 @@
+import logging
+
+from sqlalchemy import and_, case, delete, func, insert, literal, or_, select, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core import database
+
+logger = logging.getLogger(__name__)
+
+Stat = models.StudentAttendanceStat
+
+
+def session_held(db: Session, session: models.AttendanceSession, delta: int = 1) -> None:
+    """
+    Counts a started session as held for every current student of its class group
+    (delta=1), or takes that back for a session that was retaken or discarded
+    (delta=-1). Held is counted at start rather than at close so that a session
+    left to run out is still counted and percentages never pass 100% mid-session.
+    Caller commits.
+    """
+    assignment = session.assignment
+    students = select(models.Student.id).where(
+        models.Student.class_group_id == assignment.class_group_id, models.Student.deleted_at.is_(None)
+    )
+    if delta < 0:
+        db.execute(
+            update(Stat)
+            .where(Stat.assignment_id == assignment.id, Stat.student_id.in_(students))
+            .values(sessions_held=Stat.sessions_held + delta)
+            .execution_options(synchronize_session=False)
+        )
+        return
+    stmt = database.dialect_insert(Stat.__table__).from_select(
+        ["student_id", "assignment_id", "sessions_held", "sessions_attended"],
+        students.add_columns(literal(assignment.id), literal(delta), literal(0)),
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["student_id", "assignment_id"],
+        set_={"sessions_held": Stat.__table__.c.sessions_held + stmt.excluded.sessions_held},
+    ))
+
+
+def records_added(db: Session, pairs: list[tuple[int, int]]) -> None:
+    """Counts one attended session per newly recorded (session_id, student_id) pair, skipping retaken sessions. Caller commits."""
+    if not pairs:
+        return
+    assignments = dict(
+        db.query(models.AttendanceSession.id, models.AttendanceSession.assignment_id)
+        .filter(models.AttendanceSession.id.in_({session_id for session_id, _ in pairs}), _not_retaken())
+    )
+    changes: dict[tuple[int, int], int] = {}
+    for session_id, student_id in pairs:
+        assignment_id = assignments.get(session_id)
+        if assignment_id is not None:
+            changes[(student_id, assignment_id)] = changes.get((student_id, assignment_id), 0) + 1
+    _bump_attended(db, changes)
+
+
+def record_removed(db: Session, record: models.AttendanceRecord) -> None:
+    """Takes back the attended session of a removed record; its session must be loaded. Caller commits."""
+    if record.status == "PRESENT" and record.session.verification_status != "RETAKEN":
+        _bump_attended(db, {(record.student_id, record.session.assignment_id): -1})
+
+
+def session_retaken(db: Session, session: models.AttendanceSession) -> None:
+    """Takes back a retaken session: not held, and not attended by whoever was marked present in it. Caller commits."""
+    session_held(db, session, -1)
+    present = db.query(models.AttendanceRecord.student_id).filter(
+        models.AttendanceRecord.session_id == session.id, models.AttendanceRecord.status == "PRESENT"
+    )
+    _bump_attended(db, {(student_id, session.assignment_id): -1 for (student_id,) in present})
+
+
+def _bump_attended(db: Session, changes: dict[tuple[int, int], int]) -> None:
+    if not changes:
+        return
+    table = Stat.__table__
+    stmt = database.dialect_insert(table)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["student_id", "assignment_id"],
+            set_={"sessions_attended": table.c.sessions_attended + stmt.excluded.sessions_attended},
+        ),
+        [
+            {"student_id": student_id, "assignment_id": assignment_id, "sessions_held": 0, "sessions_attended": delta}
+            for (student_id, assignment_id), delta in changes.items()
+        ],
+    )
+
+
+def _not_retaken():
+    status = models.AttendanceSession.verification_status
+    return or_(status.is_(None), status != "RETAKEN")
+
+
+def eligibility_query(threshold: float, defaulters_only: bool = False):
+    """
+    Students' attendance per assignment with percentage and eligibility against
+    `threshold` (percent). Callers add their filters (assignment, course, class
+    group), ordering and paging.
+    """
+    percentage = case(
+        (Stat.sessions_held == 0, 100.0),
+        else_=Stat.sessions_attended * 100.0 / Stat.sessions_held,
+    )
+    eligible = Stat.sessions_attended * 100.0 >= Stat.sessions_held * threshold
+    query = (
+        select(
+            Stat.student_id,
+            models.Student.digital_id,
+            models.Student.name.label("student_name"),
+            Stat.assignment_id,
+            models.Course.code.label("course_code"),
+            models.Course.name.label("course_name"),
+            models.TeachingAssignment.class_group_id,
+            Stat.sessions_held,
+            Stat.sessions_attended,
+            percentage.label("percentage"),
+            eligible.label("eligible"),
+        )
+        .join(models.Student, Stat.student_id == models.Student.id)
+        .join(models.TeachingAssignment, Stat.assignment_id == models.TeachingAssignment.id)
+        .join(models.Course, models.TeachingAssignment.course_id == models.Course.id)
+        .where(models.Student.deleted_at.is_(None))
+    )
+    if defaulters_only:
+        query = query.where(~eligible)
+    return query
+
+
+def rebuild(db: Session) -> int:
+    """
+    Recomputes every row from sessions and records (backfill, repair). Held counts
+    the assignment's sessions that were not retaken, for the students now in its
+    class group. Returns the row count.
+    """
+    AttendanceSession, Record = models.AttendanceSession, models.AttendanceRecord
+    totals = (
+        select(
+            models.Student.id,
+            models.TeachingAssignment.id,
+            func.count(AttendanceSession.id),
+            func.count(Record.id),
+        )
+        .join(models.TeachingAssignment, models.TeachingAssignment.class_group_id == models.Student.class_group_id)
+        .join(AttendanceSession, and_(AttendanceSession.assignment_id == models.TeachingAssignment.id, _not_retaken()))
+        .outerjoin(Record, and_(
+            Record.session_id == AttendanceSession.id,
+            Record.student_id == models.Student.id,
+            Record.status == "PRESENT",
+        ))
+        .where(models.Student.deleted_at.is_(None))
+        .group_by(models.Student.id, models.TeachingAssignment.id)
+    )
+    db.execute(delete(Stat))
+    rows = db.execute(insert(Stat).from_select(
+        ["student_id", "assignment_id", "sessions_held", "sessions_attended"], totals
+    )).rowcount
+    db.commit()
+    logger.info(f"Rebuilt {rows} student attendance stat rows")
+    return rows
@@ -0,0 +1,351 @@
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import update, bindparam, tuple_
+
+from app import models
+from app.core import database, rollups, attendance_stats
+from app.core.config import settings
+from app.core.ws_manager import manager as ws_manager
+from app.core.device_tracker import tracker as device_tracker
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class DeviceBindingConflict(Exception):
+    """Another device was bound to the student before this submission's binding committed."""
+
+
+class PendingSubmission:
+    """A validated submission waiting for the next batch flush."""
+
+    def __init__(
+        self,
+        session_id: int,
+        student_id: int,
+        student_name: str,
+        digital_id: int,
+        room_number: Optional[str],
+        rssi_strength: Optional[float],
+        timestamp: datetime,
+        status: str = "PRESENT",
+        bind_device: Optional[str] = None,
+        broadcast: bool = True,
+        claimed_at: Optional[datetime] = None,
+    ):
+        self.session_id = session_id
+        self.student_id = student_id
+        self.student_name = student_name
+        self.digital_id = digital_id
+        self.room_number = room_number
+        self.rssi_strength = rssi_strength
+        self.timestamp = timestamp
+        self.status = status
+        self.bind_device = bind_device  # device to bind if the student has none yet
+        self.broadcast = broadcast  # False when the (async) caller notifies the session itself
+        self.claimed_at = claimed_at  # phone's time, for submissions from offline receipts
+        self.future: Future = Future()
+
+
+class IngestResult:
+    """Outcome of a submission once its batch has been committed."""
+
+    def __init__(self, id: int, session_id: int, student_id: int, status: str,
+                 timestamp: datetime, rssi_strength: Optional[float], created: bool, attendance_count: int):
+        self.id = id
+        self.session_id = session_id
+        self.student_id = student_id
+        self.status = status
+        self.timestamp = timestamp
+        self.rssi_strength = rssi_strength
+        self.created = created
+        self.attendance_count = attendance_count
+
+
+class AttendanceWriter:
+    """
+    Write-behind ingestion stage for AttendanceRecord rows.
+
+    Request threads enqueue validated submissions and wait on a Future. A single
+    background thread drains the queue and commits everything that arrived within
+    `flush_interval_ms` (or `max_batch_size` records) as one multi-row INSERT, so
+    a burst of submissions costs one SQLite write transaction instead of one each.
+    """
+
+    def __init__(self, max_batch_size: int, flush_interval_ms: int):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+        # Metrics
+        self.batches_flushed = 0
+        self.records_written = 0
+        self.duplicates = 0
+        self.failed_batches = 0
+        self.failed_submissions = 0
+        self.max_batch_seen = 0
+        self._flush_latencies: deque[float] = deque(maxlen=1000)  # seconds
+        self._batch_sizes: deque[int] = deque(maxlen=1000)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+        self._thread.start()
+        logger.info(f"Attendance writer started (batch <= {self.max_batch_size}, every {self.flush_interval * 1000:.0f} ms)")
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        logger.info("Attendance writer stopped")
+
+    def submit(self, submission: PendingSubmission) -> Future:
+        if not self._thread or not self._thread.is_alive():
+            raise RuntimeError("Attendance writer is not running")
+        self._queue.put(submission)
+        return submission.future
+
+    def stats(self) -> dict:
+        latencies = sorted(self._flush_latencies)
+        sizes = list(self._batch_sizes)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches_flushed": self.batches_flushed,
+            "failed_batches": self.failed_batches,
+            "failed_submissions": self.failed_submissions,
+            "records_written": self.records_written,
+            "duplicates": self.duplicates,
+            "batch_size_avg": (sum(sizes) / len(sizes)) if sizes else 0.0,
+            "batch_size_max": self.max_batch_seen,
+            "flush_latency_ms_avg": (sum(latencies) / len(latencies) * 1000) if latencies else 0.0,
+            "flush_latency_ms_p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000 if latencies else 0.0,
+            "flush_latency_ms_max": latencies[-1] * 1000 if latencies else 0.0,
+        }
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stopping:
+                return
+
+    def _flush(self, batch: list[PendingSubmission]):
+        # Callers that timed out before pickup cancelled their future; skip those
+        batch = [pending for pending in batch if pending.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.perf_counter()
+        outcomes = [(batch, self._try_commit(batch))]
+        if isinstance(outcomes[0][1], Exception):
+            self.failed_batches += 1
+            if len(batch) > 1:
+                # One bad row (e.g. a session deleted while its code was still registered)
+                # must not fail everyone else's submission: retry them one at a time
+                logger.warning(f"Attendance batch of {len(batch)} failed ({outcomes[0][1]}); retrying its submissions one by one")
+                outcomes = [([pending], self._try_commit([pending])) for pending in batch]
+
+        elapsed = time.perf_counter() - started
+        self.batches_flushed += 1
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self._flush_latencies.append(elapsed)
+        self._batch_sizes.append(len(batch))
+
+        for part, outcome in outcomes:
+            if isinstance(outcome, Exception):
+                self.failed_submissions += len(part)
+                logger.error(f"Attendance write for student {part[0].student_id} in session {part[0].session_id} failed: {outcome}", exc_info=outcome)
+                for pending in part:
+                    pending.future.set_exception(outcome)
+                continue
+            results, created, rejected = outcome
+            self.records_written += len(created)
+            self.duplicates += len(part) - len(created) - len(rejected)
+            for pending in part:
+                self._resolve(pending, results, rejected)
+            for pending in created:
+                if pending.broadcast:
+                    self._broadcast(pending, results)
+
+    def _try_commit(self, batch: list[PendingSubmission]):
+        """Writes and commits `batch`; returns _write's outcome, or the exception instead of raising it."""
+        db = database.SessionLocal()
+        try:
+            return self._write(db, batch)
+        except Exception as e:
+            db.rollback()
+            return e
+        finally:
+            db.close()
+
+    @staticmethod
+    def _resolve(pending: PendingSubmission, results: dict, rejected: set):
+        # Never leave a caller waiting on its future, whatever goes wrong here
+        try:
+            if pending in rejected:
+                pending.future.set_exception(DeviceBindingConflict(pending.student_id))
+            else:
+                pending.future.set_result(results[(pending.session_id, pending.student_id)])
+        except Exception as e:
+            logger.error(f"Attendance result for student {pending.student_id} in session {pending.session_id} missing: {e!r}")
+            if not pending.future.done():
+                pending.future.set_exception(RuntimeError("Attendance record was not written"))
+
+    @staticmethod
+    def _broadcast(pending: PendingSubmission, results: dict):
+        try:
+            result = results[(pending.session_id, pending.student_id)]
+            ws_manager.broadcast_from_thread(result.session_id, {
+                "type": "attendance_update",
+                "session_id": result.session_id,
+                "headcount": device_tracker.get_headcount(pending.room_number),
+                "attendance_count": result.attendance_count,
+                "new_record": {
+                    "id": result.id,
+                    "student_name": pending.student_name,
+                    "student_id": pending.student_id,
+                    "digital_id": pending.digital_id,
+                    "timestamp": result.timestamp.isoformat() if result.timestamp else None,
+                    "status": result.status
+                }
+            })
+        except Exception as e:
+            logger.error(f"Attendance broadcast for session {pending.session_id} failed: {e}")
+
+    def _write(self, db, batch: list[PendingSubmission]):
+        rejected: set[PendingSubmission] = set()
+
+        # First-time device binding commits in the same transaction as the record
+        bindings: dict[int, str] = {}
+        for pending in batch:
+            if pending.bind_device:
+                bindings.setdefault(pending.student_id, pending.bind_device)
+        if bindings:
+            students = models.Student.__table__
+            db.execute(
+                update(students)
+                .where(students.c.id == bindparam("student_id"), students.c.device_id.is_(None))
+                .values(device_id=bindparam("device_id")),
+                [{"student_id": student_id, "device_id": device_id} for student_id, device_id in bindings.items()],
+            )
+            bound = dict(
+                db.query(models.Student.id, models.Student.device_id).filter(models.Student.id.in_(bindings))
+            )
+            rejected = {
+                pending for pending in batch
+                if pending.bind_device and bound.get(pending.student_id) != pending.bind_device
+            }
+
+        # Collapse repeated submissions inside the batch onto the first one
+        unique: dict[tuple[int, int], PendingSubmission] = {}
+        for pending in batch:
+            if pending not in rejected:
+                unique.setdefault((pending.session_id, pending.student_id), pending)
+
+        Record = models.AttendanceRecord
+        inserted: dict[tuple[int, int], int] = {}
+        if unique:
+            stmt = database.dialect_insert(Record).on_conflict_do_nothing(
+                index_elements=["session_id", "student_id"]
+            ).returning(Record.id, Record.session_id, Record.student_id)
+            rows = db.execute(stmt, [
+                {
+                    "session_id": pending.session_id,
+                    "student_id": pending.student_id,
+                    "status": pending.status,
+                    "rssi_strength": pending.rssi_strength,
+                    "timestamp": pending.timestamp,
+                    "claimed_at": pending.claimed_at,
+                }
+                for pending in unique.values()
+            ])
+            inserted = {(row.session_id, row.student_id): row.id for row in rows}
+
+        # Only submissions that hit the unique index need their stored record read back
+        conflicts = [key for key in unique if key not in inserted]
+        existing = {}
+        if conflicts:
+            existing = {
+                (row.session_id, row.student_id): row
+                for row in db.query(
+                    Record.id, Record.session_id, Record.student_id, Record.status, Record.timestamp, Record.rssi_strength
+                ).filter(tuple_(Record.session_id, Record.student_id).in_(conflicts))
+            }
+
+        # Keep the denormalized per-session counter and the daily rollups in step with the rows just inserted
+        new_per_session: dict[int, int] = {}
+        present_per_session: dict[int, int] = {}
+        for key in inserted:
+            session_id = key[0]
+            new_per_session[session_id] = new_per_session.get(session_id, 0) + 1
+            if unique[key].status == "PRESENT":
+                present_per_session[session_id] = present_per_session.get(session_id, 0) + 1
+        if new_per_session:
+            sessions = models.AttendanceSession.__table__
+            db.execute(
+                update(sessions)
+                .where(sessions.c.id == bindparam("session_key"))
+                .values(attendance_count=sessions.c.attendance_count + bindparam("added")),
+                [{"session_key": session_id, "added": added} for session_id, added in new_per_session.items()],
+            )
+            rollups.records_added(db, {
+                session_id: (added, present_per_session.get(session_id, 0))
+                for session_id, added in new_per_session.items()
+            })
+            attendance_stats.records_added(db, [key for key in inserted if unique[key].status == "PRESENT"])
+
+        session_ids = {session_id for session_id, _ in unique}
+        counts = dict(
+            db.query(models.AttendanceSession.id, models.AttendanceSession.attendance_count)
+            .filter(models.AttendanceSession.id.in_(session_ids))
+            .all()
+        ) if session_ids else {}
+        db.commit()
+
+        results: dict[tuple[int, int], IngestResult] = {}
+        for key, row in existing.items():
+            # Stored naive UTC; hand it back aware like a created record's, so both serialize the same way
+            timestamp = row.timestamp.replace(tzinfo=timezone.utc) if row.timestamp else None
+            results[key] = IngestResult(row.id, row.session_id, row.student_id, row.status,
+                                        timestamp, row.rssi_strength, False, counts.get(row.session_id, 0))
+        created = [unique[key] for key in inserted]
+        for pending in created:
+            key = (pending.session_id, pending.student_id)
+            results[key] = IngestResult(
+                inserted[key], pending.session_id, pending.student_id, pending.status,
+                pending.timestamp, pending.rssi_strength, True, counts.get(pending.session_id, 0))
+        return results, created, rejected
+
+
+writer = AttendanceWriter(
+    max_batch_size=settings.ATTENDANCE_BATCH_MAX_SIZE,
+    flush_interval_ms=settings.ATTENDANCE_BATCH_INTERVAL_MS,
+)
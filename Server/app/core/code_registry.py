@@ -0,0 +1,161 @@
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ActiveSession:
+    def __init__(self, session_id: int, class_group_id: int, room_number: Optional[str]):
+        self.session_id = session_id
+        self.class_group_id = class_group_id
+        self.room_number = room_number
+        self.current_code: Optional[str] = None
+        self.previous_code: Optional[str] = None
+        self.previous_code_expires_at: float = 0.0
+
+
+class ActiveCodeRegistry:
+    """
+    In-process index of active attendance sessions keyed by beacon code.
+
+    Student submissions resolve a code here instead of querying
+    AttendanceSession and lazy-loading its assignment. The previous code of a
+    session stays valid for ACTIVE_CODE_GRACE_SECONDS after a rotation.
+
+    Ended sessions are closed once their end is committed and stay tombstoned, so
+    a request that read the session as active just before can't register it again.
+    """
+
+    def __init__(self, grace_seconds: float):
+        self.grace_seconds = grace_seconds
+        self.sessions: dict[int, ActiveSession] = {}  # session_id -> ActiveSession
+        self.codes: dict[str, int] = {}  # current code -> session_id
+        self.previous_codes: dict[str, int] = {}  # rotated-out code -> session_id
+        self.closed: set[int] = set()  # ended session ids, never registered again
+        self._lock = threading.Lock()
+
+    def register(
+        self,
+        session_id: int,
+        class_group_id: int,
+        room_number: Optional[str],
+        code: Optional[str] = None,
+        new: bool = False,
+    ) -> bool:
+        """Registers a session unless it was closed. `new` clears the tombstone of a deleted session whose id was reused."""
+        with self._lock:
+            if new:
+                self.closed.discard(session_id)
+            elif session_id in self.closed:
+                return False
+            self._remove(session_id)
+            entry = ActiveSession(session_id, class_group_id, room_number)
+            self.sessions[session_id] = entry
+            if code:
+                entry.current_code = code
+                self.codes[code] = session_id
+        logger.info(f"Registered session {session_id} (class group {class_group_id})")
+        return True
+
+    def close(self, *session_ids: int):
+        """Drops ended sessions for good. Call after their end is committed."""
+        with self._lock:
+            for session_id in session_ids:
+                self.closed.add(session_id)
+                self._remove(session_id)
+
+    def rotate(self, session_id: int, code: str) -> bool:
+        """Makes `code` the current code of a registered session. Returns False if unknown."""
+        with self._lock:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return False
+            if entry.current_code == code:
+                return True
+            if entry.current_code:
+                self.codes.pop(entry.current_code, None)
+                if entry.previous_code:
+                    self.previous_codes.pop(entry.previous_code, None)
+                entry.previous_code = entry.current_code
+                entry.previous_code_expires_at = time.monotonic() + self.grace_seconds
+                self.previous_codes[entry.previous_code] = session_id
+            entry.current_code = code
+            self.codes[code] = session_id
+            return True
+
+    def lookup(self, code: str) -> Optional[ActiveSession]:
+        """Resolves a current code, or a previous code still inside its grace window."""
+        with self._lock:
+            session_id = self.codes.get(code)
+            if session_id is not None:
+                return self.sessions.get(session_id)
+
+            session_id = self.previous_codes.get(code)
+            if session_id is None:
+                return None
+            entry = self.sessions.get(session_id)
+            if entry is None or entry.previous_code != code:
+                self.previous_codes.pop(code, None)
+                return None
+            if time.monotonic() > entry.previous_code_expires_at:
+                self.previous_codes.pop(code, None)
+                return None
+            return entry
+
+    def get(self, session_id: int) -> Optional[ActiveSession]:
+        with self._lock:
+            return self.sessions.get(session_id)
+
+    def _remove(self, session_id: int):
+        entry = self.sessions.pop(session_id, None)
+        if entry is None:
+            return
+        if entry.current_code and self.codes.get(entry.current_code) == session_id:
+            del self.codes[entry.current_code]
+        if entry.previous_code and self.previous_codes.get(entry.previous_code) == session_id:
+            del self.previous_codes[entry.previous_code]
+
+
+def load_session(db: Session, session: models.AttendanceSession, new: bool = False) -> Optional[ActiveSession]:
+    """
+    Registers an active session from the database (used on start, with new=True, and
+    on cache misses). None if the session has been closed meanwhile.
+    """
+    if not registry.register(session.id, session.assignment.class_group_id, session.room_number,
+                             code=session.current_code, new=new):
+        return None
+    return registry.get(session.id)
+
+
+def end_sessions(db: Session, *criteria) -> list[int]:
+    """
+    Ends the active sessions of the teaching assignments matching `criteria` (e.g.
+    a professor or course being deleted). Returns the session ids; the caller
+    commits, then closes them in the registry so their codes stop resolving at once
+    instead of being reloaded on a cache miss until the rows are gone.
+    """
+    session_ids = list(db.scalars(
+        select(models.AttendanceSession.id)
+        .join(models.TeachingAssignment, models.AttendanceSession.assignment_id == models.TeachingAssignment.id)
+        .where(models.AttendanceSession.is_active == True, *criteria)
+    ))
+    if session_ids:
+        db.execute(
+            update(models.AttendanceSession)
+            .where(models.AttendanceSession.id.in_(session_ids))
+            .values(is_active=False, end_time=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+    return session_ids
+
+
+registry = ActiveCodeRegistry(grace_seconds=settings.ACTIVE_CODE_GRACE_SECONDS)
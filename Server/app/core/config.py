@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import AnyHttpUrl, field_validator
-from typing import List, Union
+from typing import List, Literal, Optional, Union
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "AURA Server"
@@ -10,6 +10,34 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8 # 8 days
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 10000
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 300
+    # Embed class group, device and profile claims in student tokens so attendance
+    # submission can authorize without a database read. Admin changes are only
+    # seen by the worker that made them, so keep this off with multiple workers.
+    TOKEN_PRINCIPAL_CLAIMS: bool = False
+    PASSWORD_HASH_WORKERS: int = 2 # bcrypt processes; 0 hashes in the calling thread
+    PASSWORD_HASH_MAX_PENDING: int = 256 # Logins beyond this many queued hashes get 503
+
+    # ROSTER IMPORTS
+    IMPORT_CHUNK_SIZE: int = 1000 # CSV rows hashed and inserted per transaction
+    IMPORT_JOBS_RETAINED: int = 50 # Finished import jobs kept for the status endpoint
+
+    # SOFT DELETE PURGE
+    PURGE_INTERVAL_SECONDS: int = 30 # How often soft-deleted rows are physically removed
+    PURGE_CHUNK_SIZE: int = 2000 # Rows deleted per transaction, so live writes are never blocked for long
+
+    # EXPORTS
+    EXPORT_CHUNK_SIZE: int = 5000 # Rows fetched and encoded at a time while streaming an export
+    EXPORT_ARTIFACT_DIR: str = "./exports" # Where background export jobs keep their files for reuse
+    EXPORT_ARTIFACT_RETENTION_HOURS: float = 24 # Artifacts not downloaded or reused for this long are deleted
+    EXPORT_ARTIFACT_MAX_MB: int = 1024 # Least recently used artifacts are deleted beyond this total
+    EXPORT_JOB_WORKERS: int = 2 # Export jobs built concurrently
+    EXPORT_JOBS_RETAINED: int = 50 # Finished export jobs kept for the status endpoint
+
+    # ANALYTICS SNAPSHOT (SQLite only)
+    ANALYTICS_SNAPSHOT_INTERVAL_SECONDS: int = 300 # How often admin reports' read-only copy is refreshed; 0 reports from the live database
+    ANALYTICS_SNAPSHOT_PATH: Optional[str] = None # Defaults to the database file plus ".snapshot"
 
     # CORS
     BACKEND_CORS_ORIGINS: List[AnyHttpUrl] = []
@@ -25,12 +53,42 @@ class Settings(BaseSettings):
 
     # DATABASE
     DATABASE_URL: str = "sqlite:///./aura.db"
+    # Driver URL for the async engine; derived from DATABASE_URL when unset
+    ASYNC_DATABASE_URL: Optional[str] = None
+    # PRAGMAs applied to every SQLite connection: "performance" (WAL, synchronous=NORMAL),
+    # "durable" (WAL, synchronous=FULL) or "default" (SQLite's own rollback journal)
+    SQLITE_PROFILE: Literal["performance", "durable", "default"] = "performance"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000 # How long a writer waits for the lock before "database is locked"
+    SQLITE_CACHE_SIZE_KB: int = 65536 # Page cache per connection
+    SQLITE_MMAP_SIZE_MB: int = 256 # Memory-mapped reads; 0 disables
+    DB_POOL_SIZE: int = 10 # Connections kept open per engine
+    DB_MAX_OVERFLOW: int = 20 # Extra connections allowed under burst, closed when returned
+    DB_POOL_TIMEOUT_SECONDS: int = 30 # Wait for a free connection before failing the request
     
     # MQTT
     MQTT_BROKER_HOST: str = "localhost"
     MQTT_BROKER_PORT: int = 1883
     MQTT_SERVER_COMMAND_TOPIC: str = "aura/server/commands"
 
+    # ATTENDANCE
+    ACTIVE_CODE_GRACE_SECONDS: int = 10 # Previous beacon code stays valid this long after a rotation
+    ATTENDANCE_BATCH_MAX_SIZE: int = 200 # Records per write-behind flush
+    ATTENDANCE_BATCH_INTERVAL_MS: int = 5 # Max time a submission waits for its batch to fill
+    ATTENDANCE_WRITE_TIMEOUT_SECONDS: float = 10.0
+    IDEMPOTENCY_CACHE_MAX_ENTRIES: int = 50000 # Completed submissions replayable by Idempotency-Key
+    IDEMPOTENCY_TTL_SECONDS: int = 600
+    OFFLINE_RECEIPT_VERIFY_INTERVAL_SECONDS: int = 30 # How often queued offline receipts are verified
+    OFFLINE_RECEIPT_BATCH_SIZE: int = 500
+    OFFLINE_RECEIPT_MAX_AGE_HOURS: int = 24 # Receipts uploaded later than this are rejected
+    OFFLINE_RECEIPT_UPLOAD_WINDOW_MINUTES: int = 15 # ...and so are receipts uploaded this long after their session ended
+    OFFLINE_RECEIPT_CLOCK_SKEW_SECONDS: int = 120 # Tolerated phone clock drift ahead of the server
+    ATTENDANCE_ELIGIBILITY_THRESHOLD: float = 75.0 # Minimum attendance percentage per course; below it a student is a defaulter
+
+    # ADMISSION CONTROL (student endpoints)
+    ADMISSION_MAX_IN_FLIGHT: int = 64 # Student requests processed concurrently
+    ADMISSION_MAX_QUEUE: int = 2000 # Requests allowed to wait for a slot
+    ADMISSION_LATENCY_BUDGET_MS: int = 2000 # Reject with 429 when the estimated queue wait exceeds this
+
     class Config:
         case_sensitive = True
         env_file = ".env"
@@ -0,0 +1,48 @@
+import logging
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+
+def reconcile_attendance_counts(db: Session) -> int:
+    """
+    Recomputes AttendanceSession.attendance_count from attendance_records.
+    Returns the number of sessions whose stored count was wrong.
+    """
+    actual = (
+        select(func.count(models.AttendanceRecord.id))
+        .where(models.AttendanceRecord.session_id == models.AttendanceSession.id)
+        .scalar_subquery()
+    )
+    fixed = db.execute(
+        update(models.AttendanceSession)
+        .where(models.AttendanceSession.attendance_count != actual)
+        .values(attendance_count=actual)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    if fixed:
+        logger.warning(f"Reconciled attendance_count on {fixed} sessions")
+    return fixed
+
+
+def recount_sessions(db: Session, session_ids) -> None:
+    """Recomputes attendance_count for just these sessions, e.g. after a student's records were removed in bulk. Caller commits."""
+    session_ids = list(session_ids)
+    if not session_ids:
+        return
+    actual = (
+        select(func.count(models.AttendanceRecord.id))
+        .where(models.AttendanceRecord.session_id == models.AttendanceSession.id)
+        .scalar_subquery()
+    )
+    db.execute(
+        update(models.AttendanceSession)
+        .where(models.AttendanceSession.id.in_(session_ids))
+        .values(attendance_count=actual)
+        .execution_options(synchronize_session=False)
+    )
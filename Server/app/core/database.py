@@ -1,5 +1,10 @@
+import hashlib
 import logging
-from sqlalchemy import create_engine
+from sqlalchemy import Column, String, Table, create_engine, event, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from app.core.config import settings
 
@@ -10,19 +15,123 @@ connect_args = {}
 if "sqlite" in settings.DATABASE_URL:
     connect_args["check_same_thread"] = False
 
+def _pool_args(url: str) -> dict:
+    # In-memory SQLite lives in a single connection; there is no pool to size
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+    }
+
 engine = create_engine(
-    settings.DATABASE_URL, connect_args=connect_args
+    settings.DATABASE_URL, connect_args=connect_args, **_pool_args(settings.DATABASE_URL)
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _async_url(url: str) -> str:
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+# Async engine for the hot request paths (submission, live sessions).
+# Objects stay loaded after commit so responses can be serialized without lazy IO.
+_async_database_url = settings.ASYNC_DATABASE_URL or _async_url(settings.DATABASE_URL)
+async_engine = create_async_engine(_async_database_url, **_pool_args(_async_database_url))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def sqlite_pragmas(profile: str) -> dict:
+    """
+    PRAGMAs for a SQLITE_PROFILE. WAL lets readers run alongside the single writer
+    and, with synchronous=NORMAL, fsyncs at checkpoints instead of every commit: a
+    power cut can lose the last commits but never corrupts the database.
+    """
+    if profile == "default":
+        return {}
+    return {
+        "journal_mode": "WAL",
+        "synchronous": "FULL" if profile == "durable" else "NORMAL",
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "cache_size": -settings.SQLITE_CACHE_SIZE_KB, # negative means KiB rather than pages
+        "mmap_size": settings.SQLITE_MMAP_SIZE_MB * 1024 * 1024,
+        "temp_store": "MEMORY",
+    }
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # SQLite ignores foreign keys (and so ON DELETE CASCADE) unless asked, per connection
+    cursor.execute("PRAGMA foreign_keys=ON")
+    for name, value in sqlite_pragmas(settings.SQLITE_PROFILE).items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _configure_sqlite_connection)
+    event.listen(async_engine.sync_engine, "connect", _configure_sqlite_connection)
+
+def _pool_stats(pool) -> dict:
+    if not hasattr(pool, "checkedout"):
+        return {}  # Single-connection pool (in-memory SQLite)
+    return {"size": pool.size(), "checked_out": pool.checkedout(), "overflow": max(pool.overflow(), 0)}
+
+def stats() -> dict:
+    return {
+        "sqlite_profile": settings.SQLITE_PROFILE if engine.dialect.name == "sqlite" else None,
+        "pool": _pool_stats(engine.pool),
+        "async_pool": _pool_stats(async_engine.pool),
+    }
+
 class Base(DeclarativeBase):
     pass
 
+# Key/value facts about the database itself; "schema_fingerprint" lets startup skip schema work
+schema_info = Table(
+    "schema_info", Base.metadata,
+    Column("key", String, primary_key=True),
+    Column("value", String),
+)
+
+def schema_fingerprint() -> str:
+    """Hash of the DDL the models describe (tables and indexes); changes whenever a model does."""
+    ddl = []
+    for table in Base.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=engine.dialect)))
+        ddl.extend(sorted(str(CreateIndex(ix).compile(dialect=engine.dialect)) for ix in table.indexes))
+    return hashlib.sha256("\n".join(ddl).encode()).hexdigest()[:16]
+
+def read_schema_info(key: str):
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(schema_info.c.value).where(schema_info.c.key == key)).scalar()
+    except DBAPIError:
+        return None  # No schema_info table yet
+
+def write_schema_info(key: str, value: str):
+    with engine.begin() as conn:
+        conn.execute(dialect_insert(schema_info).values(key=key, value=value)
+                     .on_conflict_do_update(index_elements=["key"], set_={"value": value}))
+
 def init_db():
+    """
+    Creates and upgrades the schema and seeds the admin account, unless the database
+    was already brought up to date for these exact models and migrations, in which
+    case startup costs one SELECT.
+    """
     # Import models here to ensure they are registered with Base
     from app import models
     from app.core.security import get_password_hash
+    from app.core import identity, migrations
+    # A migration that only rewrites data leaves the DDL alone, so the latest step counts too
+    fingerprint = f"{schema_fingerprint()}.{migrations.MIGRATIONS[-1][0]}"
+    if read_schema_info("schema_fingerprint") == fingerprint:
+        logger.info(f"Schema {fingerprint} is current; skipped create_all, migrations and seeding")
+        return
+
     Base.metadata.create_all(bind=engine)
+    migrations.upgrade()
     
     # Seed Admin
     db = SessionLocal()
@@ -38,10 +147,21 @@ def init_db():
                 password_hash=get_password_hash("admin")
             )
             db.add(db_admin)
+            db.flush()
+            identity.sync(db, "admin", db_admin)
             db.commit()
             logger.info("Admin user seeded (admin/admin)")
+        identity.ensure_in_sync(db)
     finally:
         db.close()
+    write_schema_info("schema_fingerprint", fingerprint)
+    logger.info(f"Schema brought up to date ({fingerprint})")
+
+def dialect_insert(table):
+    """INSERT construct with ON CONFLICT support for the configured backend."""
+    if engine.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
 
 def get_db():
     db = SessionLocal()
@@ -49,3 +169,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
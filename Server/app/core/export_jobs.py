@@ -0,0 +1,245 @@
+import os
+import gzip
+import time
+import uuid
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from sqlalchemy import func
+
+from app import models
+from app.core import exports
+from app.core.config import settings
+from app.core.snapshot import snapshot as analytics_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def data_version(db, query) -> str:
+    """
+    Cheap fingerprint of the records an export query covers (count, highest and
+    summed ids): any record added or removed in the range changes it, since record
+    ids are never reused (AUTOINCREMENT), so an insert always raises the highest id
+    and a delete alone lowers the count. Names of students and classes are exported
+    as they were when the artifact was built.
+    """
+    Record = models.AttendanceRecord
+    count, highest, total = db.execute(
+        query.with_only_columns(func.count(Record.id), func.max(Record.id), func.coalesce(func.sum(Record.id), 0))
+        .order_by(None)
+    ).one()
+    return f"{count}:{highest}:{total}"
+
+
+def artifact_extension(fmt: str) -> str:
+    """File extension of a built artifact: CSV and NDJSON are gzipped, Parquet is compressed already."""
+    return exports.FORMATS[fmt][1] + ("" if fmt == "parquet" else ".gz")
+
+
+class ExportJob:
+    """One export request; several requests for the same artifact share a job."""
+
+    def __init__(self, fmt: str, start_date: Optional[date], end_date: Optional[date], class_group_id: Optional[int],
+                 key: str, path: str, staleness_seconds: float):
+        self.id = uuid.uuid4().hex
+        self.format = fmt
+        self.start_date = start_date
+        self.end_date = end_date
+        self.class_group_id = class_group_id
+        self.key = key
+        self.path = path
+        self.staleness_seconds = staleness_seconds  # age of the snapshot the artifact was built from
+        self.status = "QUEUED"  # QUEUED, RUNNING, COMPLETED, FAILED
+        self.cached = False  # served from an artifact built earlier
+        self.size_bytes = 0
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.failure: Optional[str] = None
+
+    @property
+    def filename(self) -> str:
+        """Download name, e.g. attendance_export_20260301_20260331.csv.gz"""
+        span = "_".join(d.strftime("%Y%m%d") for d in (self.start_date, self.end_date) if d) or "all"
+        return f"attendance_export_{span}.{artifact_extension(self.format)}"
+
+    def as_dict(self) -> dict:
+        elapsed = ((self.finished_at or time.perf_counter()) - self.started_at) if self.started_at else 0.0
+        return {
+            "id": self.id,
+            "format": self.format,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "class_group_id": self.class_group_id,
+            "status": self.status,
+            "cached": self.cached,
+            "size_bytes": self.size_bytes,
+            "staleness_seconds": self.staleness_seconds,
+            "created_at": self.created_at,
+            "elapsed_seconds": round(elapsed, 3),
+            "failure": self.failure,
+            "download": f"{settings.API_V1_STR}/admin/exports/{self.id}/download" if self.status == "COMPLETED" else None,
+        }
+
+
+class ExportJobManager:
+    """
+    Builds attendance exports in the background as files under `directory`.
+
+    Each artifact is named by a hash of its format, filters and the data version
+    of the records it covers, so asking again for an unchanged range (any closed
+    date range) reuses the file straight away, and concurrent requests for the
+    same artifact share one job. CSV and NDJSON are gzipped; Parquet is already
+    compressed. Artifacts unused for `retention_hours` are deleted, then the
+    least recently used ones until the directory fits in `max_bytes`.
+    """
+
+    def __init__(self, directory: str, workers: int, max_jobs: int, retention_hours: float, max_bytes: int):
+        self.directory = directory
+        self.max_jobs = max_jobs
+        self.retention_hours = retention_hours
+        self.max_bytes = max_bytes
+        self.jobs: OrderedDict[str, ExportJob] = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export-job")
+
+        # Metrics
+        self.built = 0
+        self.reused = 0
+        self.pruned = 0
+
+    def submit(self, fmt: str, start_date: Optional[date] = None, end_date: Optional[date] = None,
+               class_group_id: Optional[int] = None) -> ExportJob:
+        query = exports.attendance_query(start_date, end_date, class_group_id)
+        db = analytics_snapshot.session()
+        try:
+            version = data_version(db, query)
+            staleness = db.info["staleness_seconds"]
+        finally:
+            db.close()
+        key = hashlib.sha256(json.dumps(
+            [fmt, str(start_date), str(end_date), class_group_id, version]
+        ).encode()).hexdigest()[:32]
+        path = os.path.join(self.directory, f"{key}.{artifact_extension(fmt)}")
+
+        with self._lock:
+            for job in reversed(self.jobs.values()):
+                if job.key == key and (job.status in ("QUEUED", "RUNNING") or (job.status == "COMPLETED" and os.path.exists(path))):
+                    self.reused += 1
+                    self._touch(path)
+                    return job
+            job = ExportJob(fmt, start_date, end_date, class_group_id, key, path, staleness)
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+            if os.path.exists(path):
+                job.status = "COMPLETED"
+                job.cached = True
+                job.size_bytes = os.path.getsize(path)
+                self.reused += 1
+                self._touch(path)
+                return job
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: ExportJob):
+        job.status = "RUNNING"
+        job.started_at = time.perf_counter()
+        temp = f"{job.path}.{job.id}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            query = exports.attendance_query(job.start_date, job.end_date, job.class_group_id)
+            chunks = exports.stream(analytics_snapshot.session(), query, job.format, settings.EXPORT_CHUNK_SIZE)
+            with open(temp, "wb") as raw:
+                # No name in the gzip header: the temp name would leak into decompressed downloads
+                f = raw if job.format == "parquet" else gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=6)
+                for chunk in chunks:
+                    f.write(chunk)
+                f.close()
+            os.replace(temp, job.path)
+            job.size_bytes = os.path.getsize(job.path)
+            job.status = "COMPLETED"
+            self.built += 1
+        except Exception as e:
+            job.status = "FAILED"
+            job.failure = str(e)
+            logger.error(f"Export {job.id} failed: {e}", exc_info=True)
+            if os.path.exists(temp):
+                os.unlink(temp)
+        finally:
+            job.finished_at = time.perf_counter()
+        logger.info(f"Export {job.id} ({job.format}) {job.status.lower()}: {job.size_bytes} bytes in {job.finished_at - job.started_at:.2f}s")
+        self.prune()
+
+    def prune(self) -> int:
+        """Applies the retention policy to the artifact directory. Returns how many files were deleted."""
+        if not os.path.isdir(self.directory):
+            return 0
+        with self._lock:
+            in_use = {job.path for job in self.jobs.values() if job.status in ("QUEUED", "RUNNING")}
+        cutoff = time.time() - self.retention_hours * 3600
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()  # least recently used first
+
+        removed = 0
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if path in in_use or any(path.startswith(f"{p}.") for p in in_use):
+                continue
+            if mtime >= cutoff and total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        if removed:
+            self.pruned += removed
+            logger.info(f"Pruned {removed} export artifacts")
+        return removed
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def recent(self) -> list[ExportJob]:
+        with self._lock:
+            return list(reversed(self.jobs.values()))
+
+    def stats(self) -> dict:
+        return {"built": self.built, "reused": self.reused, "pruned": self.pruned}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def use(self, job: ExportJob) -> bool:
+        """Marks a completed job's file as used (downloads keep it from expiring); False once it has been pruned."""
+        return self._touch(job.path)
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+
+manager = ExportJobManager(
+    directory=settings.EXPORT_ARTIFACT_DIR,
+    workers=settings.EXPORT_JOB_WORKERS,
+    max_jobs=settings.EXPORT_JOBS_RETAINED,
+    retention_hours=settings.EXPORT_ARTIFACT_RETENTION_HOURS,
+    max_bytes=settings.EXPORT_ARTIFACT_MAX_MB * 1024 * 1024,
+)
@@ -0,0 +1,159 @@
+import io
+import csv
+import json
+import importlib.util
+from datetime import date
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import desc, select
+from sqlalchemy.orm import Session
+
+from app import models
+
+# format -> (media type, file extension)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+CSV_HEADER = ["Date", "Time", "Student Name", "Student ID", "Class", "Status", "Session ID"]
+
+
+def parquet_available() -> bool:
+    """Parquet output needs pyarrow, which is not a required dependency."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def attendance_query(start_date: Optional[date] = None, end_date: Optional[date] = None, class_group_id: Optional[int] = None):
+    """Plain columns (no ORM objects) for each exported attendance record, newest first."""
+    Record, AttendanceSession = models.AttendanceRecord, models.AttendanceSession
+    query = (
+        select(
+            Record.timestamp,
+            models.Student.name.label("student_name"),
+            models.Student.digital_id,
+            models.ClassGroup.name.label("class_name"),
+            Record.status,
+            Record.session_id,
+        )
+        .join(models.Student, Record.student_id == models.Student.id)
+        .join(AttendanceSession, Record.session_id == AttendanceSession.id)
+        .join(models.TeachingAssignment, AttendanceSession.assignment_id == models.TeachingAssignment.id)
+        .join(models.ClassGroup, models.TeachingAssignment.class_group_id == models.ClassGroup.id)
+    )
+    if start_date:
+        query = query.where(AttendanceSession.session_date >= start_date)
+    if end_date:
+        query = query.where(AttendanceSession.session_date <= end_date)
+    if class_group_id:
+        query = query.where(models.TeachingAssignment.class_group_id == class_group_id)
+    return query.order_by(desc(Record.timestamp))
+
+
+def stream(db: Session, query, fmt: str, chunk_size: int) -> Iterator[bytes]:
+    """
+    Runs `query` fetching `chunk_size` rows at a time and yields the encoded export
+    one chunk after another, so memory stays flat however many rows there are.
+    Takes ownership of `db` and closes it when the stream ends or is abandoned.
+    """
+    try:
+        chunks = db.execute(query.execution_options(yield_per=chunk_size)).partitions()
+        yield from _ENCODERS[fmt](chunks)
+    finally:
+        db.close()
+
+
+def _csv(chunks: Iterable[list]) -> Iterator[bytes]:
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(CSV_HEADER)
+    yield output.getvalue().encode()
+    for rows in chunks:
+        output.seek(0)
+        output.truncate()
+        writer.writerows(
+            [
+                row.timestamp.strftime("%Y-%m-%d") if row.timestamp else "",
+                row.timestamp.strftime("%H:%M:%S") if row.timestamp else "",
+                row.student_name,
+                row.digital_id,
+                row.class_name,
+                row.status,
+                row.session_id,
+            ]
+            for row in rows
+        )
+        yield output.getvalue().encode()
+
+
+def _ndjson(chunks: Iterable[list]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(
+            json.dumps({
+                "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+                "student_name": row.student_name,
+                "student_id": row.digital_id,
+                "class": row.class_name,
+                "status": row.status,
+                "session_id": row.session_id,
+            }) + "\n"
+            for row in rows
+        ).encode()
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink whose bytes are handed out as they are produced."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def _parquet(chunks: Iterable[list]) -> Iterator[bytes]:
+    # One row group per chunk; only the footer waits for the end
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("timestamp", pa.timestamp("us")),
+        ("student_name", pa.string()),
+        ("student_id", pa.int64()),
+        ("class", pa.string()),
+        ("status", pa.string()),
+        ("session_id", pa.int64()),
+    ])
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            writer.write_table(pa.Table.from_pydict({
+                "timestamp": [row.timestamp for row in rows],
+                "student_name": [row.student_name for row in rows],
+                "student_id": [row.digital_id for row in rows],
+                "class": [row.class_name for row in rows],
+                "status": [row.status for row in rows],
+                "session_id": [row.session_id for row in rows],
+            }, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+_ENCODERS = {"csv": _csv, "ndjson": _ndjson, "parquet": _parquet}
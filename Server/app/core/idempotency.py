@@ -0,0 +1,75 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyCache:
+    """
+    Bounded, time-expiring store of completed responses keyed by (student_id, Idempotency-Key).
+
+    A retried submission carrying the same key is answered from here before any
+    registry or database work. Each entry keeps a fingerprint of the request it
+    answered so a reused key with a different payload can be refused.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple[int, str], tuple[float, Hashable, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0
+        self.evictions = 0
+
+    def get(self, student_id: int, key: str, fingerprint: Hashable) -> tuple[bool, Optional[Any]]:
+        """Returns (found, response). Raises ValueError if the key was used for a different request."""
+        cache_key = (student_id, key)
+        with self._lock:
+            item = self._entries.get(cache_key)
+            if item is None or time.monotonic() > item[0]:
+                if item is not None:
+                    del self._entries[cache_key]
+                self.misses += 1
+                return False, None
+            _, stored_fingerprint, response = item
+            if stored_fingerprint != fingerprint:
+                self.conflicts += 1
+                raise ValueError("Idempotency-Key reused with a different request")
+            self.hits += 1
+            return True, response
+
+    def put(self, student_id: int, key: str, fingerprint: Hashable, response: Any):
+        cache_key = (student_id, key)
+        now = time.monotonic()
+        with self._lock:
+            self._entries[cache_key] = (now + self.ttl_seconds, fingerprint, response)
+            self._entries.move_to_end(cache_key)
+            # Entries are in insertion order and share one TTL, so expired ones sit at the front
+            while self._entries and next(iter(self._entries.values()))[0] < now:
+                self._entries.popitem(last=False)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "conflicts": self.conflicts,
+            "evictions": self.evictions,
+        }
+
+
+cache = IdempotencyCache(
+    max_entries=settings.IDEMPOTENCY_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+)
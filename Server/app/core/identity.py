@@ -0,0 +1,136 @@
+import logging
+from typing import Optional
+
+from sqlalchemy import delete, func, select, literal, union_all, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core import database
+
+logger = logging.getLogger(__name__)
+
+# Login resolves identifiers shared between roles in this order, as the per-table lookups used to
+ROLE_PRIORITY = {"admin": 0, "professor": 1, "student": 2}
+
+_MODELS = {"admin": models.Admin, "professor": models.Professor, "student": models.Student}
+
+
+def normalize(identifier: Optional[str]) -> str:
+    return (identifier or "").strip().lower()
+
+
+def _identifier(role: str, user) -> str:
+    return normalize(user.username if role == "admin" else user.email)
+
+
+def _rows(role: str, users) -> list[dict]:
+    return [
+        {"identifier": _identifier(role, user), "role": role, "user_id": user.id, "password_hash": user.password_hash}
+        for user in users
+    ]
+
+
+def _upsert():
+    stmt = database.dialect_insert(models.LoginIdentity)
+    return stmt.on_conflict_do_update(
+        index_elements=["role", "user_id"],
+        set_={"identifier": stmt.excluded.identifier, "password_hash": stmt.excluded.password_hash},
+    )
+
+
+def _delete(role: str, user_id: int):
+    return delete(models.LoginIdentity).where(
+        models.LoginIdentity.role == role, models.LoginIdentity.user_id == user_id
+    )
+
+
+def sync(db: Session, role: str, *users):
+    """Writes the identity rows of `users` (same role) in the caller's transaction."""
+    if users:
+        db.execute(_upsert(), _rows(role, users))
+
+
+def sync_values(db: Session, role: str, values: list[dict]):
+    """Like sync() for Core-inserted rows: dicts with id, email (username for admins) and password_hash."""
+    key = "username" if role == "admin" else "email"
+    if values:
+        db.execute(_upsert(), [
+            {"identifier": normalize(v[key]), "role": role, "user_id": v["id"], "password_hash": v["password_hash"]}
+            for v in values
+        ])
+
+
+def refresh(db: Session, role: str, user_ids: list[int]):
+    """Re-syncs the identity rows of `user_ids` from their user table (after Core UPDATEs)."""
+    model = _MODELS[role]
+    login = model.username if role == "admin" else model.email
+    if user_ids:
+        sync_values(db, role, [
+            {"id": user_id, "username" if role == "admin" else "email": value, "password_hash": password_hash}
+            for user_id, value, password_hash in db.execute(
+                select(model.id, login, model.password_hash).where(model.id.in_(user_ids))
+            )
+        ])
+
+
+async def sync_async(db: AsyncSession, role: str, *users):
+    if users:
+        await db.execute(_upsert(), _rows(role, users))
+
+
+def remove(db: Session, role: str, user_id: int):
+    db.execute(_delete(role, user_id))
+
+
+def remove_many(db: Session, role: str, user_ids: list[int]):
+    if user_ids:
+        db.execute(delete(models.LoginIdentity).where(
+            models.LoginIdentity.role == role, models.LoginIdentity.user_id.in_(user_ids)
+        ))
+
+
+async def remove_async(db: AsyncSession, role: str, user_id: int):
+    await db.execute(_delete(role, user_id))
+
+
+async def lookup(db: AsyncSession, identifier: str) -> list[models.LoginIdentity]:
+    """All accounts using `identifier`, highest-priority role first (normally just one)."""
+    rows = (await db.execute(
+        select(models.LoginIdentity).where(models.LoginIdentity.identifier == normalize(identifier))
+    )).scalars().all()
+    return sorted(rows, key=lambda row: ROLE_PRIORITY.get(row.role, len(ROLE_PRIORITY)))
+
+
+def _normalized(column):
+    # SQL twin of normalize()
+    return func.lower(func.trim(func.coalesce(column, "")))
+
+
+def rebuild(db: Session) -> int:
+    """Recreates every identity row from the user tables. Returns the number of rows."""
+    sources = union_all(
+        select(_normalized(models.Admin.username), literal("admin"), models.Admin.id, models.Admin.password_hash),
+        select(_normalized(models.Professor.email), literal("professor"), models.Professor.id, models.Professor.password_hash)
+        .where(models.Professor.deleted_at.is_(None)),
+        select(_normalized(models.Student.email), literal("student"), models.Student.id, models.Student.password_hash)
+        .where(models.Student.deleted_at.is_(None)),
+    )
+    db.execute(delete(models.LoginIdentity))
+    db.execute(insert(models.LoginIdentity).from_select(["identifier", "role", "user_id", "password_hash"], sources))
+    count = db.query(func.count(models.LoginIdentity.id)).scalar()
+    db.commit()
+    return count
+
+
+def ensure_in_sync(db: Session):
+    """Rebuilds the index when its size no longer matches the user tables (new table, or rows written around these helpers). Soft-deleted users have no identity."""
+    users = (
+        db.query(func.count(models.Admin.id)).scalar()
+        + db.query(func.count(models.Professor.id)).filter(models.Professor.deleted_at.is_(None)).scalar()
+        + db.query(func.count(models.Student.id)).filter(models.Student.deleted_at.is_(None)).scalar()
+    )
+    identities = db.query(func.count(models.LoginIdentity.id)).scalar()
+    if users != identities:
+        count = rebuild(db)
+        logger.info(f"Rebuilt login identities ({identities} -> {count} rows)")
@@ -0,0 +1,415 @@
+import os
+import csv
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Mapping, Optional
+
+from sqlalchemy import insert, select, update, bindparam
+
+from app import models
+from app.core import database, security, identity
+from app.core.config import settings
+from app.core.principal_cache import cache as principal_cache
+
+logger = logging.getLogger(__name__)
+
+_MAX_ERRORS = 1000  # per job; the count keeps going past this
+
+# Roster columns covered by row_fingerprint. Passwords are left out: a sync never resets them.
+STUDENT_FIELDS = ("digital_id", "name", "email", "year", "department", "class_group_id")
+PROFESSOR_FIELDS = ("name", "email", "department")
+
+
+def fingerprint(values: Mapping, fields: tuple[str, ...]) -> str:
+    """Stable hash of a roster row, compared against the stored row_fingerprint to find changes."""
+    canonical = "\x1f".join("" if values[f] is None else str(values[f]) for f in fields)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+class ImportJob:
+    """Progress of one roster import. Read by the status endpoint while the worker updates it."""
+
+    def __init__(self, kind: str, filename: Optional[str] = None, mode: str = "import", delete_missing: bool = False):
+        self.id = uuid.uuid4().hex
+        self.kind = kind  # "students" or "professors"
+        self.filename = filename
+        self.mode = mode  # "import" adds new rows only, "sync" also applies changes
+        self.delete_missing = delete_missing  # sync only: soft-delete students absent from the file
+        self.status = "QUEUED"  # QUEUED, RUNNING, COMPLETED, FAILED
+        self.rows_processed = 0
+        self.added = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deleted = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors: list[dict] = []
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.failure: Optional[str] = None
+
+    def error(self, row_number: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < _MAX_ERRORS:
+            self.errors.append({"row": row_number, "error": message})
+
+    def as_dict(self) -> dict:
+        elapsed = ((self.finished_at or time.perf_counter()) - self.started_at) if self.started_at else 0.0
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "filename": self.filename,
+            "mode": self.mode,
+            "delete_missing": self.delete_missing,
+            "status": self.status,
+            "rows_processed": self.rows_processed,
+            "added": self.added,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "deleted": self.deleted,
+            "skipped": self.skipped,
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "created_at": self.created_at,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows_processed / elapsed, 1) if elapsed else 0.0,
+            "failure": self.failure,
+        }
+
+
+def _chunks(rows: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _numbered(reader) -> Iterator[tuple[int, list[str]]]:
+    next(reader, None)  # header
+    for number, row in enumerate(reader, start=2):  # spreadsheet row numbers
+        yield number, row
+
+
+def import_students(db, lines: Iterable[str], job: ImportJob):
+    """
+    Imports a student CSV (id, digital_id, name, email, year, department, class, password).
+
+    Existing ids and emails are fetched once up front; each chunk of rows is
+    hashed in parallel and written with one multi-row INSERT plus its login
+    identities, then committed.
+    """
+    class_map = dict(db.query(models.ClassGroup.name, models.ClassGroup.id).all())
+    seen_ids, seen_emails = set(), set()
+    for student_id, email in db.execute(select(models.Student.id, models.Student.email)):
+        seen_ids.add(student_id)
+        seen_emails.add(identity.normalize(email))
+
+    for chunk in _chunks(_numbered(csv.reader(lines)), settings.IMPORT_CHUNK_SIZE):
+        values, passwords = [], []
+        for number, row in chunk:
+            job.rows_processed += 1
+            if len(row) < 8:
+                job.skipped += 1
+                continue
+            try:
+                student_id = int(row[0])
+                if student_id in seen_ids:
+                    job.skipped += 1
+                    continue
+                if identity.normalize(row[3]) in seen_emails:
+                    job.error(number, f"Email {row[3]} already exists")
+                    continue
+                cg_id = class_map.get(row[6])
+                if not cg_id:
+                    job.error(number, f"Class {row[6]} not found")
+                    continue
+                student = dict(id=student_id, digital_id=int(row[1]), name=row[2], email=row[3], year=int(row[4]),
+                               department=row[5], class_group_id=cg_id, device_id=None)
+                student["row_fingerprint"] = fingerprint(student, STUDENT_FIELDS)
+                values.append(student)
+                passwords.append(row[7])
+                seen_ids.add(student_id)
+                seen_emails.add(identity.normalize(row[3]))
+            except Exception as e:
+                job.error(number, str(e))
+        _write(db, models.Student, "student", values, passwords, job)
+
+
+def import_professors(db, lines: Iterable[str], job: ImportJob):
+    """Imports a professor CSV (id, name, email, department, password); see import_students."""
+    seen_ids, seen_emails = set(), set()
+    for prof_id, email in db.execute(select(models.Professor.id, models.Professor.email)):
+        seen_ids.add(prof_id)
+        seen_emails.add(identity.normalize(email))
+
+    for chunk in _chunks(_numbered(csv.reader(lines)), settings.IMPORT_CHUNK_SIZE):
+        values, passwords = [], []
+        for number, row in chunk:
+            job.rows_processed += 1
+            try:
+                prof_id = int(row[0])
+                if prof_id in seen_ids or identity.normalize(row[2]) in seen_emails:
+                    job.skipped += 1
+                    continue
+                professor = dict(id=prof_id, name=row[1], email=row[2], department=row[3])
+                professor["row_fingerprint"] = fingerprint(professor, PROFESSOR_FIELDS)
+                values.append(professor)
+                passwords.append(row[4])
+                seen_ids.add(prof_id)
+                seen_emails.add(identity.normalize(row[2]))
+            except Exception as e:
+                job.error(number, str(e))
+        _write(db, models.Professor, "professor", values, passwords, job)
+
+
+def _write(db, model, role: str, values: list[dict], passwords: list[str], job: ImportJob):
+    if not values:
+        return
+    for row, password_hash in zip(values, security.hash_many(passwords)):
+        row["password_hash"] = password_hash
+    db.execute(insert(model), values)
+    identity.sync_values(db, role, values)
+    db.commit()
+    job.added += len(values)
+
+
+class _RosterState:
+    """Fingerprint, email and soft-delete state of every row in a roster table, kept current as a sync applies rows."""
+
+    def __init__(self, db, model, fields: tuple[str, ...]):
+        self.fields = fields
+        self.fingerprints: dict[int, str] = {}
+        self.emails: dict[int, str] = {}
+        self.email_owners: dict[str, int] = {}
+        self.deleted: set[int] = set()
+        self.purging = {
+            entity_id for (entity_id,) in db.query(models.PendingPurge.entity_id).filter(
+                models.PendingPurge.entity == model.__name__.lower()
+            )
+        }
+        columns = [model.id, model.row_fingerprint, model.deleted_at, *(getattr(model, f) for f in fields)]
+        for row in db.execute(select(*columns)):
+            values = row._mapping
+            # Rows created or edited outside a sync have no stored fingerprint; derive it from the columns
+            self.fingerprints[row.id] = row.row_fingerprint or fingerprint(values, fields)
+            self.emails[row.id] = identity.normalize(row.email)
+            self.email_owners[self.emails[row.id]] = row.id
+            if row.deleted_at is not None:
+                self.deleted.add(row.id)
+
+    def plan(self, values: dict) -> str:
+        """Returns "insert", "update" or "unchanged" for a parsed row and records it. Raises ValueError on an email clash."""
+        row_id, email = values["id"], identity.normalize(values["email"])
+        if row_id in self.purging:
+            raise ValueError(f"{row_id} is being deleted; upload it again once the purge has finished")
+        owner = self.email_owners.get(email)
+        if owner is not None and owner != row_id:
+            raise ValueError(f"Email {values['email']} already belongs to {owner}")
+        values["row_fingerprint"] = fingerprint(values, self.fields)
+        if row_id not in self.fingerprints:
+            action = "insert"
+        elif self.fingerprints[row_id] != values["row_fingerprint"] or row_id in self.deleted:
+            action = "update"
+        else:
+            return "unchanged"
+        self.email_owners.pop(self.emails.get(row_id), None)
+        self.email_owners[email] = row_id
+        self.emails[row_id] = email
+        self.fingerprints[row_id] = values["row_fingerprint"]
+        self.deleted.discard(row_id)
+        return action
+
+
+def sync_students(db, lines: Iterable[str], job: ImportJob):
+    """
+    Applies a full student CSV (same columns as import_students) as the new roster.
+
+    Rows whose fingerprint matches the stored one are left alone; new students are
+    inserted, changed ones (class transfers, renames, restored students) updated
+    in bulk. With job.delete_missing, students not in the file are soft-deleted.
+    """
+    class_map = dict(db.query(models.ClassGroup.name, models.ClassGroup.id).all())
+    state = _RosterState(db, models.Student, STUDENT_FIELDS)
+    seen: set[int] = set()
+
+    for chunk in _chunks(_numbered(csv.reader(lines)), settings.IMPORT_CHUNK_SIZE):
+        inserts, passwords, updates = [], [], []
+        for number, row in chunk:
+            job.rows_processed += 1
+            if len(row) < 8:
+                job.skipped += 1
+                continue
+            try:
+                student_id = int(row[0])
+                if student_id in seen:
+                    job.error(number, f"Student {student_id} appears more than once")
+                    continue
+                seen.add(student_id)  # even if the row is bad: a typo must not delete the student
+                cg_id = class_map.get(row[6])
+                if not cg_id:
+                    job.error(number, f"Class {row[6]} not found")
+                    continue
+                values = dict(id=student_id, digital_id=int(row[1]), name=row[2], email=row[3], year=int(row[4]),
+                              department=row[5], class_group_id=cg_id)
+                action = state.plan(values)
+                if action == "insert":
+                    values["device_id"] = None
+                    inserts.append(values)
+                    passwords.append(row[7])
+                elif action == "update":
+                    values["deleted_at"] = None
+                    updates.append(values)
+                else:
+                    job.unchanged += 1
+            except Exception as e:
+                job.error(number, str(e))
+        _write(db, models.Student, "student", inserts, passwords, job)
+        _update(db, models.Student, "student", updates, job)
+
+    if job.delete_missing:
+        if not seen:
+            raise ValueError("The file has no student rows; refusing to delete the whole roster")
+        missing = [student_id for student_id in state.fingerprints if student_id not in seen and student_id not in state.deleted]
+        for ids in _chunks(missing, settings.IMPORT_CHUNK_SIZE):
+            students = models.Student.__table__
+            db.execute(update(students).where(students.c.id.in_(ids)).values(deleted_at=datetime.now(timezone.utc)))
+            identity.remove_many(db, "student", ids)
+            db.commit()
+            for student_id in ids:
+                principal_cache.invalidate("student", student_id)
+            job.deleted += len(ids)
+
+
+def sync_professors(db, lines: Iterable[str], job: ImportJob):
+    """Applies a professor CSV (same columns as import_professors), writing only new and changed rows."""
+    state = _RosterState(db, models.Professor, PROFESSOR_FIELDS)
+    seen: set[int] = set()
+
+    for chunk in _chunks(_numbered(csv.reader(lines)), settings.IMPORT_CHUNK_SIZE):
+        inserts, passwords, updates = [], [], []
+        for number, row in chunk:
+            job.rows_processed += 1
+            try:
+                prof_id = int(row[0])
+                if prof_id in seen:
+                    job.error(number, f"Professor {prof_id} appears more than once")
+                    continue
+                seen.add(prof_id)
+                values = dict(id=prof_id, name=row[1], email=row[2], department=row[3])
+                action = state.plan(values)
+                if action == "insert":
+                    inserts.append(values)
+                    passwords.append(row[4])
+                elif action == "update":
+                    updates.append(values)
+                else:
+                    job.unchanged += 1
+            except Exception as e:
+                job.error(number, str(e))
+        _write(db, models.Professor, "professor", inserts, passwords, job)
+        _update(db, models.Professor, "professor", updates, job)
+
+
+def _update(db, model, role: str, values: list[dict], job: ImportJob):
+    if not values:
+        return
+    table = model.__table__
+    columns = [name for name in values[0] if name != "id"]
+    db.execute(
+        update(table)
+        .where(table.c.id == bindparam("row_id"))
+        .values({name: bindparam(f"new_{name}") for name in columns}),
+        [{"row_id": v["id"], **{f"new_{name}": v[name] for name in columns}} for v in values],
+    )
+    identity.refresh(db, role, [v["id"] for v in values])
+    db.commit()
+    for v in values:
+        principal_cache.invalidate(role, v["id"])
+    job.updated += len(values)
+
+
+IMPORTERS = {
+    "students": import_students,
+    "professors": import_professors,
+}
+
+SYNCERS = {
+    "students": sync_students,
+    "professors": sync_professors,
+}
+
+
+def run_import(kind: str, lines: Iterable[str], job: Optional[ImportJob] = None) -> ImportJob:
+    """Runs an import in the calling thread (also used by the synchronous bulk_upload endpoints)."""
+    job = job or ImportJob(kind)
+    job.status = "RUNNING"
+    job.started_at = time.perf_counter()
+    db = database.SessionLocal()
+    try:
+        (SYNCERS if job.mode == "sync" else IMPORTERS)[kind](db, lines, job)
+        job.status = "COMPLETED"
+    except Exception as e:
+        db.rollback()
+        job.status = "FAILED"
+        job.failure = str(e)
+        logger.error(f"Import {job.id} ({kind}) failed after {job.rows_processed} rows: {e}", exc_info=True)
+    finally:
+        db.close()
+        job.finished_at = time.perf_counter()
+    logger.info(
+        f"Import {job.id} ({kind}, {job.mode}): {job.added} added, {job.updated} updated, {job.unchanged} unchanged, "
+        f"{job.deleted} deleted, {job.skipped} skipped, {job.error_count} errors"
+    )
+    return job
+
+
+class ImportJobManager:
+    """Runs uploaded roster files one at a time in the background and remembers recent jobs."""
+
+    def __init__(self, max_jobs: int):
+        self.max_jobs = max_jobs
+        self.jobs: OrderedDict[str, ImportJob] = OrderedDict()
+        self._lock = threading.Lock()
+        # One worker: imports are write-heavy and SQLite has a single writer anyway
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="roster-import")
+
+    def submit(self, kind: str, path: str, filename: Optional[str] = None, mode: str = "import", delete_missing: bool = False) -> ImportJob:
+        job = ImportJob(kind, filename, mode, delete_missing)
+        with self._lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+        self._executor.submit(self._run, job, path)
+        return job
+
+    def _run(self, job: ImportJob, path: str):
+        try:
+            with open(path, newline="", encoding="utf-8-sig") as f:
+                run_import(job.kind, f, job)
+        finally:
+            os.unlink(path)
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def recent(self) -> list[ImportJob]:
+        with self._lock:
+            return list(reversed(self.jobs.values()))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+manager = ImportJobManager(max_jobs=settings.IMPORT_JOBS_RETAINED)
@@ -0,0 +1,264 @@
+"""
+Numbered schema upgrades for databases created by earlier versions of the models.
+
+create_all only creates missing tables. Anything that changes an existing table
+(a column, an index, a constraint) is a step here; init_db runs the steps newer
+than the version recorded in schema_info, in order. Each step checks the
+database before changing it, so on a database just created from the current
+models the steps are no-ops that only get recorded.
+"""
+import time
+import logging
+
+from sqlalchemy import func, inspect, text, update
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app import models
+from app.core import database, counters, rollups, attendance_stats
+from app.core.database import engine
+
+logger = logging.getLogger(__name__)
+
+
+def _unique_attendance_records():
+    """Adds the (session_id, student_id) unique index to databases created before it existed."""
+    index_name = "uq_attendance_records_session_student"
+    if any(ix["name"] == index_name for ix in inspect(engine).get_indexes("attendance_records")):
+        return
+
+    with engine.begin() as conn:
+        removed = conn.execute(text(
+            "DELETE FROM attendance_records WHERE id NOT IN ("
+            "SELECT MIN(id) FROM attendance_records GROUP BY session_id, student_id)"
+        )).rowcount
+        if removed:
+            logger.warning(f"Removed {removed} duplicate attendance records before adding unique index")
+        next(ix for ix in models.AttendanceRecord.__table__.indexes if ix.name == index_name).create(conn)
+    logger.info(f"Created index {index_name}")
+
+
+def _attendance_count_column():
+    """Adds attendance_sessions.attendance_count to existing databases and backfills it."""
+    columns = {col["name"] for col in inspect(engine).get_columns("attendance_sessions")}
+    if "attendance_count" in columns:
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "ALTER TABLE attendance_sessions ADD COLUMN attendance_count INTEGER NOT NULL DEFAULT 0"
+        ))
+    db = database.SessionLocal()
+    try:
+        fixed = counters.reconcile_attendance_counts(db)
+    finally:
+        db.close()
+    logger.info(f"Added attendance_sessions.attendance_count ({fixed} sessions backfilled)")
+
+
+def _roster_and_soft_delete_columns():
+    """Adds nullable columns introduced after their table was first created (roster sync, soft delete)."""
+    wanted = {
+        "students": {"row_fingerprint": "VARCHAR", "deleted_at": "TIMESTAMP"},
+        "professors": {"row_fingerprint": "VARCHAR", "deleted_at": "TIMESTAMP"},
+        "courses": {"deleted_at": "TIMESTAMP"},
+    }
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, columns in wanted.items():
+            existing = {col["name"] for col in inspector.get_columns(table)}
+            for name, ddl_type in columns.items():
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+                    logger.info(f"Added {table}.{name}")
+
+
+def _foreign_key_actions():
+    """
+    Rebuilds SQLite tables created before their foreign keys had ON DELETE actions.
+
+    SQLite cannot alter a constraint, so each such table is recreated from the
+    model under a temporary name, its rows copied over, the old table dropped and
+    the new one renamed into place (with foreign keys off, as SQLite documents).
+    The model's indexes are recreated on the new table.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    inspector = inspect(engine)
+    stale = []
+    for table in database.Base.metadata.sorted_tables:
+        if not table.foreign_keys:
+            continue
+        wanted = {(fk.parent.name, (fk.ondelete or "NO ACTION").upper()) for fk in table.foreign_keys}
+        existing = {
+            (fk["constrained_columns"][0], (fk["options"].get("ondelete") or "NO ACTION").upper())
+            for fk in inspector.get_foreign_keys(table.name)
+        }
+        if wanted != existing:
+            stale.append(table)
+    if not stale:
+        return
+    orphans = _rebuild_tables(stale)
+    logger.info(f"Rebuilt {len(stale)} tables with ON DELETE actions: {', '.join(t.name for t in stale)}")
+    if orphans:
+        logger.warning(f"{len(orphans)} rows reference rows that no longer exist (left in place; run PRAGMA foreign_key_check)")
+
+
+def _rebuild_tables(tables) -> list:
+    """
+    Recreates SQLite tables from their models, keeping their rows and indexes.
+    Returns the PRAGMA foreign_key_check rows found afterwards.
+    """
+    inspector = inspect(engine)
+    script = ["PRAGMA foreign_keys=OFF;", "BEGIN;"]
+    for table in tables:
+        temp = f"{table.name}__rebuild"
+        present = {col["name"] for col in inspector.get_columns(table.name)}
+        columns = ", ".join(col.name for col in table.columns if col.name in present)
+        ddl = str(CreateTable(table).compile(dialect=engine.dialect)).strip()
+        script.append(ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {temp} ", 1) + ";")
+        script.append(f"INSERT INTO {temp} ({columns}) SELECT {columns} FROM {table.name};")
+        script.append(f"DROP TABLE {table.name};")
+        script.append(f"ALTER TABLE {temp} RENAME TO {table.name};")
+        script.extend(str(CreateIndex(ix).compile(dialect=engine.dialect)).strip() + ";" for ix in table.indexes)
+    script.append("COMMIT;")
+
+    raw = engine.raw_connection()
+    try:
+        sqlite_conn = raw.driver_connection
+        try:
+            sqlite_conn.executescript("\n".join(script))
+        except Exception:
+            if sqlite_conn.in_transaction:
+                sqlite_conn.execute("ROLLBACK")
+            raise
+        finally:
+            sqlite_conn.execute("PRAGMA foreign_keys=ON")
+        return sqlite_conn.execute("PRAGMA foreign_key_check").fetchall()
+    finally:
+        raw.close()
+
+
+def _session_date_and_hot_indexes():
+    """
+    Adds attendance_sessions.session_date (backfilled from start_time) and the
+    composite indexes behind the live-session and report queries.
+    """
+    sessions = models.AttendanceSession.__table__
+    columns = {col["name"] for col in inspect(engine).get_columns("attendance_sessions")}
+    with engine.begin() as conn:
+        if "session_date" not in columns:
+            conn.execute(text("ALTER TABLE attendance_sessions ADD COLUMN session_date DATE"))
+        backfilled = conn.execute(
+            update(sessions).where(sessions.c.session_date.is_(None))
+            .values(session_date=func.date(sessions.c.start_time))
+        ).rowcount
+        # Superseded by ix_attendance_sessions_assignment_start, which leads with assignment_id
+        conn.execute(text("DROP INDEX IF EXISTS ix_attendance_sessions_assignment_id"))
+        for ix in sessions.indexes:
+            ix.create(conn, checkfirst=True)
+    logger.info(f"attendance_sessions.session_date backfilled on {backfilled} sessions")
+
+
+def _daily_attendance_rollups():
+    """Fills daily_attendance_rollups for attendance recorded before the table existed."""
+    db = database.SessionLocal()
+    try:
+        if db.query(models.DailyAttendanceRollup).first() is None:
+            rollups.rebuild(db)
+    finally:
+        db.close()
+
+
+def _student_attendance_stats():
+    """Fills student_attendance_stats for attendance recorded before the table existed."""
+    db = database.SessionLocal()
+    try:
+        if db.query(models.StudentAttendanceStat).first() is None:
+            attendance_stats.rebuild(db)
+    finally:
+        db.close()
+
+
+def _offline_receipt_columns():
+    """Adds the per-device receipt key and the claimed time of records written from offline receipts."""
+    wanted = {"students": {"receipt_key": "VARCHAR"}, "attendance_records": {"claimed_at": "TIMESTAMP"}}
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, columns in wanted.items():
+            existing = {col["name"] for col in inspector.get_columns(table)}
+            for name, ddl_type in columns.items():
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+                    logger.info(f"Added {table}.{name}")
+
+
+def _attendance_records_timestamp_index():
+    """Adds the (timestamp, id) index the admin records listing pages through."""
+    with engine.begin() as conn:
+        for ix in models.AttendanceRecord.__table__.indexes:
+            ix.create(conn, checkfirst=True)
+
+
+def _attendance_records_autoincrement():
+    """
+    Rebuilds attendance_records with AUTOINCREMENT so SQLite never hands a deleted
+    record's id to a new one (export artifacts are keyed on record ids).
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect() as conn:
+        ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'attendance_records'")).scalar()
+    if "AUTOINCREMENT" in ddl.upper():
+        return
+    _rebuild_tables([models.AttendanceRecord.__table__])
+    logger.info("Rebuilt attendance_records with AUTOINCREMENT ids")
+
+
+def _attendance_records_timestamp_format():
+    """
+    Rewrites record timestamps stored by SQLite's CURRENT_TIMESTAMP ("YYYY-MM-DD HH:MM:SS")
+    in the format the DateTime type binds ("... HH:MM:SS.ffffff"). The two compare as text,
+    so the bare form sorted below its own cursor and the records listing repeated pages.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        fixed = conn.execute(text(
+            "UPDATE attendance_records SET timestamp = timestamp || '.000000' WHERE length(timestamp) = 19"
+        )).rowcount
+    if fixed:
+        logger.info(f"Normalized the timestamp format of {fixed} attendance records")
+
+
+# (version, name, step). Append only; never renumber or edit a released step.
+MIGRATIONS = [
+    (1, "unique attendance records", _unique_attendance_records),
+    (2, "attendance_count column", _attendance_count_column),
+    (3, "roster sync and soft delete columns", _roster_and_soft_delete_columns),
+    (4, "ON DELETE actions", _foreign_key_actions),
+    (5, "session_date and hot query indexes", _session_date_and_hot_indexes),
+    (6, "daily attendance rollups", _daily_attendance_rollups),
+    (7, "student attendance stats", _student_attendance_stats),
+    (8, "attendance records timestamp index", _attendance_records_timestamp_index),
+    (9, "offline receipt key and claimed time", _offline_receipt_columns),
+    (10, "attendance records AUTOINCREMENT ids", _attendance_records_autoincrement),
+    (11, "attendance records timestamp format", _attendance_records_timestamp_format),
+]
+
+
+def current_version() -> int:
+    return int(database.read_schema_info("migration_version") or 0)
+
+
+def upgrade() -> list[int]:
+    """Runs the steps newer than the recorded version, recording each as it completes. Returns the versions applied."""
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version <= current_version():
+            continue
+        started = time.perf_counter()
+        step()
+        database.write_schema_info("migration_version", str(version))
+        applied.append(version)
+        logger.info(f"Migration {version} ({name}) applied in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return applied
@@ -5,6 +5,7 @@ from app.core import database
 from app import models
 from sqlalchemy.orm import Session
 import re
+from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +16,7 @@ HEALTH_TOPIC_PATTERN = "aura/devices/+/+/health"
 from app.core.ws_manager import manager as ws_manager
 from app.core.device_tracker import tracker as device_tracker
 from app.core.admin_ws_manager import manager as admin_ws_manager
+from app.core import code_registry
 
 def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
@@ -98,8 +100,18 @@ def update_active_code(classroom_name: str, code: str):
         ).order_by(models.AttendanceSession.start_time.desc()).first()
         
         if session:
+            if session.current_code != code:
+                # Close the outgoing code and open the new one so offline receipts can be checked later
+                now = datetime.now(timezone.utc)
+                db.query(models.CodeHistory).filter(
+                    models.CodeHistory.session_id == session.id,
+                    models.CodeHistory.valid_until.is_(None)
+                ).update({models.CodeHistory.valid_until: now}, synchronize_session=False)
+                db.add(models.CodeHistory(session_id=session.id, code=code, valid_from=now))
             session.current_code = code
             db.commit()
+            if not code_registry.registry.rotate(session.id, code):
+                code_registry.load_session(db, session)
             logger.info(f"Updated session {session.id} code to: {code}")
         else:
              logger.warning(f"No active session found for {classroom_name}")
@@ -125,9 +137,7 @@ def update_headcount(room_number: str, headcount_value: int):
         if session:
             session.headcount = headcount_value
             db.commit()
-            attendance_count = db.query(models.AttendanceRecord).filter(
-                models.AttendanceRecord.session_id == session.id
-            ).count()
+            attendance_count = session.attendance_count
             ws_manager.broadcast_from_thread(session.id, {
                 "type": "headcount_update",
                 "session_id": session.id,
@@ -148,7 +158,9 @@ def start_mqtt_listener():
     client.on_message = on_message
     
     try:
-        client.connect(settings.MQTT_BROKER_HOST, settings.MQTT_BROKER_PORT, 60)
+        # Connect from the network thread: startup does not wait on the broker, and the
+        # thread keeps retrying (subscribing in on_connect) if it is not up yet
+        client.connect_async(settings.MQTT_BROKER_HOST, settings.MQTT_BROKER_PORT, 60)
         client.loop_start()
         logger.info("MQTT Listener background thread started.")
         return client
@@ -0,0 +1,89 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PrincipalCache:
+    """
+    LRU cache of authenticated user rows keyed by (role, user_id), with a TTL.
+
+    Entries are plain column dicts so they can be shared across threads and
+    re-attached to a request's Session without a query. Invalidation also
+    remembers when the user changed, so token claims issued before that
+    moment are no longer trusted by this process.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple[str, int], tuple[float, dict]] = OrderedDict()
+        self._changed_at: dict[tuple[str, int], float] = {}  # wall-clock time of last invalidation
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, role: str, user_id: int) -> Optional[dict]:
+        key = (role, user_id)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, values = item
+            if time.monotonic() > expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return values
+
+    def put(self, role: str, user_id: int, values: dict):
+        key = (role, user_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, values)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, role: str, user_id: int):
+        key = (role, user_id)
+        now = time.time()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._changed_at[key] = now
+            # Tokens older than their lifetime are rejected anyway
+            horizon = now - settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+            for stale in [k for k, t in self._changed_at.items() if t < horizon]:
+                del self._changed_at[stale]
+
+    def claims_valid(self, role: str, user_id: int, issued_at: Optional[int]) -> bool:
+        """True if claims in a token issued at `issued_at` are newer than the user's last change."""
+        if issued_at is None:
+            return False
+        with self._lock:
+            changed_at = self._changed_at.get((role, user_id))
+        return changed_at is None or issued_at > changed_at
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+cache = PrincipalCache(
+    max_entries=settings.PRINCIPAL_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,200 @@
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import delete, distinct, select, update
+
+from app import models
+from app.core import database, identity, counters, rollups, code_registry
+from app.core.config import settings
+from app.core.principal_cache import cache as principal_cache
+
+logger = logging.getLogger(__name__)
+
+ENTITIES = {
+    "professor": models.Professor,
+    "course": models.Course,
+    "student": models.Student,
+}
+
+
+class _Stopped(Exception):
+    pass
+
+
+def soft_delete(db, entity: str, entity_id: int) -> models.PendingPurge:
+    """
+    Hides a row right away (deleted_at, no login) and queues its physical removal.
+    The caller has checked the row exists; asking twice returns the queued purge.
+    """
+    existing = db.query(models.PendingPurge).filter(
+        models.PendingPurge.entity == entity, models.PendingPurge.entity_id == entity_id
+    ).first()
+    if existing:
+        return existing
+    model = ENTITIES[entity]
+    db.execute(update(model).where(model.id == entity_id).values(deleted_at=datetime.now(timezone.utc)))
+    ended = []
+    if entity == "professor":
+        ended = code_registry.end_sessions(db, models.TeachingAssignment.professor_id == entity_id)
+    elif entity == "course":
+        ended = code_registry.end_sessions(db, models.TeachingAssignment.course_id == entity_id)
+    if entity in ("professor", "student"):
+        identity.remove(db, entity, entity_id)
+    pending = models.PendingPurge(entity=entity, entity_id=entity_id)
+    db.add(pending)
+    db.commit()
+    code_registry.registry.close(*ended)
+    db.refresh(pending)
+    if entity in ("professor", "student"):
+        principal_cache.invalidate(entity, entity_id)
+    purger.wake()
+    return pending
+
+
+class Purger:
+    """
+    Physically removes soft-deleted professors, courses and students in the background.
+
+    Everything under the row is deleted leaf tables first, `chunk_size` rows per
+    transaction, so a professor with years of attendance never holds the
+    database's write lock for more than one short chunk. Progress survives
+    restarts: the queue lives in pending_purges and each step is re-derived
+    from what is still there.
+    """
+
+    def __init__(self, interval_seconds: float, chunk_size: int):
+        self.interval_seconds = interval_seconds
+        self.chunk_size = chunk_size
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Metrics
+        self.purged = 0
+        self.rows_deleted = 0
+        self.failures = 0
+        self.last_purge_ms = 0.0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="purger", daemon=True)
+        self._thread.start()
+        logger.info(f"Purger started (every {self.interval_seconds}s, {self.chunk_size} rows per chunk)")
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        logger.info("Purger stopped")
+
+    def wake(self):
+        """Starts the next round now instead of at the next interval."""
+        self._wake.set()
+
+    def stats(self) -> dict:
+        return {
+            "purged": self.purged,
+            "rows_deleted": self.rows_deleted,
+            "failures": self.failures,
+            "last_purge_ms": self.last_purge_ms,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.purge_pending()
+            except Exception as e:
+                logger.error(f"Purge round failed: {e}", exc_info=True)
+
+    def purge_pending(self) -> int:
+        """Works through the queue oldest first. Returns how many rows were fully purged."""
+        done = 0
+        db = database.SessionLocal()
+        try:
+            for pending in db.query(models.PendingPurge).order_by(models.PendingPurge.id).all():
+                try:
+                    self._purge(db, pending)
+                except _Stopped:
+                    return done
+                except Exception as e:
+                    db.rollback()
+                    self.failures += 1
+                    pending.last_error = str(e)
+                    db.commit()
+                    logger.error(f"Purge of {pending.entity} {pending.entity_id} failed, will retry: {e}", exc_info=True)
+                    continue
+                done += 1
+        finally:
+            db.close()
+        return done
+
+    def _purge(self, db, pending: models.PendingPurge):
+        started = time.perf_counter()
+        entity_id = pending.entity_id
+        model = ENTITIES[pending.entity]
+
+        if pending.entity == "student":
+            affected_sessions = [
+                session_id for (session_id,) in
+                db.query(distinct(models.AttendanceRecord.session_id)).filter(models.AttendanceRecord.student_id == entity_id)
+            ]
+            class_group_ids, days = rollups.scope_of_sessions(db, affected_sessions)
+            self._delete_chunked(db, pending, models.AttendanceRecord, models.AttendanceRecord.student_id == entity_id)
+            counters.recount_sessions(db, affected_sessions)
+            rollups.recompute(db, class_group_ids, days)
+            self._delete_chunked(db, pending, models.OfflineReceipt, models.OfflineReceipt.student_id == entity_id)
+        else:
+            owner = models.TeachingAssignment.professor_id if pending.entity == "professor" else models.TeachingAssignment.course_id
+            # Assignments go last, so a purge resumed after a restart still finds these
+            class_group_ids = {
+                class_group_id for (class_group_id,) in
+                db.query(distinct(models.TeachingAssignment.class_group_id)).filter(owner == entity_id)
+            }
+            assignments = select(models.TeachingAssignment.id).where(owner == entity_id)
+            sessions = select(models.AttendanceSession.id).where(models.AttendanceSession.assignment_id.in_(assignments))
+            self._delete_chunked(db, pending, models.AttendanceRecord, models.AttendanceRecord.session_id.in_(sessions))
+            self._delete_chunked(db, pending, models.CodeHistory, models.CodeHistory.session_id.in_(sessions))
+            self._delete_chunked(db, pending, models.AttendanceSession, models.AttendanceSession.assignment_id.in_(assignments))
+            self._delete_chunked(db, pending, models.TimeTable, models.TimeTable.assignment_id.in_(assignments))
+            rollups.recompute(db, class_group_ids)
+            self._delete_chunked(db, pending, models.TeachingAssignment, owner == entity_id)
+
+        rows_deleted = pending.rows_deleted
+        db.execute(delete(model).where(model.id == entity_id))
+        db.delete(pending)
+        db.commit()
+
+        self.purged += 1
+        self.last_purge_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Purged {pending.entity} {entity_id} ({rows_deleted} dependent rows)")
+
+    def _delete_chunked(self, db, pending: models.PendingPurge, model, condition):
+        table = model.__table__
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            chunk = select(table.c.id).where(condition).limit(self.chunk_size)
+            deleted = db.execute(delete(table).where(table.c.id.in_(chunk))).rowcount
+            pending.rows_deleted += deleted
+            db.commit()
+            self.rows_deleted += deleted
+            if deleted < self.chunk_size:
+                return
+
+
+purger = Purger(
+    interval_seconds=settings.PURGE_INTERVAL_SECONDS,
+    chunk_size=settings.PURGE_CHUNK_SIZE,
+)
@@ -0,0 +1,206 @@
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import update, bindparam
+
+from app import models
+from app.core import database, security
+from app.core.config import settings
+from app.core.attendance_writer import writer as attendance_writer, PendingSubmission
+
+logger = logging.getLogger(__name__)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # SQLite hands DateTime columns back naive; everything here is compared in UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class ReceiptVerifier:
+    """
+    Background verification of offline attendance receipts.
+
+    Uploads only store the receipt; this thread later picks up PENDING rows in
+    batches and applies the same checks as a live submission (device binding,
+    class membership) plus a signature with the key issued to that device. The
+    code must have been valid at the receipt's claimed time according to
+    CodeHistory, and the receipt must have reached the server within
+    OFFLINE_RECEIPT_UPLOAD_WINDOW_MINUTES of its session ending. Accepted
+    receipts go through the attendance writer stamped with the time the server
+    received them, the phone's claimed time kept alongside.
+    """
+
+    def __init__(self, interval_seconds: float, batch_size: int):
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Metrics
+        self.batches = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.last_batch_ms = 0.0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="receipt-verifier", daemon=True)
+        self._thread.start()
+        logger.info(f"Offline receipt verifier started (every {self.interval_seconds}s, batch <= {self.batch_size})")
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        logger.info("Offline receipt verifier stopped")
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "last_batch_ms": self.last_batch_ms,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.verify_pending()
+            except Exception as e:
+                logger.error(f"Offline receipt verification failed: {e}", exc_info=True)
+
+    def verify_pending(self) -> int:
+        """Verifies PENDING receipts batch by batch until none are left. Returns how many were processed."""
+        processed = 0
+        while not self._stop.is_set():
+            db = database.SessionLocal()
+            try:
+                receipts = db.query(models.OfflineReceipt).filter(
+                    models.OfflineReceipt.status == "PENDING"
+                ).order_by(models.OfflineReceipt.id).limit(self.batch_size).all()
+                if not receipts:
+                    return processed
+                settled = self._verify_batch(db, receipts)
+                processed += settled
+                if settled < len(receipts):
+                    return processed  # writer trouble; leave the rest for the next round
+            finally:
+                db.close()
+        return processed
+
+    def _verify_batch(self, db, receipts: list[models.OfflineReceipt]) -> int:
+        started = time.perf_counter()
+        grace = timedelta(seconds=settings.ACTIVE_CODE_GRACE_SECONDS)
+        skew = timedelta(seconds=settings.OFFLINE_RECEIPT_CLOCK_SKEW_SECONDS)
+        max_age = timedelta(hours=settings.OFFLINE_RECEIPT_MAX_AGE_HOURS)
+        upload_window = timedelta(minutes=settings.OFFLINE_RECEIPT_UPLOAD_WINDOW_MINUTES)
+
+        students = {
+            row.id: row for row in db.query(
+                models.Student.id, models.Student.name, models.Student.digital_id,
+                models.Student.device_id, models.Student.receipt_key, models.Student.class_group_id
+            ).filter(models.Student.id.in_({r.student_id for r in receipts}), models.Student.deleted_at.is_(None))
+        }
+        windows: dict[str, list] = {}
+        for row in db.query(
+            models.CodeHistory.code, models.CodeHistory.session_id, models.CodeHistory.valid_from,
+            models.CodeHistory.valid_until, models.AttendanceSession.end_time,
+            models.AttendanceSession.room_number, models.TeachingAssignment.class_group_id,
+        ).join(models.AttendanceSession, models.CodeHistory.session_id == models.AttendanceSession.id
+        ).join(models.TeachingAssignment, models.AttendanceSession.assignment_id == models.TeachingAssignment.id
+        ).filter(models.CodeHistory.code.in_({r.code for r in receipts})):
+            windows.setdefault(row.code, []).append(row)
+
+        outcomes: dict[int, tuple] = {}  # receipt id -> (status, reason, session_id, record_id)
+        submitted: list[tuple[models.OfflineReceipt, PendingSubmission]] = []
+        for receipt in receipts:
+            student = students.get(receipt.student_id)
+            claimed_at = _naive_utc(receipt.claimed_at)
+            received_at = _naive_utc(receipt.received_at or datetime.now(timezone.utc))
+
+            if student is None:
+                outcomes[receipt.id] = ("REJECTED", "Unknown student", None, None)
+                continue
+            # Only the bound device holds a key; a reset device's receipts stop verifying
+            if student.receipt_key is None or student.device_id != receipt.device_uuid:
+                outcomes[receipt.id] = ("REJECTED", "Unauthorized device", None, None)
+                continue
+            if not security.verify_receipt(student.receipt_key, receipt.code, receipt.device_uuid, claimed_at, receipt.signature):
+                outcomes[receipt.id] = ("REJECTED", "Invalid signature", None, None)
+                continue
+            if claimed_at > received_at + skew or claimed_at < received_at - max_age:
+                outcomes[receipt.id] = ("REJECTED", "Claimed time outside the accepted window", None, None)
+                continue
+
+            window = next((
+                w for w in windows.get(receipt.code, [])
+                if w.valid_from <= claimed_at <= (w.valid_until or w.end_time or received_at) + grace
+            ), None)
+            if window is None:
+                outcomes[receipt.id] = ("REJECTED", "Code was not valid at the claimed time", None, None)
+                continue
+            if window.end_time is not None and received_at > window.end_time + upload_window:
+                outcomes[receipt.id] = ("REJECTED", "Uploaded too long after the session ended", None, None)
+                continue
+            if window.class_group_id != student.class_group_id:
+                outcomes[receipt.id] = ("REJECTED", "Student does not belong to this class group", None, None)
+                continue
+
+            pending = PendingSubmission(
+                session_id=window.session_id,
+                student_id=student.id,
+                student_name=student.name,
+                digital_id=student.digital_id,
+                room_number=window.room_number,
+                rssi_strength=receipt.rssi_strength,
+                timestamp=received_at,
+                claimed_at=claimed_at,
+            )
+            attendance_writer.submit(pending)
+            submitted.append((receipt, pending))
+
+        for receipt, pending in submitted:
+            try:
+                result = pending.future.result(timeout=settings.ATTENDANCE_WRITE_TIMEOUT_SECONDS)
+            except Exception as e:
+                logger.warning(f"Offline receipt {receipt.id} not written, will retry: {e}")
+                continue  # stays PENDING
+            outcomes[receipt.id] = ("ACCEPTED", None if result.created else "Already recorded", result.session_id, result.id)
+
+        if outcomes:
+            receipts_table = models.OfflineReceipt.__table__
+            db.execute(
+                update(receipts_table)
+                .where(receipts_table.c.id == bindparam("receipt_id"))
+                .values(status=bindparam("new_status"), reason=bindparam("new_reason"),
+                        session_id=bindparam("new_session_id"), record_id=bindparam("new_record_id")),
+                [
+                    {"receipt_id": receipt_id, "new_status": status, "new_reason": reason,
+                     "new_session_id": session_id, "new_record_id": record_id}
+                    for receipt_id, (status, reason, session_id, record_id) in outcomes.items()
+                ],
+            )
+            db.commit()
+
+        accepted = sum(1 for status, *_ in outcomes.values() if status == "ACCEPTED")
+        self.batches += 1
+        self.accepted += accepted
+        self.rejected += len(outcomes) - accepted
+        self.last_batch_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Verified {len(outcomes)} offline receipts: {accepted} accepted, {len(outcomes) - accepted} rejected")
+        return len(outcomes)
+
+
+verifier = ReceiptVerifier(
+    interval_seconds=settings.OFFLINE_RECEIPT_VERIFY_INTERVAL_SECONDS,
+    batch_size=settings.OFFLINE_RECEIPT_BATCH_SIZE,
+)
@@ -0,0 +1,134 @@
+import logging
+from datetime import date
+from typing import Iterable, Optional
+
+from sqlalchemy import case, delete, distinct, func, insert, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core import database
+
+logger = logging.getLogger(__name__)
+
+Key = tuple[date, int]  # (day, class_group_id)
+
+
+def bump(db: Session, changes: dict[Key, tuple[int, int, int]]) -> None:
+    """Adds (sessions, records, present) deltas to the rollup rows for these keys, creating them as needed. Caller commits."""
+    rows = [
+        {"day": day, "class_group_id": class_group_id, "sessions": sessions, "records": records, "present": present}
+        for (day, class_group_id), (sessions, records, present) in changes.items()
+        if day is not None and class_group_id is not None
+    ]
+    if not rows:
+        return
+    table = models.DailyAttendanceRollup.__table__
+    stmt = database.dialect_insert(table)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["day", "class_group_id"],
+            set_={
+                "sessions": table.c.sessions + stmt.excluded.sessions,
+                "records": table.c.records + stmt.excluded.records,
+                "present": table.c.present + stmt.excluded.present,
+            },
+        ),
+        rows,
+    )
+
+
+def session_counted(db: Session, session: models.AttendanceSession, delta: int = 1) -> None:
+    """Counts a new session (delta=1) or takes back one discarded before any attendance (delta=-1). Caller commits."""
+    db.flush()  # session_date is filled in on insert
+    bump(db, {(session.session_date, session.assignment.class_group_id): (delta, 0, 0)})
+
+
+def records_added(db: Session, per_session: dict[int, tuple[int, int]]) -> None:
+    """Adds newly inserted records, given as session_id -> (records, present). Caller commits."""
+    if not per_session:
+        return
+    changes: dict[Key, list[int]] = {}
+    for session_id, key in _session_keys(db, per_session).items():
+        records, present = per_session[session_id]
+        totals = changes.setdefault(key, [0, 0, 0])
+        totals[1] += records
+        totals[2] += present
+    bump(db, {key: tuple(totals) for key, totals in changes.items()})
+
+
+def record_removed(db: Session, record: models.AttendanceRecord) -> None:
+    """Takes back one record; its session and assignment must be loaded. Caller commits."""
+    session = record.session
+    bump(db, {(session.session_date, session.assignment.class_group_id): (0, -1, -1 if record.status == "PRESENT" else 0)})
+
+
+def scope_of_sessions(db: Session, session_ids: Iterable[int]) -> tuple[set[int], set[date]]:
+    """Class groups and days the given sessions roll up into; read before a bulk delete, recompute after."""
+    keys = set(_session_keys(db, session_ids).values())
+    return {class_group_id for _, class_group_id in keys}, {day for day, _ in keys}
+
+
+def recompute(db: Session, class_group_ids: Iterable[int], days: Optional[Iterable[date]] = None) -> int:
+    """
+    Recomputes the rollup rows of these class groups (on these days, or all days) from
+    sessions and records, e.g. after rows were removed in bulk. Caller commits.
+    """
+    class_group_ids = list(class_group_ids)
+    if not class_group_ids:
+        return 0
+    days = list(days) if days is not None else None
+    Rollup = models.DailyAttendanceRollup
+    stale = delete(Rollup).where(Rollup.class_group_id.in_(class_group_ids))
+    fresh = _totals().where(models.TeachingAssignment.class_group_id.in_(class_group_ids))
+    if days is not None:
+        stale = stale.where(Rollup.day.in_(days))
+        fresh = fresh.where(models.AttendanceSession.session_date.in_(days))
+    db.execute(stale)
+    return db.execute(_insert_totals(fresh)).rowcount
+
+
+def rebuild(db: Session) -> int:
+    """Recomputes every rollup row from sessions and records (backfill, repair). Returns the row count."""
+    db.execute(delete(models.DailyAttendanceRollup))
+    rows = db.execute(_insert_totals(_totals())).rowcount
+    db.commit()
+    logger.info(f"Rebuilt {rows} daily attendance rollup rows")
+    return rows
+
+
+def _session_keys(db: Session, session_ids: Iterable[int]) -> dict[int, Key]:
+    session_ids = list(session_ids)
+    if not session_ids:
+        return {}
+    return {
+        row.id: (row.session_date, row.class_group_id)
+        for row in db.execute(
+            select(models.AttendanceSession.id, models.AttendanceSession.session_date,
+                   models.TeachingAssignment.class_group_id)
+            .join(models.TeachingAssignment, models.AttendanceSession.assignment_id == models.TeachingAssignment.id)
+            .where(models.AttendanceSession.id.in_(session_ids))
+        )
+    }
+
+
+def _totals():
+    AttendanceSession, Record = models.AttendanceSession, models.AttendanceRecord
+    return (
+        select(
+            AttendanceSession.session_date,
+            models.TeachingAssignment.class_group_id,
+            func.count(distinct(AttendanceSession.id)),
+            func.count(Record.id),
+            func.coalesce(func.sum(case((Record.status == "PRESENT", 1), else_=0)), 0),
+        )
+        .join(models.TeachingAssignment, AttendanceSession.assignment_id == models.TeachingAssignment.id)
+        .outerjoin(Record, Record.session_id == AttendanceSession.id)
+        .where(AttendanceSession.session_date.is_not(None))
+        .group_by(AttendanceSession.session_date, models.TeachingAssignment.class_group_id)
+    )
+
+
+def _insert_totals(totals):
+    return insert(models.DailyAttendanceRollup).from_select(
+        ["day", "class_group_id", "sessions", "records", "present"], totals
+    )
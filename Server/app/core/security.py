@@ -1,21 +1,209 @@
+import hmac
+import time
 import bcrypt
+import asyncio
+import hashlib
+import secrets
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta, timezone
-from typing import Any, Union
+from typing import Any, Optional, Union
 from jose import jwt
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 def get_password_hash(password: str) -> str:
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
-def create_access_token(subject: Union[str, Any], expires_delta: timedelta = None) -> str:
+def _hash_all(passwords: list[str]) -> list[str]:
+    return [get_password_hash(p) for p in passwords]
+
+
+class HasherBusy(Exception):
+    """The hashing pool's queue is full."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a dedicated process pool so hashing never holds the API's GIL.
+
+    At most `max_pending` jobs may be queued or running; beyond that callers get
+    HasherBusy instead of piling onto the pool. With `workers=0` hashing runs in
+    the calling thread (scripts, tests). The pool is created on first use, and
+    again if a dead worker left it broken.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._pending = 0
+
+        # Metrics
+        self.completed = 0
+        self.rejected = 0
+        self.max_pending_seen = 0
+        self._latencies: deque[float] = deque(maxlen=1000)  # seconds, queue wait included
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a process that already runs writer/MQTT threads is unsafe
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+                logger.info(f"Password hashing pool started ({self.workers} workers)")
+            return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        with self._lock:
+            if self._pool is not pool:
+                return  # another caller already replaced it
+            self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.warning("Password hashing pool broken (a worker died); starting a new one")
+
+    def _submit(self, fn, *args, wait: bool = False) -> Future:
+        """Queues a job; when the pool is full raises HasherBusy, or with wait=True blocks for a free slot."""
+        if self.workers <= 0:
+            future: Future = Future()
+            future.set_result(fn(*args))
+            return future
+        with self._lock:
+            if wait:
+                self._slot_freed.wait_for(lambda: self._pending < self.max_pending)
+            elif self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherBusy()
+            self._pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self._pending)
+        started = time.perf_counter()
+        try:
+            pool = self._executor()
+            try:
+                future = pool.submit(fn, *args)
+            except BrokenProcessPool:
+                self._discard(pool)
+                future = self._executor().submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+                self._slot_freed.notify()
+            raise
+        future.add_done_callback(lambda _: self._done(started))
+        return future
+
+    def _done(self, started: float):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+            self._slot_freed.notify()
+        self._latencies.append(time.perf_counter() - started)
+
+    def hash(self, password: str) -> str:
+        return self._submit(get_password_hash, password).result()
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return self._submit(verify_password, plain_password, hashed_password).result()
+
+    def hash_many(self, passwords: list[str]) -> list[str]:
+        """
+        Hashes a batch across all workers (bulk imports) as a few chunk jobs, counted
+        against the pending limit like any other job. A full pool makes the import
+        wait for a slot instead of failing it, so logins are never crowded out.
+        """
+        if self.workers <= 0 or len(passwords) < 2:
+            return _hash_all(passwords)
+        chunksize = max(1, -(-len(passwords) // (self.workers * 4)))
+        futures = [
+            self._submit(_hash_all, passwords[i:i + chunksize], wait=True)
+            for i in range(0, len(passwords), chunksize)
+        ]
+        return [hashed for future in futures for hashed in future.result()]
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(get_password_hash, password))
+
+    async def verify_async(self, plain_password: str, hashed_password: str) -> bool:
+        return await asyncio.wrap_future(self._submit(verify_password, plain_password, hashed_password))
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending_seen": self.max_pending_seen,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "latency_ms_avg": (sum(latencies) / len(latencies) * 1000) if latencies else 0.0,
+            "latency_ms_p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000 if latencies else 0.0,
+        }
+
+
+hasher = PasswordHasher(workers=settings.PASSWORD_HASH_WORKERS, max_pending=settings.PASSWORD_HASH_MAX_PENDING)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await hasher.verify_async(plain_password, hashed_password)
+
+async def hash_password_async(password: str) -> str:
+    return await hasher.hash_async(password)
+
+def hash_many(passwords: list[str]) -> list[str]:
+    return hasher.hash_many(passwords)
+
+_dummy_hash: Optional[str] = None
+
+async def dummy_hash_async() -> str:
+    """
+    bcrypt hash verified against when a login matches no account, so unknown users
+    take as long as wrong passwords. Made in the hashing pool on first use rather
+    than at import, which kept every worker start waiting on bcrypt.
+    """
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = await hash_password_async("dummy-password-for-timing")
+    return _dummy_hash
+
+def create_access_token(subject: Union[str, Any], expires_delta: timedelta = None, claims: Optional[dict] = None) -> str:
+    now = datetime.now(timezone.utc)
     if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        expire = now + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode = {"exp": expire, "sub": str(subject)}
+    to_encode = {**(claims or {}), "exp": expire, "iat": now, "sub": str(subject)}
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
+
+
+def new_receipt_key() -> str:
+    """
+    Random key for signing offline attendance receipts, issued to a student's bound
+    device and stored with it, so resetting the device revokes it.
+    """
+    return secrets.token_hex(32)
+
+def sign_receipt(key: str, code: str, device_uuid: str, claimed_at: datetime) -> str:
+    """HMAC-SHA256 (hex) over "code|device_uuid|unix_seconds"."""
+    if claimed_at.tzinfo is None:
+        claimed_at = claimed_at.replace(tzinfo=timezone.utc)
+    message = f"{code}|{device_uuid}|{int(claimed_at.timestamp())}"
+    return hmac.new(key.encode("utf-8"), message.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def verify_receipt(key: str, code: str, device_uuid: str, claimed_at: datetime, signature: str) -> bool:
+    expected = sign_receipt(key, code, device_uuid, claimed_at)
+    return hmac.compare_digest(expected, signature)
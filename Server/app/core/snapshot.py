@@ -0,0 +1,139 @@
+import os
+import time
+import logging
+import threading
+from typing import Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.core import database
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+STALENESS_HEADER = "X-Data-Staleness-Seconds"
+
+
+class AnalyticsSnapshot:
+    """
+    Periodic read-only copy of the SQLite database for admin reports.
+
+    Each refresh runs VACUUM INTO a temporary file (a WAL read transaction, so
+    submissions keep writing meanwhile) and renames it over the previous copy.
+    Report queries then scan the copy through their own read-only engine and
+    never compete with the live database for its lock or page cache. The engine
+    does not pool connections, so every session opens whichever copy is current.
+
+    Other backends, in-memory databases and an interval of 0 serve reports from
+    the live database.
+    """
+
+    def __init__(self, interval_seconds: float, path: Optional[str]):
+        self.interval_seconds = interval_seconds
+        self.path = path
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._sessions: Optional[sessionmaker] = None
+        self._taken_at: Optional[float] = None
+
+        # Metrics
+        self.refreshes = 0
+        self.failures = 0
+        self.last_refresh_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.interval_seconds and self.path)
+
+    def start(self):
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="analytics-snapshot", daemon=True)
+        self._thread.start()
+        logger.info(f"Analytics snapshot started ({self.path}, every {self.interval_seconds}s)")
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        logger.info("Analytics snapshot stopped")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "staleness_seconds": self.staleness_seconds(),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_refresh_ms": self.last_refresh_ms,
+        }
+
+    def staleness_seconds(self) -> Optional[float]:
+        if self._taken_at is None:
+            return None
+        return round(time.time() - self._taken_at, 1)
+
+    def session(self) -> Session:
+        """
+        Session on the latest snapshot, or on the live database until the first one
+        exists. info["staleness_seconds"] is how old its data may be.
+        """
+        sessions, taken_at = self._sessions, self._taken_at
+        if sessions is None:
+            db = database.SessionLocal()
+            db.info["staleness_seconds"] = 0
+        else:
+            db = sessions()
+            db.info["staleness_seconds"] = round(time.time() - taken_at)
+        return db
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Analytics snapshot refresh failed: {e}", exc_info=True)
+            self._stop.wait(self.interval_seconds)
+
+    def refresh(self):
+        started = time.perf_counter()
+        taken_at = time.time()
+        temp = f"{self.path}.tmp"
+        if os.path.exists(temp):
+            os.remove(temp)
+        with database.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("VACUUM INTO ?", (temp,))
+        os.replace(temp, self.path)
+
+        if self._sessions is None:
+            readonly = create_engine(
+                f"sqlite:///file:{os.path.abspath(self.path)}?mode=ro&uri=true",
+                connect_args={"check_same_thread": False},
+                poolclass=NullPool,
+            )
+            self._sessions = sessionmaker(autocommit=False, autoflush=False, bind=readonly)
+        self._taken_at = taken_at
+
+        self.refreshes += 1
+        self.last_refresh_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Analytics snapshot refreshed in {self.last_refresh_ms:.0f}ms")
+
+
+def _snapshot_path() -> Optional[str]:
+    if database.engine.dialect.name != "sqlite":
+        return None
+    path = database.engine.url.database
+    if not path or path == ":memory:" or path.startswith("file:"):
+        return None
+    return settings.ANALYTICS_SNAPSHOT_PATH or f"{path}.snapshot"
+
+
+snapshot = AnalyticsSnapshot(
+    interval_seconds=settings.ANALYTICS_SNAPSHOT_INTERVAL_SECONDS,
+    path=_snapshot_path(),
+)
@@ -0,0 +1,130 @@
+import csv
+import time
+import logging
+from typing import Iterable
+
+from sqlalchemy import insert, update, select, bindparam
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+DAYS = {'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3, 'Friday': 4, 'Saturday': 5}
+
+
+def import_timetable(db, lines: Iterable[str]) -> dict:
+    """
+    Applies a timetable CSV (class_name, day (name or 0-5), period (1-8), course_code, professor_email).
+
+    Every row is resolved against lookup maps first; existing teaching assignments
+    and the (class_group, day, slot) entries of the affected classes are then
+    loaded once and diffed against the file. Missing assignments, new slots and
+    changed slots are written with bulk statements and committed together, so a
+    bad file leaves the timetable as it was. A later row for the same slot wins.
+    """
+    started = time.perf_counter()
+    errors = []
+
+    classes = dict(db.query(models.ClassGroup.name, models.ClassGroup.id).all())
+    courses = dict(db.query(models.Course.code, models.Course.id).all())
+    profs = dict(db.query(models.Professor.email, models.Professor.id).all())
+
+    wanted: dict[tuple[int, int, int], tuple[int, int, int]] = {}  # (class, day, slot) -> assignment key
+    rows = 0
+    reader = csv.reader(lines)
+    next(reader, None)
+    for row in reader:
+        if len(row) < 5:
+            continue
+        try:
+            c_name, day_raw, period, c_code, p_email = row[0], row[1], int(row[2]), row[3], row[4]
+
+            cid = classes.get(c_name)
+            if not cid:
+                errors.append(f"Class '{c_name}' not found")
+                continue
+            course_id = courses.get(c_code)
+            if not course_id:
+                errors.append(f"Course '{c_code}' not found")
+                continue
+            prof_id = profs.get(p_email)
+            if not prof_id:
+                errors.append(f"Prof '{p_email}' not found")
+                continue
+            day = int(day_raw) if day_raw.isdigit() else DAYS.get(day_raw, -1)
+            if day == -1:
+                errors.append(f"Invalid day '{day_raw}'")
+                continue
+
+            wanted[(cid, day, period)] = (course_id, prof_id, cid)
+            rows += 1
+        except Exception as e:
+            errors.append(f"Row {row}: {str(e)}")
+
+    # Assignments: one read, one multi-row insert for the missing ones
+    assignments: dict[tuple[int, int, int], int] = {}
+    for a in db.execute(
+        select(models.TeachingAssignment.id, models.TeachingAssignment.course_id,
+               models.TeachingAssignment.professor_id, models.TeachingAssignment.class_group_id)
+        .order_by(models.TeachingAssignment.id)
+    ):
+        assignments.setdefault((a.course_id, a.professor_id, a.class_group_id), a.id)
+
+    missing = sorted(set(wanted.values()) - assignments.keys())
+    if missing:
+        created = db.execute(
+            insert(models.TeachingAssignment.__table__).returning(
+                models.TeachingAssignment.id, models.TeachingAssignment.course_id,
+                models.TeachingAssignment.professor_id, models.TeachingAssignment.class_group_id,
+            ),
+            [dict(course_id=course_id, professor_id=prof_id, class_group_id=cid) for course_id, prof_id, cid in missing],
+        )
+        for a in created:
+            assignments[(a.course_id, a.professor_id, a.class_group_id)] = a.id
+
+    # Slots: current grid of the classes in the file, keyed like `wanted`
+    current: dict[tuple[int, int, int], tuple[int, int]] = {}
+    for entry in db.execute(
+        select(models.TimeTable.id, models.TimeTable.assignment_id, models.TimeTable.day_of_week,
+               models.TimeTable.hour_slot, models.TeachingAssignment.class_group_id)
+        .join(models.TeachingAssignment, models.TimeTable.assignment_id == models.TeachingAssignment.id)
+        .where(models.TeachingAssignment.class_group_id.in_({cid for cid, _, _ in wanted}))
+        .order_by(models.TimeTable.id)
+    ):
+        current.setdefault((entry.class_group_id, entry.day_of_week, entry.hour_slot), (entry.id, entry.assignment_id))
+
+    inserts, updates = [], []
+    for (cid, day, period), assignment_key in wanted.items():
+        assignment_id = assignments[assignment_key]
+        existing = current.get((cid, day, period))
+        if existing is None:
+            inserts.append({"assignment_id": assignment_id, "day_of_week": day, "hour_slot": period})
+        elif existing[1] != assignment_id:
+            updates.append({"entry_id": existing[0], "new_assignment_id": assignment_id})
+
+    timetables = models.TimeTable.__table__
+    if inserts:
+        db.execute(insert(timetables), inserts)
+    if updates:
+        db.execute(
+            update(timetables)
+            .where(timetables.c.id == bindparam("entry_id"))
+            .values(assignment_id=bindparam("new_assignment_id")),
+            updates,
+        )
+    db.commit()
+
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(
+        f"Timetable import: {rows} rows, {len(inserts)} slots added, {len(updates)} updated, "
+        f"{len(missing)} assignments created, {len(errors)} errors in {elapsed_ms}ms"
+    )
+    return {
+        "added": rows,
+        "errors": errors,
+        "slots_inserted": len(inserts),
+        "slots_updated": len(updates),
+        "slots_unchanged": len(wanted) - len(inserts) - len(updates),
+        "assignments_created": len(missing),
+        "elapsed_ms": elapsed_ms,
+    }
@@ -1,3 +1,6 @@
+import time
+_import_started = time.perf_counter()
+
 import logging
 import contextlib
 
@@ -6,8 +9,13 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.api import api_router
 from app.core.config import settings
-from app.core.database import init_db
-from app.core import mqtt_listener
+from app.core.database import init_db, async_engine
+from app.core import mqtt_listener, security, import_jobs, export_jobs
+from app.core.attendance_writer import writer as attendance_writer
+from app.core.receipt_verifier import verifier as receipt_verifier
+from app.core.purge import purger
+from app.core.snapshot import snapshot as analytics_snapshot, STALENESS_HEADER
+from app.api.routers.admin import NEXT_CURSOR_HEADER
 
 # Configure root logger
 logging.basicConfig(
@@ -22,18 +30,54 @@ import asyncio
 from app.core.ws_manager import manager as ws_manager
 from app.core.admin_ws_manager import manager as admin_ws_manager
 
+_imports_ms = (time.perf_counter() - _import_started) * 1000
+
+@contextlib.contextmanager
+def _phase(timings: dict, name: str):
+    started = time.perf_counter()
+    yield
+    timings[name] = (time.perf_counter() - started) * 1000
+
+async def _warm_up():
+    """Makes the login dummy hash (starting the hashing pool) after startup instead of on the first login."""
+    try:
+        await security.dummy_hash_async()
+    except Exception as e:
+        logger.warning(f"Password hasher warm-up failed: {e}")
+
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    init_db()
-    ws_manager.set_event_loop(asyncio.get_event_loop())
-    admin_ws_manager.set_event_loop(asyncio.get_event_loop())
-    mqtt_client = mqtt_listener.start_mqtt_listener()
-    logger.info("Startup: Database tables created & MQTT Listener started")
+    timings = {"imports": _imports_ms}
+    with _phase(timings, "database"):
+        init_db()
+    with _phase(timings, "workers"):
+        ws_manager.set_event_loop(asyncio.get_event_loop())
+        admin_ws_manager.set_event_loop(asyncio.get_event_loop())
+        attendance_writer.start()
+        receipt_verifier.start()
+        purger.start()
+        analytics_snapshot.start()
+    with _phase(timings, "mqtt"):
+        mqtt_client = mqtt_listener.start_mqtt_listener()
+    warm_up = asyncio.create_task(_warm_up())
+    logger.info(
+        "Startup: ready in " + ", ".join(f"{name} {ms:.0f}ms" for name, ms in timings.items())
+        + f" (lifespan {sum(ms for name, ms in timings.items() if name != 'imports'):.0f}ms)"
+    )
     yield
     # Shutdown
+    warm_up.cancel()
     if mqtt_client:
         mqtt_client.loop_stop()
+    receipt_verifier.stop()
+    purger.stop()
+    analytics_snapshot.stop()
+    attendance_writer.stop()
+    import_jobs.manager.shutdown()
+    export_jobs.manager.shutdown()
+    security.hasher.shutdown()
+    await async_engine.dispose()
     logger.info("Shutdown: Cleanup")
 
 app = FastAPI(
@@ -50,6 +94,8 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Response headers browser scripts may read
+    expose_headers=[NEXT_CURSOR_HEADER, STALENESS_HEADER],
 )
 
 @app.get("/")
@@ -1,4 +1,6 @@
-from .user import Admin, Professor, Student
+from .user import Admin, Professor, Student, LoginIdentity
 from .academic import ClassGroup, Course, TeachingAssignment, TimeTable
-from .attendance import AttendanceSession, AttendanceRecord
-from .schedule import BellSchedule
\ No newline at end of file
+from .attendance import AttendanceSession, AttendanceRecord, CodeHistory, OfflineReceipt
+from .schedule import BellSchedule
+from .purge import PendingPurge
+from .rollup import DailyAttendanceRollup, StudentAttendanceStat
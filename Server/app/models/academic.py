@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
@@ -10,9 +10,10 @@ class ClassGroup(Base):
     department = Column(String)
     year = Column(Integer)
 
-    students = relationship("Student", back_populates="class_group", cascade="all, delete-orphan")
+    # Children are removed by ON DELETE CASCADE in the database, not loaded and deleted one by one
+    students = relationship("Student", back_populates="class_group", cascade="all, delete-orphan", passive_deletes=True)
     # Link to assignments that belong to this class
-    assignments = relationship("TeachingAssignment", back_populates="class_group", cascade="all, delete-orphan")
+    assignments = relationship("TeachingAssignment", back_populates="class_group", cascade="all, delete-orphan", passive_deletes=True)
 
 class Course(Base):
     """
@@ -24,8 +25,9 @@ class Course(Base):
     code = Column(String, unique=True, index=True) # e.g. UCS1234
     name = Column(String) # e.g. Data Structures
     department = Column(String) # e.g. CSE
+    deleted_at = Column(DateTime, nullable=True) # Soft-deleted, waiting for app.core.purge
 
-    assignments = relationship("TeachingAssignment", back_populates="course", cascade="all, delete-orphan")
+    assignments = relationship("TeachingAssignment", back_populates="course", cascade="all, delete-orphan", passive_deletes=True)
 
 class TeachingAssignment(Base):
     """
@@ -36,9 +38,9 @@ class TeachingAssignment(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     
-    course_id = Column(Integer, ForeignKey("courses.id"))
-    professor_id = Column(Integer, ForeignKey("professors.id"))
-    class_group_id = Column(Integer, ForeignKey("class_groups.id"))
+    course_id = Column(Integer, ForeignKey("courses.id", ondelete="CASCADE"), index=True)
+    professor_id = Column(Integer, ForeignKey("professors.id", ondelete="CASCADE"), index=True)
+    class_group_id = Column(Integer, ForeignKey("class_groups.id", ondelete="CASCADE"), index=True)
 
     default_classroom = Column(String, nullable=True)
 
@@ -46,15 +48,15 @@ class TeachingAssignment(Base):
     professor = relationship("Professor", back_populates="assignments")
     class_group = relationship("ClassGroup", back_populates="assignments")
     
-    timetables = relationship("TimeTable", back_populates="assignment", cascade="all, delete-orphan")
-    attendance_sessions = relationship("AttendanceSession", back_populates="assignment", cascade="all, delete-orphan")
+    timetables = relationship("TimeTable", back_populates="assignment", cascade="all, delete-orphan", passive_deletes=True)
+    attendance_sessions = relationship("AttendanceSession", back_populates="assignment", cascade="all, delete-orphan", passive_deletes=True)
 
 class TimeTable(Base):
     __tablename__ = "timetables"
 
     id = Column(Integer, primary_key=True, index=True)
     
-    assignment_id = Column(Integer, ForeignKey("teaching_assignments.id"))
+    assignment_id = Column(Integer, ForeignKey("teaching_assignments.id", ondelete="CASCADE"), index=True)
     assignment = relationship("TeachingAssignment", back_populates="timetables")
     
     day_of_week = Column(Integer) # 0=Monday, 5=Saturday
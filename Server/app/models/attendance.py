@@ -1,17 +1,39 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Float, func, BigInteger
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Date, Boolean, Float, func, BigInteger, Index
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
+
+def _session_date(context):
+    start_time = context.get_current_parameters().get("start_time") or datetime.now(timezone.utc)
+    if start_time.tzinfo is not None:
+        start_time = start_time.astimezone(timezone.utc)
+    return start_time.date()
+
+
+def _utc_now():
+    # Stored through the DateTime type ("YYYY-MM-DD HH:MM:SS.ffffff") rather than as SQLite's
+    # CURRENT_TIMESTAMP text, which lacks the fraction and so sorts apart from bound values
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class AttendanceSession(Base):
     __tablename__ = "attendance_sessions"
+    __table_args__ = (
+        # Live lookups by room (MQTT, beacon) and per-assignment history in start order
+        Index("ix_attendance_sessions_active_room", "is_active", "room_number"),
+        Index("ix_attendance_sessions_assignment_start", "assignment_id", "start_time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
     # Link to the specific teaching assignment (Course + Prof + Class)
-    assignment_id = Column(Integer, ForeignKey("teaching_assignments.id"))
+    assignment_id = Column(Integer, ForeignKey("teaching_assignments.id", ondelete="CASCADE"))
     assignment = relationship("TeachingAssignment", back_populates="attendance_sessions")
     
     start_time = Column(DateTime, default=func.now())
+    session_date = Column(Date, index=True, default=_session_date) # UTC day of start_time; reports filter on it
     end_time = Column(DateTime, nullable=True)
     is_active = Column(Boolean, default=True)
     current_code = Column(String, nullable=True, index=True)
@@ -21,20 +43,69 @@ class AttendanceSession(Base):
     is_verified = Column(Boolean, default=False)
     verification_status = Column(String, nullable=True)
 
+    # Maintained alongside inserts/deletes of records; see app.core.counters for repair
+    attendance_count = Column(Integer, nullable=False, default=0, server_default="0")
 
-    records = relationship("AttendanceRecord", back_populates="session", cascade="all, delete-orphan")
+
+    records = relationship("AttendanceRecord", back_populates="session", cascade="all, delete-orphan", passive_deletes=True)
 
 class AttendanceRecord(Base):
     __tablename__ = "attendance_records"
+    __table_args__ = (
+        # One record per student per session; submissions rely on ON CONFLICT against it
+        Index("uq_attendance_records_session_student", "session_id", "student_id", unique=True),
+        # Keyset pagination of the admin records listing, newest first
+        Index("ix_attendance_records_timestamp_id", "timestamp", "id"),
+        # Ids are never reused after a delete; export data versions rely on it
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
-    session_id = Column(Integer, ForeignKey("attendance_sessions.id"))
+    session_id = Column(Integer, ForeignKey("attendance_sessions.id", ondelete="CASCADE"))
     session = relationship("AttendanceSession", back_populates="records")
     
-    student_id = Column(BigInteger, ForeignKey("students.id")) 
+    student_id = Column(BigInteger, ForeignKey("students.id", ondelete="CASCADE"), index=True)
     student = relationship("Student", back_populates="attendance_records")
     
     status = Column(String) # PRESENT, ABSENT, LATE
-    timestamp = Column(DateTime, default=func.now())
-    rssi_strength = Column(Float, nullable=True)
\ No newline at end of file
+    timestamp = Column(DateTime, default=_utc_now)
+    claimed_at = Column(DateTime, nullable=True) # Phone's time for records from offline receipts; timestamp is when the server got them
+    rssi_strength = Column(Float, nullable=True)
+
+class CodeHistory(Base):
+    """Every beacon code a session broadcast and when; offline receipts are checked against it."""
+    __tablename__ = "code_history"
+    __table_args__ = (
+        Index("ix_code_history_code_valid_from", "code", "valid_from"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("attendance_sessions.id", ondelete="CASCADE"), index=True)
+    code = Column(String, nullable=False)
+    valid_from = Column(DateTime, nullable=False)
+    valid_until = Column(DateTime, nullable=True) # Open until the next rotation (or the session's end_time)
+
+
+class OfflineReceipt(Base):
+    """A signed submission uploaded after the fact, verified later by app.core.receipt_verifier."""
+    __tablename__ = "offline_receipts"
+    __table_args__ = (
+        # Re-uploading the same receipt is a no-op
+        Index("uq_offline_receipts_student_signature", "student_id", "signature", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(BigInteger, ForeignKey("students.id", ondelete="CASCADE"), index=True)
+    code = Column(String, nullable=False)
+    device_uuid = Column(String, nullable=False)
+    claimed_at = Column(DateTime, nullable=False) # When the phone saw the code (UTC)
+    signature = Column(String, nullable=False)
+    rssi_strength = Column(Float, nullable=True)
+    received_at = Column(DateTime, default=func.now())
+
+    status = Column(String, default="PENDING", index=True) # PENDING, ACCEPTED, REJECTED
+    reason = Column(String, nullable=True)
+    # The receipt outlives the session/record it produced, as an audit trail
+    session_id = Column(Integer, ForeignKey("attendance_sessions.id", ondelete="SET NULL"), nullable=True, index=True)
+    record_id = Column(Integer, ForeignKey("attendance_records.id", ondelete="SET NULL"), nullable=True, index=True)
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger, func
+from app.core.database import Base
+
+class PendingPurge(Base):
+    """A soft-deleted row whose physical removal (with everything under it) app.core.purge still owes."""
+    __tablename__ = "pending_purges"
+
+    id = Column(Integer, primary_key=True, index=True)
+    entity = Column(String, nullable=False) # professor, course, student
+    entity_id = Column(BigInteger, nullable=False)
+    requested_at = Column(DateTime, default=func.now())
+    rows_deleted = Column(Integer, nullable=False, default=0) # Progress so far, across all tables
+    last_error = Column(String, nullable=True)
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, BigInteger, Date, ForeignKey, Index
+from app.core.database import Base
+
+class DailyAttendanceRollup(Base):
+    """Per-day, per-class attendance totals kept current by app.core.rollups, so the dashboard never scans records."""
+    __tablename__ = "daily_attendance_rollups"
+
+    day = Column(Date, primary_key=True) # AttendanceSession.session_date (UTC)
+    class_group_id = Column(Integer, ForeignKey("class_groups.id", ondelete="CASCADE"), primary_key=True, index=True)
+    sessions = Column(Integer, nullable=False, default=0)
+    records = Column(Integer, nullable=False, default=0)
+    present = Column(Integer, nullable=False, default=0)
+
+class StudentAttendanceStat(Base):
+    """Sessions held for and attended by each student per teaching assignment, for eligibility; see app.core.attendance_stats."""
+    __tablename__ = "student_attendance_stats"
+    __table_args__ = (
+        # Eligibility lists page through one assignment's students
+        Index("ix_student_attendance_stats_assignment_student", "assignment_id", "student_id"),
+    )
+
+    student_id = Column(BigInteger, ForeignKey("students.id", ondelete="CASCADE"), primary_key=True)
+    assignment_id = Column(Integer, ForeignKey("teaching_assignments.id", ondelete="CASCADE"), primary_key=True)
+    sessions_held = Column(Integer, nullable=False, default=0)
+    sessions_attended = Column(Integer, nullable=False, default=0)
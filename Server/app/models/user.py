@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, BigInteger
+from sqlalchemy import Column, Integer, String, ForeignKey, BigInteger, Index, DateTime
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
@@ -17,9 +17,11 @@ class Professor(Base):
     email = Column(String, unique=True, index=True)
     department = Column(String)
     password_hash = Column(String)
+    row_fingerprint = Column(String, nullable=True) # Hash of the roster row last synced, see app.core.import_jobs
+    deleted_at = Column(DateTime, nullable=True) # Soft-deleted, waiting for app.core.purge; cannot log in
     
     # Relationship to TeachingAssignment
-    assignments = relationship("TeachingAssignment", back_populates="professor", cascade="all, delete-orphan")
+    assignments = relationship("TeachingAssignment", back_populates="professor", cascade="all, delete-orphan", passive_deletes=True)
 
 class Student(Base):
     __tablename__ = "students"
@@ -30,10 +32,31 @@ class Student(Base):
     email = Column(String, unique=True, index=True)
     password_hash = Column(String)
     device_id = Column(String, nullable=True) # UUID (Nullable as requested)
+    receipt_key = Column(String, nullable=True) # Offline receipt signing key issued to the bound device; cleared with it
     department = Column(String)
     year = Column(Integer)
+    row_fingerprint = Column(String, nullable=True) # Hash of the roster row last synced, see app.core.import_jobs
+    deleted_at = Column(DateTime, nullable=True) # Dropped by a roster sync, or soft-deleted for purge; cannot log in
     
-    class_group_id = Column(Integer, ForeignKey("class_groups.id"))
+    class_group_id = Column(Integer, ForeignKey("class_groups.id", ondelete="CASCADE"), index=True)
     class_group = relationship("ClassGroup", back_populates="students")
     
-    attendance_records = relationship("AttendanceRecord", back_populates="student", cascade="all, delete-orphan")
\ No newline at end of file
+    attendance_records = relationship("AttendanceRecord", back_populates="student", cascade="all, delete-orphan", passive_deletes=True)
+
+
+class LoginIdentity(Base):
+    """
+    One row per account: the normalized login identifier (admin username or
+    lower-cased email) with its role, user id and password hash, so login is a
+    single indexed lookup. Kept in sync by app.core.identity.
+    """
+    __tablename__ = "login_identities"
+    __table_args__ = (
+        Index("uq_login_identities_role_user", "role", "user_id", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    identifier = Column(String, nullable=False, index=True) # Not unique: a professor may share a student's email
+    role = Column(String, nullable=False) # admin, professor, student
+    user_id = Column(BigInteger, nullable=False)
+    password_hash = Column(String)
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from typing import Optional, List, Any
-from datetime import datetime
+from datetime import datetime, timezone
 # Import the assignment schema to nest it
 from .academic import TeachingAssignment 
 
@@ -17,9 +17,38 @@ class AttendanceRecordCreate(BaseModel):
     device_uuid: str
     rssi: Optional[float] = None 
     
+class OfflineReceiptCreate(BaseModel):
+    code: str
+    device_uuid: str
+    claimed_at: datetime # When the beacon code was seen; naive values are taken as UTC
+    signature: str # HMAC-SHA256 hex of "code|device_uuid|unix_seconds" with the key from /student/receipt-key
+    rssi: Optional[float] = None
+
+    @field_validator("claimed_at")
+    @classmethod
+    def to_naive_utc(cls, v: datetime) -> datetime:
+        # Stored and compared as naive UTC, like the other DateTime columns
+        if v.tzinfo is not None:
+            v = v.astimezone(timezone.utc).replace(tzinfo=None)
+        return v
+
+class OfflineReceipt(BaseModel):
+    id: int
+    code: str
+    claimed_at: datetime
+    received_at: Optional[datetime] = None
+    status: str
+    reason: Optional[str] = None
+    session_id: Optional[int] = None
+    record_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
 class AttendanceRecord(AttendanceRecordBase):
     id: int
     student_id: int
+    claimed_at: Optional[datetime] = None # Phone's time when the record came from an offline receipt
     student: Optional[Student] = None  # Added student field
     
     class Config:
@@ -71,4 +100,21 @@ class HeadcountVerifyResponse(BaseModel):
     attendance_count: int
     is_match: bool
     difference: int
-    records: List[AttendanceRecord] = []
\ No newline at end of file
+    records: List[AttendanceRecord] = []
+
+# --- Eligibility ---
+class StudentEligibility(BaseModel):
+    student_id: int
+    digital_id: int
+    student_name: str
+    assignment_id: int
+    course_code: str
+    course_name: str
+    class_group_id: int
+    sessions_held: int
+    sessions_attended: int
+    percentage: float
+    eligible: bool
+
+    class Config:
+        from_attributes = True
@@ -9,3 +9,19 @@ class AttendanceSubmit(BaseModel):
 class AttendanceResponse(BaseModel):
     status: str
     message: str
+
+
+class StudentPrincipal(BaseModel):
+    """What the submission path needs to know about the caller, without an ORM row."""
+    id: int
+    digital_id: int
+    name: str
+    email: str
+    department: Optional[str] = None
+    year: Optional[int] = None
+    class_group_id: Optional[int] = None
+    device_id: Optional[str] = None
+    from_claims: bool = False # built from token claims, which may be stale
+
+    class Config:
+        from_attributes = True
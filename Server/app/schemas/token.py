@@ -7,3 +7,12 @@ class Token(BaseModel):
 
 class TokenPayload(BaseModel):
     sub: Optional[str] = None
+    iat: Optional[int] = None
+    # Optional student claims (settings.TOKEN_PRINCIPAL_CLAIMS)
+    cg: Optional[int] = None # class_group_id
+    dev: Optional[str] = None # bound device_id
+    did: Optional[int] = None # digital_id
+    name: Optional[str] = None
+    email: Optional[str] = None
+    dept: Optional[str] = None
+    year: Optional[int] = None
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from typing import Optional
+from datetime import datetime
 
 # Shared properties
 class UserBase(BaseModel):
@@ -64,5 +65,6 @@ class Student(StudentBase):
     id: int
     digital_id: int
     email: EmailStr
+    deleted_at: Optional[datetime] = None # Set when a roster sync removed the student
     class Config:
         from_attributes = True
\ No newline at end of file
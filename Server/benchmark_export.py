@@ -0,0 +1,139 @@
+"""
+Peak Python memory of the attendance export as the number of records grows.
+
+    uv run benchmark_export.py
+    uv run benchmark_export.py --rows 20000 100000 400000 --format ndjson
+
+Seeds a throwaway SQLite database with the requested number of attendance
+records, then exports them twice under tracemalloc: the way the endpoint used
+to (query.all() into one StringIO) and through app.core.exports.stream. The
+streamed peak should stay roughly flat while the buffered one grows with the
+row count.
+"""
+import argparse
+import csv
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+
+def seed(rows: int):
+    from sqlalchemy import delete, insert
+
+    from app import models
+    from app.core import database
+
+    db = database.SessionLocal()
+    try:
+        db.execute(delete(models.AttendanceRecord))
+        if db.query(models.ClassGroup).first() is None:
+            cg = models.ClassGroup(name="BENCH", department="CSE", year=1)
+            course = models.Course(code="BENCH101", name="Benchmark", department="CSE")
+            prof = models.Professor(name="Bench", email="bench@x.com", department="CSE", password_hash="x")
+            db.add_all([cg, course, prof])
+            db.flush()
+            assignment = models.TeachingAssignment(course_id=course.id, professor_id=prof.id, class_group_id=cg.id)
+            db.add(assignment)
+            db.flush()
+            db.execute(insert(models.Student), [
+                dict(id=i, digital_id=i, name=f"Student {i}", email=f"s{i}@x.com", password_hash="x",
+                     class_group_id=cg.id, department="CSE", year=1)
+                for i in range(1, 1001)
+            ])
+            start = datetime.now(timezone.utc) - timedelta(days=400)
+            db.add_all([
+                models.AttendanceSession(assignment_id=assignment.id, start_time=start + timedelta(hours=i), is_active=False)
+                for i in range(1000)
+            ])
+            db.commit()
+        session_ids = [session_id for (session_id,) in db.query(models.AttendanceSession.id)]
+        batch = []
+        for n in range(rows):
+            session_id = session_ids[n // 1000 % len(session_ids)]
+            batch.append(dict(session_id=session_id, student_id=n % 1000 + 1, status="PRESENT",
+                              timestamp=datetime(2026, 1, 1) + timedelta(seconds=n), rssi_strength=-60.0))
+            if len(batch) == 20000:
+                db.execute(insert(models.AttendanceRecord), batch)
+                batch = []
+        if batch:
+            db.execute(insert(models.AttendanceRecord), batch)
+        db.commit()
+    finally:
+        db.close()
+
+
+def buffered_export() -> int:
+    """The export as it used to be: every ORM row loaded, then one CSV string."""
+    from sqlalchemy import desc
+
+    from app import models
+    from app.core import database
+
+    db = database.SessionLocal()
+    try:
+        results = db.query(
+            models.AttendanceRecord, models.Student, models.AttendanceSession, models.ClassGroup
+        ).join(models.Student, models.AttendanceRecord.student_id == models.Student.id)\
+         .join(models.AttendanceSession, models.AttendanceRecord.session_id == models.AttendanceSession.id)\
+         .join(models.TeachingAssignment, models.AttendanceSession.assignment_id == models.TeachingAssignment.id)\
+         .join(models.ClassGroup, models.TeachingAssignment.class_group_id == models.ClassGroup.id)\
+         .order_by(desc(models.AttendanceRecord.timestamp)).all()
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(["Date", "Time", "Student Name", "Student ID", "Class", "Status", "Session ID"])
+        for record, student, session, class_group in results:
+            writer.writerow([
+                record.timestamp.strftime("%Y-%m-%d"), record.timestamp.strftime("%H:%M:%S"),
+                student.name, student.digital_id, class_group.name, record.status, session.id,
+            ])
+        return len(output.getvalue().encode())
+    finally:
+        db.close()
+
+
+def streamed_export(fmt: str, chunk_size: int) -> int:
+    from app.core import database, exports
+
+    size = 0
+    for part in exports.stream(database.SessionLocal(), exports.attendance_query(), fmt, chunk_size):
+        size += len(part)
+    return size
+
+
+def measure(fn, *args) -> tuple[float, float, int]:
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = fn(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024, elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[20000, 100000, 300000])
+    parser.add_argument("--format", choices=["csv", "ndjson", "parquet"], default="csv")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+    os.environ.setdefault("SECRET_KEY", "benchmark-only-secret-key-0123456789")
+    os.environ["PASSWORD_HASH_WORKERS"] = "0"
+    from app.core import database
+    database.init_db()
+
+    print(f"{'rows':>8} {'buffered MiB':>13} {'streamed MiB':>13} {'buffered s':>11} {'streamed s':>11} {'output MiB':>11}")
+    for rows in args.rows:
+        seed(rows)
+        buffered_peak, buffered_s, _ = measure(buffered_export)
+        streamed_peak, streamed_s, size = measure(streamed_export, args.format, args.chunk_size)
+        print(f"{rows:>8} {buffered_peak:>13.1f} {streamed_peak:>13.1f} {buffered_s:>11.2f} {streamed_s:>11.2f} {size / 1024 / 1024:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
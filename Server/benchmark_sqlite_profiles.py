@@ -0,0 +1,158 @@
+"""
+Compares attendance submission throughput under each SQLITE_PROFILE.
+
+    uv run benchmark_sqlite_profiles.py
+    uv run benchmark_sqlite_profiles.py --students 5000 --threads 32 --profiles performance default
+
+Each profile runs in its own process against a fresh database file. Two workloads:
+
+* writer: every student submits once through the attendance write-behind
+  writer (the production path), from `--threads` concurrent submitters.
+* direct: the same submissions each committed in their own transaction from
+  `--threads` threads while `--readers` threads keep querying session counts;
+  this is where rollback journaling and a missing busy timeout show up as
+  "database is locked" errors.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+PROFILES = ["performance", "durable", "default"]
+
+
+def run_profile(args):
+    """Runs both workloads in this process; SQLITE_PROFILE and DATABASE_URL come from the environment."""
+    from sqlalchemy import func, insert
+    from sqlalchemy.exc import OperationalError
+
+    from app import models
+    from app.core import database
+    from app.core.attendance_writer import writer, PendingSubmission
+
+    database.init_db()
+    db = database.SessionLocal()
+    cg = models.ClassGroup(name="BENCH", department="CSE", year=1)
+    course = models.Course(code="BENCH101", name="Benchmark", department="CSE")
+    prof = models.Professor(name="Bench", email="bench@x.com", department="CSE", password_hash="x")
+    db.add_all([cg, course, prof])
+    db.flush()
+    assignment = models.TeachingAssignment(course_id=course.id, professor_id=prof.id, class_group_id=cg.id)
+    db.add(assignment)
+    db.flush()
+    db.execute(insert(models.Student), [
+        dict(id=i, digital_id=i, name=f"S{i}", email=f"s{i}@x.com", password_hash="x",
+             class_group_id=cg.id, department="CSE", year=1)
+        for i in range(1, 2 * args.students + 1)
+    ])
+    sessions = [models.AttendanceSession(assignment_id=assignment.id, room_number="R1") for _ in range(2)]
+    db.add_all(sessions)
+    db.commit()
+    writer_session, direct_session = sessions[0].id, sessions[1].id
+    db.close()
+
+    results = {"profile": os.environ["SQLITE_PROFILE"]}
+
+    # writer: the batched production path
+    writer.start()
+    def submit(student_id):
+        pending = PendingSubmission(
+            session_id=writer_session, student_id=student_id, student_name=f"S{student_id}",
+            digital_id=student_id, room_number="R1", rssi_strength=-60.0,
+            timestamp=datetime.now(timezone.utc), broadcast=False,
+        )
+        writer.submit(pending)
+        pending.future.result(timeout=60)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(submit, range(1, args.students + 1)))
+    elapsed = time.perf_counter() - started
+    writer.stop()
+    results["writer_per_s"] = round(args.students / elapsed)
+
+    # direct: one transaction per submission, with concurrent readers
+    stop = threading.Event()
+    reads = [0]
+    def read_loop():
+        while not stop.is_set():
+            reader = database.SessionLocal()
+            try:
+                reader.query(func.count(models.AttendanceRecord.id)).filter(
+                    models.AttendanceRecord.session_id == direct_session).scalar()
+                reads[0] += 1
+            except OperationalError:
+                pass
+            finally:
+                reader.close()
+    locked = [0]
+    def commit_one(student_id):
+        session = database.SessionLocal()
+        try:
+            session.add(models.AttendanceRecord(
+                session_id=direct_session, student_id=student_id, status="PRESENT", rssi_strength=-60.0))
+            session.commit()
+        except OperationalError:
+            session.rollback()
+            locked[0] += 1
+        finally:
+            session.close()
+    readers = [threading.Thread(target=read_loop) for _ in range(args.readers)]
+    for t in readers:
+        t.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(commit_one, range(args.students + 1, 2 * args.students + 1)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for t in readers:
+        t.join()
+    results["direct_per_s"] = round((args.students - locked[0]) / elapsed)
+    results["direct_locked_errors"] = locked[0]
+    results["reads_per_s"] = round(reads[0] / elapsed)
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", choices=PROFILES, default=PROFILES)
+    parser.add_argument("--students", type=int, default=2000, help="Submissions per workload")
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent submitters")
+    parser.add_argument("--readers", type=int, default=4, help="Concurrent readers during the direct workload")
+    parser.add_argument("--run-profile", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_profile:
+        run_profile(args)
+        return
+
+    rows = []
+    for profile in args.profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                SQLITE_PROFILE=profile,
+                DATABASE_URL=f"sqlite:///{tmp}/bench.db",
+                PASSWORD_HASH_WORKERS="0",
+            )
+            env.setdefault("SECRET_KEY", "benchmark-only-secret-key-0123456789")
+            out = subprocess.run(
+                [sys.executable, __file__, "--run-profile", "--students", str(args.students),
+                 "--threads", str(args.threads), "--readers", str(args.readers)],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            rows.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{'profile':<12} {'writer/s':>9} {'direct/s':>9} {'locked':>7} {'reads/s':>8}")
+    for r in rows:
+        print(f"{r['profile']:<12} {r['writer_per_s']:>9} {r['direct_per_s']:>9} "
+              f"{r['direct_locked_errors']:>7} {r['reads_per_s']:>8}")
+
+
+if __name__ == "__main__":
+    main()
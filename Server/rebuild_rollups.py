@@ -0,0 +1,16 @@
+from app.core.database import SessionLocal, init_db
+from app.core import rollups, attendance_stats
+
+def rebuild():
+    init_db()
+    db = SessionLocal()
+    try:
+        rows = rollups.rebuild(db)
+        print(f"daily_attendance_rollups: {rows} rows rebuilt")
+        rows = attendance_stats.rebuild(db)
+        print(f"student_attendance_stats: {rows} rows rebuilt")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    rebuild()
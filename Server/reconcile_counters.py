@@ -0,0 +1,14 @@
+from app.core.database import SessionLocal, init_db
+from app.core import counters
+
+def reconcile():
+    init_db()
+    db = SessionLocal()
+    try:
+        fixed = counters.reconcile_attendance_counts(db)
+        print(f"attendance_count: {fixed} sessions repaired")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    reconcile()
@@ -1,6 +1,7 @@
 import re
 from datetime import time
 from app.core.database import SessionLocal, init_db
+from app.core import identity
 from app import models
 from app.core.security import get_password_hash
 
@@ -467,6 +468,9 @@ def seed_data():
                 db.add(student)
         db.commit()
 
+    # 6. Refresh the login index (admin password and new accounts above)
+    identity.rebuild(db)
+
     db.close()
     print("--- Seeding Complete ---")
 
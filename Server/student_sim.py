@@ -1,6 +1,32 @@
-import requests
-import uuid
+"""
+AURA student simulator and attendance load generator.
+
+    uv run student_sim.py                      # one student, code typed at the prompt
+    uv run student_sim.py seed --classes 20 --students 60
+    uv run student_sim.py broker                # MQTT broker stand-in, start before the server
+    uv run student_sim.py burst --classes 20 --students 60 --simulate-beacons
+
+`burst` logs in every seeded professor and student concurrently, starts one
+session per class, learns the beacon codes over MQTT (or by polling the
+professor API) and fires each class's submissions as the code appears.
+`broker` (or `burst --embedded-broker` when the server connects later) runs a
+minimal MQTT broker so no Mosquitto is needed, and `--simulate-beacons` plays
+the beacon controller by publishing rotating codes.
+"""
+import argparse
+import asyncio
 import json
+import random
+import statistics
+import string
+import threading
+import time
+import uuid
+from collections import Counter
+
+import httpx
+import paho.mqtt.client as mqtt_client
+import requests
 
 # --- CONFIG ---
 BASE_URL = "http://localhost:8000/api/v1"
@@ -11,6 +37,18 @@ PASSWORD = "student123"
 # In a real app, you generate this once and save it to storage.
 PHONE_DEVICE_ID = "android-device-pixel-7-" + str(uuid.getnode())
 
+# Load test accounts created by `seed`
+LOAD_PASSWORD = "pass"
+LOAD_STUDENT_ID_BASE = 9_000_000_000_000
+LOAD_DIGITAL_ID_BASE = 9_000_000
+LOAD_PROFESSOR_ID_BASE = 900_000
+SERVER_COMMAND_TOPIC = "aura/server/commands"
+ACTIVE_CODE_TOPIC = "aura/classrooms/+/active_code"
+
+
+# ---------------------------------------------------------------------------
+# Single student (interactive)
+# ---------------------------------------------------------------------------
 def login():
     """Authenticates and gets a JWT token."""
     print(f"🔑 Logging in as {USERNAME}...")
@@ -33,12 +71,12 @@ def login():
 def submit_attendance(token, code):
     """Submits the code to the backend."""
     print(f"\n📡 Submitting Code: {code}")
-    
+
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
     }
-    
+
     payload = {
         "code": code,
         "device_uuid": PHONE_DEVICE_ID,
@@ -51,7 +89,7 @@ def submit_attendance(token, code):
             headers=headers,
             json=payload
         )
-        
+
         if response.status_code == 200:
             data = response.json()
             print("\n🎉 SUCCESS! Attendance Marked.")
@@ -69,17 +107,421 @@ def submit_attendance(token, code):
     except Exception as e:
         print(f"Error submitting: {e}")
 
-if __name__ == "__main__":
+def run_interactive():
     print("--- 🎓 AURA Student App Simulator ---")
-    
+
     # 1. Login
     token = login()
-    
+
     if token:
         # 2. Simulate Scanning (User Input)
         # In the real app, this comes from Bluetooth
         code_input = input("\n👀 Enter the Broadcast Code (from Prof Dashboard): ").strip()
-        
+
         if code_input:
             # 3. Submit
-            submit_attendance(token, code_input)
\ No newline at end of file
+            submit_attendance(token, code_input)
+
+
+# ---------------------------------------------------------------------------
+# Seeding
+# ---------------------------------------------------------------------------
+def class_name(index: int) -> str:
+    return f"LOAD {index:03d}"
+
+def room_number(index: int) -> str:
+    return f"LR{index:03d}"
+
+def professor_email(index: int) -> str:
+    return f"loadprof{index:03d}@loadtest.aura.com"
+
+def student_email(class_index: int, student_index: int) -> str:
+    return f"load{class_index:03d}_{student_index:04d}@loadtest.aura.com"
+
+def seed(classes: int, students: int):
+    """Creates `classes` class groups with a professor, course and `students` students each."""
+    from app.core.database import SessionLocal, init_db
+    from app.core.security import get_password_hash
+    from app.core import identity
+    from app import models
+
+    init_db()
+    db = SessionLocal()
+    password_hash = get_password_hash(LOAD_PASSWORD)  # one bcrypt for every account
+    try:
+        for c in range(classes):
+            cg = db.query(models.ClassGroup).filter_by(name=class_name(c)).first()
+            if not cg:
+                cg = models.ClassGroup(name=class_name(c), department="LOAD", year=1)
+                db.add(cg)
+            course = db.query(models.Course).filter_by(code=f"LOAD{c:03d}").first()
+            if not course:
+                course = models.Course(code=f"LOAD{c:03d}", name=f"Load Test {c:03d}", department="LOAD")
+                db.add(course)
+            prof = db.query(models.Professor).filter_by(email=professor_email(c)).first()
+            if not prof:
+                prof = models.Professor(id=LOAD_PROFESSOR_ID_BASE + c, name=f"Load Prof {c:03d}",
+                                        email=professor_email(c), department="LOAD", password_hash=password_hash)
+                db.add(prof)
+            db.flush()
+            if not db.query(models.TeachingAssignment).filter_by(course_id=course.id, professor_id=prof.id, class_group_id=cg.id).first():
+                db.add(models.TeachingAssignment(course_id=course.id, professor_id=prof.id, class_group_id=cg.id,
+                                                 default_classroom=room_number(c)))
+
+            existing = {sid for (sid,) in db.query(models.Student.id).filter(models.Student.class_group_id == cg.id)}
+            for i in range(students):
+                sid = LOAD_STUDENT_ID_BASE + c * 10_000 + i
+                if sid in existing:
+                    continue
+                db.add(models.Student(id=sid, digital_id=LOAD_DIGITAL_ID_BASE + c * 1_000 + i, name=f"Load Student {c:03d}-{i:04d}",
+                                      email=student_email(c, i), password_hash=password_hash, department="LOAD",
+                                      year=1, class_group_id=cg.id))
+            db.commit()
+        identity.rebuild(db)
+        print(f"Seeded {classes} classes x {students} students (password '{LOAD_PASSWORD}')")
+    finally:
+        db.close()
+
+
+# ---------------------------------------------------------------------------
+# Embedded MQTT broker (MQTT 3.1.1, QoS 0/1 in, QoS 0 out)
+# ---------------------------------------------------------------------------
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    filter_parts, topic_parts = topic_filter.split("/"), topic.split("/")
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+def encode_length(length: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        out.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(out)
+
+class MiniBroker:
+    """Just enough of an MQTT broker for the server, the load tool and beacon clients on one machine."""
+
+    def __init__(self):
+        self.subscriptions: dict[asyncio.StreamWriter, set[str]] = {}
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"Embedded MQTT broker listening on {host}:{port}")
+        return server
+
+    async def _read_packet(self, reader: asyncio.StreamReader):
+        header = (await reader.readexactly(1))[0]
+        multiplier, length = 1, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        return header, await reader.readexactly(length)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.subscriptions[writer] = set()
+        try:
+            while True:
+                header, body = await self._read_packet(reader)
+                packet_type = header >> 4
+                if packet_type == 1:  # CONNECT
+                    writer.write(b"\x20\x02\x00\x00")
+                elif packet_type == 3:  # PUBLISH
+                    qos = (header >> 1) & 0x03
+                    topic_len = int.from_bytes(body[:2], "big")
+                    topic = body[2:2 + topic_len].decode()
+                    offset = 2 + topic_len
+                    if qos:
+                        writer.write(b"\x40\x02" + body[offset:offset + 2])
+                        offset += 2
+                    self._route(topic, body[offset:])
+                elif packet_type == 8:  # SUBSCRIBE
+                    packet_id, offset, granted = body[:2], 2, bytearray()
+                    while offset < len(body):
+                        flen = int.from_bytes(body[offset:offset + 2], "big")
+                        self.subscriptions[writer].add(body[offset + 2:offset + 2 + flen].decode())
+                        offset += 2 + flen + 1
+                        granted.append(0)
+                    writer.write(b"\x90" + encode_length(2 + len(granted)) + packet_id + bytes(granted))
+                elif packet_type == 10:  # UNSUBSCRIBE
+                    packet_id, offset = body[:2], 2
+                    while offset < len(body):
+                        flen = int.from_bytes(body[offset:offset + 2], "big")
+                        self.subscriptions[writer].discard(body[offset + 2:offset + 2 + flen].decode())
+                        offset += 2 + flen
+                    writer.write(b"\xb0\x02" + packet_id)
+                elif packet_type == 12:  # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif packet_type == 14:  # DISCONNECT
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.subscriptions.pop(writer, None)
+            writer.close()
+
+    def _route(self, topic: str, payload: bytes):
+        encoded_topic = topic.encode()
+        body = len(encoded_topic).to_bytes(2, "big") + encoded_topic + payload
+        packet = b"\x30" + encode_length(len(body)) + body
+        for subscriber, filters in list(self.subscriptions.items()):
+            if any(topic_matches(f, topic) for f in filters):
+                subscriber.write(packet)
+
+
+# ---------------------------------------------------------------------------
+# Burst load test
+# ---------------------------------------------------------------------------
+class Stats:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {"login": [], "submit": []}
+        self.statuses: dict[str, Counter] = {"login": Counter(), "submit": Counter()}
+
+    def record(self, kind: str, status, latency: float):
+        self.statuses[kind][str(status)] += 1
+        if status == 200:
+            self.latencies[kind].append(latency)
+
+    def report(self, kind: str, wall_seconds: float):
+        lat = sorted(self.latencies[kind])
+        total = sum(self.statuses[kind].values())
+        print(f"\n[{kind}] {total} requests, {len(lat)} ok in {wall_seconds:.2f}s "
+              f"-> {len(lat) / wall_seconds if wall_seconds else 0:.1f} ok/s")
+        if lat:
+            q = statistics.quantiles(lat, n=100) if len(lat) > 1 else [lat[0]] * 99
+            print(f"  latency ms  p50={q[49] * 1000:.1f}  p95={q[94] * 1000:.1f}  p99={q[98] * 1000:.1f}  max={lat[-1] * 1000:.1f}")
+        print("  status codes: " + ", ".join(f"{code}={n}" for code, n in sorted(self.statuses[kind].items())))
+
+class CodeWatcher:
+    """Tracks the latest beacon code per class, fed from MQTT (thread) or API polling."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.codes: dict[str, str] = {}
+        self.events: dict[str, asyncio.Event] = {}
+
+    def event(self, cls: str) -> asyncio.Event:
+        return self.events.setdefault(cls, asyncio.Event())
+
+    def set_code(self, cls: str, code: str):
+        self.codes[cls] = code
+        self.event(cls).set()
+
+    def on_mqtt_message(self, client, userdata, msg):
+        classroom = msg.topic.split("/")[2].replace("AURA_", "")
+        cls = classroom.rsplit("_", 1)[0] if "_" in classroom else classroom
+        self.loop.call_soon_threadsafe(self.set_code, cls, msg.payload.decode())
+
+class BeaconSimulator:
+    """Plays the beacon controller: publishes a rotating code for every started session."""
+
+    def __init__(self, client: mqtt_client.Client, rotate_seconds: float):
+        self.client = client
+        self.rotate_seconds = rotate_seconds
+        self.active: dict[str, float] = {}  # classroom_id -> stop time
+        self._lock = threading.Lock()
+
+    def on_command(self, client, userdata, msg):
+        payload = json.loads(msg.payload)
+        with self._lock:
+            if payload.get("command") == "start_session":
+                self.active[payload["classroom_id"]] = time.time() + payload.get("duration_minutes", 5) * 60
+            elif payload.get("command") == "stop_session":
+                self.active.pop(payload["classroom_id"], None)
+
+    async def run(self):
+        while True:
+            now = time.time()
+            with self._lock:
+                classrooms = [cid for cid, until in self.active.items() if until > now]
+            for cid in classrooms:
+                code = "".join(random.choices(string.ascii_uppercase + string.digits, k=8))
+                self.client.publish(f"aura/classrooms/{cid}/active_code", code)
+            await asyncio.sleep(self.rotate_seconds)
+
+async def timed_login(http: httpx.AsyncClient, sem: asyncio.Semaphore, stats: Stats, username: str):
+    async with sem:
+        started = time.perf_counter()
+        try:
+            resp = await http.post("/login/access-token", data={"username": username, "password": LOAD_PASSWORD})
+            status = resp.status_code
+        except httpx.HTTPError as e:
+            status, resp = type(e).__name__, None
+        stats.record("login", status, time.perf_counter() - started)
+        return resp.json()["access_token"] if status == 200 else None
+
+async def student_submit(http, stats, watcher, cls, token, device, spread, retries):
+    await asyncio.sleep(random.uniform(0, spread))  # students open the app at slightly different times
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": str(uuid.uuid4())}  # same key on retries
+    code, rssi = watcher.codes[cls], random.uniform(-80, -40)
+    for attempt in range(retries + 1):
+        started = time.perf_counter()
+        try:
+            resp = await http.post(
+                "/student/attendance/submit",
+                json={"code": code, "device_uuid": device, "rssi": rssi},
+                headers=headers,
+            )
+            status = resp.status_code
+        except httpx.HTTPError as e:
+            status, resp = type(e).__name__, None
+        stats.record("submit", status, time.perf_counter() - started)
+        if status == 200 or (isinstance(status, int) and status < 500 and status != 429):
+            return
+        retry_after = float(resp.headers.get("Retry-After", 1)) if resp is not None else 1.0
+        await asyncio.sleep(retry_after * random.uniform(0.5, 1.5))
+
+async def poll_codes(http, watcher, sessions, interval):
+    while True:
+        for cls, (session_id, prof_token) in sessions.items():
+            resp = await http.get(f"/professor/attendance/session/{session_id}",
+                                  headers={"Authorization": f"Bearer {prof_token}"})
+            if resp.status_code == 200 and resp.json().get("current_code"):
+                code = resp.json()["current_code"]
+                if watcher.codes.get(cls) != code:
+                    watcher.set_code(cls, code)
+        await asyncio.sleep(interval)
+
+async def burst(args):
+    loop = asyncio.get_running_loop()
+    stats = Stats()
+    watcher = CodeWatcher(loop)
+    background: list[asyncio.Task] = []
+
+    if args.embedded_broker:
+        broker_server = await MiniBroker().serve(args.broker_host, args.broker_port)
+
+    mqtt = None
+    if args.code_source == "mqtt" or args.simulate_beacons:
+        mqtt = mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2)
+        mqtt.message_callback_add(ACTIVE_CODE_TOPIC, watcher.on_mqtt_message)
+        if args.simulate_beacons:
+            beacons = BeaconSimulator(mqtt, args.rotate_seconds)
+            mqtt.message_callback_add(SERVER_COMMAND_TOPIC, beacons.on_command)
+            background.append(asyncio.create_task(beacons.run()))
+        mqtt.on_connect = lambda client, *a: client.subscribe([(ACTIVE_CODE_TOPIC, 0), (SERVER_COMMAND_TOPIC, 0)])
+        mqtt.connect(args.broker_host, args.broker_port)
+        mqtt.loop_start()
+
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as http:
+        # 1. Log everyone in (bcrypt-bound on the server, so bounded separately)
+        sem = asyncio.Semaphore(args.login_concurrency)
+        classes = list(range(args.classes))
+        started = time.perf_counter()
+        prof_tokens = await asyncio.gather(*(timed_login(http, sem, stats, professor_email(c)) for c in classes))
+        student_tokens = await asyncio.gather(*(
+            asyncio.gather(*(timed_login(http, sem, stats, student_email(c, i)) for i in range(args.students)))
+            for c in classes
+        ))
+        stats.report("login", time.perf_counter() - started)
+
+        # 2. Resolve class ids and start one session per class
+        sessions: dict[str, tuple[int, str]] = {}
+        for c, token in zip(classes, prof_tokens):
+            if not token:
+                continue
+            headers = {"Authorization": f"Bearer {token}"}
+            resp = await http.get("/professor/my-courses", headers=headers)
+            if resp.status_code != 200:
+                print(f"Could not list courses for {professor_email(c)}: {resp.status_code}")
+                continue
+            assignment = next((a for a in resp.json() if a["class_group"]["name"] == class_name(c)), None)
+            if not assignment:
+                print(f"No assignment for {class_name(c)}; run `seed` first")
+                continue
+            resp = await http.post("/professor/attendance/start", headers=headers, json={
+                "course_id": assignment["course_id"], "class_group_id": assignment["class_group_id"],
+                "duration_minutes": args.duration, "room_number": room_number(c),
+            })
+            if resp.status_code != 200:
+                print(f"Could not start session for {class_name(c)}: {resp.status_code} {resp.text}")
+                continue
+            sessions[class_name(c)] = (resp.json()["id"], token)
+        print(f"\nStarted {len(sessions)} sessions")
+
+        if args.code_source == "api":
+            background.append(asyncio.create_task(poll_codes(http, watcher, sessions, args.rotate_seconds / 2)))
+
+        # 3. Each class submits as soon as its first code is seen
+        async def class_burst(c: int):
+            cls = class_name(c)
+            try:
+                await asyncio.wait_for(watcher.event(cls).wait(), timeout=args.code_wait)
+            except asyncio.TimeoutError:
+                print(f"No beacon code seen for {cls}")
+                return
+            await asyncio.gather(*(
+                student_submit(http, stats, watcher, cls, token, f"load-device-{c}-{i}", args.spread, args.retries)
+                for i, token in enumerate(student_tokens[c]) if token
+            ))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(class_burst(c) for c in classes if class_name(c) in sessions))
+        stats.report("submit", time.perf_counter() - started)
+
+        for session_id, token in sessions.values():
+            await http.post(f"/professor/attendance/stop/{session_id}", headers={"Authorization": f"Bearer {token}"})
+
+    for task in background:
+        task.cancel()
+    if mqtt:
+        mqtt.loop_stop()
+    if args.embedded_broker:
+        broker_server.close()
+
+async def run_broker(host: str, port: int):
+    server = await MiniBroker().serve(host, port)
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="mode")
+
+    seed_parser = sub.add_parser("seed", help="create load test classes, professors and students")
+    seed_parser.add_argument("--classes", type=int, default=10)
+    seed_parser.add_argument("--students", type=int, default=60)
+
+    broker_parser = sub.add_parser("broker", help="run the embedded MQTT broker until interrupted")
+    broker_parser.add_argument("--host", default="localhost")
+    broker_parser.add_argument("--port", type=int, default=1883)
+
+    b = sub.add_parser("burst", help="run concurrent attendance bursts against a running server")
+    b.add_argument("--base-url", default=BASE_URL)
+    b.add_argument("--classes", type=int, default=10)
+    b.add_argument("--students", type=int, default=60, help="students per class")
+    b.add_argument("--code-source", choices=["mqtt", "api"], default="mqtt")
+    b.add_argument("--broker-host", default="localhost")
+    b.add_argument("--broker-port", type=int, default=1883)
+    b.add_argument("--embedded-broker", action="store_true", help="run a local MQTT broker stand-in")
+    b.add_argument("--simulate-beacons", action="store_true", help="publish rotating codes for started sessions")
+    b.add_argument("--rotate-seconds", type=float, default=30.0)
+    b.add_argument("--duration", type=int, default=5, help="session length in minutes")
+    b.add_argument("--spread", type=float, default=5.0, help="seconds over which a class's submissions arrive")
+    b.add_argument("--retries", type=int, default=2, help="retries after 5xx/429/network errors")
+    b.add_argument("--connections", type=int, default=500)
+    b.add_argument("--login-concurrency", type=int, default=8)
+    b.add_argument("--timeout", type=float, default=30.0)
+    b.add_argument("--code-wait", type=float, default=60.0, help="seconds to wait for a session's first code")
+
+    args = parser.parse_args()
+    if args.mode == "seed":
+        seed(args.classes, args.students)
+    elif args.mode == "broker":
+        asyncio.run(run_broker(args.host, args.port))
+    elif args.mode == "burst":
+        asyncio.run(burst(args))
+    else:
+        run_interactive()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Pages through /admin/attendance/records with the X-Next-Cursor header on a
+throwaway database and checks every record comes back exactly once, in order.
+
+Half the records are written the way older versions stored them (SQLite's
+CURRENT_TIMESTAMP text, no fraction) and then upgraded by the migrations; all
+of them share one second, so the (timestamp, id) cursor has to break the ties.
+
+Usage: python verify_records_pagination.py
+"""
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/verify_pagination.db"
+os.environ.setdefault("SECRET_KEY", "verify-records-pagination")
+os.environ["ANALYTICS_SNAPSHOT_INTERVAL_SECONDS"] = "0"  # report from the live database
+
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app import models
+from app.api import deps
+from app.core import database, migrations
+from app.core.database import SessionLocal, engine, init_db
+from app.main import app
+
+LEGACY_ROWS = 7  # stored as "YYYY-MM-DD HH:MM:SS"
+CURRENT_ROWS = 6  # stored through the DateTime type
+PAGE_SIZE = 4
+SECOND = datetime(2026, 3, 2, 9, 0, 0)
+
+
+def seed():
+    db = SessionLocal()
+    session = models.AttendanceSession(start_time=SECOND, room_number="R1", is_active=False)
+    db.add(session)
+    students = [
+        models.Student(id=9000000000000 + i, digital_id=i, name=f"Student {i}", email=f"s{i}@example.edu")
+        for i in range(LEGACY_ROWS + CURRENT_ROWS)
+    ]
+    db.add_all(students)
+    db.flush()
+    for student in students[LEGACY_ROWS:]:
+        db.add(models.AttendanceRecord(session_id=session.id, student_id=student.id, status="PRESENT", timestamp=SECOND))
+    db.commit()
+    with engine.begin() as conn:
+        for student in students[:LEGACY_ROWS]:
+            conn.execute(text(
+                "INSERT INTO attendance_records (session_id, student_id, status, timestamp) "
+                "VALUES (:session_id, :student_id, 'PRESENT', :timestamp)"
+            ), {"session_id": session.id, "student_id": student.id, "timestamp": SECOND.strftime("%Y-%m-%d %H:%M:%S")})
+    db.close()
+
+
+def verify_pagination():
+    init_db()
+    seed()
+    # Replay the timestamp migration over the legacy rows, as an upgrade would
+    database.write_schema_info("migration_version", "10")
+    print("Migrations applied:", migrations.upgrade())
+
+    app.dependency_overrides[deps.get_current_active_admin] = lambda: SessionLocal().query(models.Admin).first()
+    client = TestClient(app)
+
+    db = SessionLocal()
+    expected = [r.id for r in db.query(models.AttendanceRecord.id).order_by(
+        models.AttendanceRecord.timestamp.desc(), models.AttendanceRecord.id.desc())]
+    db.close()
+
+    seen, cursor, pages = [], None, 0
+    while pages <= len(expected):  # more pages than records means the cursor is not advancing
+        params = {"limit": PAGE_SIZE} | ({"cursor": cursor} if cursor else {})
+        response = client.get("/api/v1/admin/attendance/records", params=params)
+        if response.status_code != 200:
+            print("Error:", response.status_code, response.text)
+            return False
+        pages += 1
+        seen.extend(r["id"] for r in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    print(f"Pages: {pages}, records seen: {len(seen)}, expected: {len(expected)}")
+    repeats = len(seen) - len(set(seen))
+    missing = set(expected) - set(seen)
+    print("Repeats:", repeats, "Missing:", sorted(missing))
+    ok = seen == expected
+    print("PASS" if ok else "FAIL")
+    return ok
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if verify_pagination() else 1)